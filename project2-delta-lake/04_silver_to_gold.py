@@ -87,24 +87,22 @@ rawToBronzeWriter.start(bronzePath)
 
 bronzeDF = read_stream_delta(spark, bronzePath)
 transformedBronzeDF = transform_bronze(bronzeDF)
-bronzeToSilverWriter = create_stream_writer(
+bronzeToSilverWriter = create_repairing_stream_writer(
     dataframe=transformedBronzeDF,
     checkpoint=silverCheckpoint,
     name="write_bronze_to_silver",
+    deltaPath=silverPath,
+    statePath=repairStatePath,
     partition_column="p_eventdate",
 )
-bronzeToSilverWriter.start(silverPath)
+bronzeToSilverWriter.start()
 
 # COMMAND ----------
 
 # MAGIC %md
-# MAGIC ## Update the Silver Table
+# MAGIC ## Repair Broken Readings in the Stream
 # MAGIC 
-# MAGIC We periodically run the `update_silver_table` function to update the table and address the known issue of negative readings being ingested.
-
-# COMMAND ----------
-
-update_silver_table(spark, silverPath)
+# MAGIC The Bronze to Silver stream now uses `create_repairing_stream_writer`, which interpolates negative readings in each micro-batch against the last good reading of each device before appending. The Silver table never contains broken readings, so we no longer run `update_silver_table` over the full table.
 
 # COMMAND ----------
 
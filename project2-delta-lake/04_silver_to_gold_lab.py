@@ -70,6 +70,7 @@ bronzeToSilverWriter = create_stream_writer(
     checkpoint=silverCheckpoint,
     name="write_bronze_to_silver",
     partition_column="p_eventdate",
+    deltaPath=silverPath,
 )
 bronzeToSilverWriter.start(silverPath)
 
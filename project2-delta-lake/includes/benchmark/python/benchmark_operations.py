@@ -0,0 +1,236 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Benchmarks for Operations
+
+# COMMAND ----------
+
+import tempfile
+import time
+
+from delta import configure_spark_with_delta_pip
+from pyspark import sql
+from pyspark.sql import DataFrame
+from pyspark.sql.session import SparkSession
+
+# COMMAND ----------
+
+"""
+For local benchmarking it is necessary to instantiate the Spark Session in order to have
+Delta Libraries installed prior to import in the next cell
+"""
+
+spark = configure_spark_with_delta_pip(
+    sql.SparkSession.builder.master("local[8]")
+    .config("spark.sql.extensions", "io.delta.sql.DeltaSparkSessionExtension")
+    .config(
+        "spark.sql.catalog.spark_catalog",
+        "org.apache.spark.sql.delta.catalog.DeltaCatalog",
+    )
+).getOrCreate()
+
+# COMMAND ----------
+
+from main.python.device_index import read_silver_device, refresh_device_index
+from main.python.generators import generate_silver_data, write_raw_json
+from main.python.operations import (
+    STREAM_PROFILES,
+    apply_stream_profile,
+    create_stream_writer,
+    read_stream_raw,
+    transform_bronze,
+    transform_json,
+    transform_raw,
+    update_silver_table,
+    update_silver_table_partitioned,
+)
+
+# COMMAND ----------
+
+SILVER_ROW_COUNTS = [1_000_000, 10_000_000, 100_000_000]
+PARSE_ROW_COUNTS = [1_000_000, 10_000_000]
+PROFILE_ROW_COUNT = 10_000_000
+PROFILE_RAW_FILES = 200
+LOOKUP_ROW_COUNT = 10_000_000
+LOOKUP_DEVICES = 1000
+LOOKUP_FILES_PER_DAY = 8
+
+# COMMAND ----------
+
+def write_silver_table(spark: SparkSession, silverDF: DataFrame, silverPath: str):
+    (
+        silverDF.write.format("delta")
+        .mode("overwrite")
+        .partitionBy("p_eventdate")
+        .save(silverPath)
+    )
+    spark.sql("DROP TABLE IF EXISTS health_tracker_plus_silver")
+    spark.sql(
+        f"""
+    CREATE TABLE health_tracker_plus_silver
+    USING DELTA
+    LOCATION "{silverPath}"
+    """
+    )
+
+
+def time_call(function, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+# COMMAND ----------
+
+def benchmark_update_silver_table(spark: SparkSession, row_counts=SILVER_ROW_COUNTS):
+    results = []
+    for rows in row_counts:
+        silverPath = tempfile.mkdtemp(prefix="silver_") + "/silver/"
+        silverDF = generate_silver_data(spark, rows)
+        for name, update in [
+            ("update_silver_table", update_silver_table),
+            ("update_silver_table_partitioned", update_silver_table_partitioned),
+        ]:
+            # Both variants repair the table in place, so each starts from a fresh copy.
+            write_silver_table(spark, silverDF, silverPath)
+            seconds = time_call(update, spark, silverPath)
+            results.append({"function": name, "rows": rows, "seconds": seconds})
+            print(f"{name:<35} {rows:>12,} rows {seconds:>10.2f} s")
+    return results
+
+
+# COMMAND ----------
+
+def benchmark_parse_paths(spark: SparkSession, row_counts=PARSE_ROW_COUNTS):
+    parse_paths = [
+        (
+            "read_text + transform_raw + transform_bronze",
+            lambda rawPath: transform_bronze(
+                transform_raw(
+                    spark.read.format("text").schema("value STRING").load(rawPath)
+                )
+            ),
+        ),
+        (
+            "read_json + transform_json",
+            lambda rawPath: transform_json(
+                spark.read.format("json")
+                .schema("device_id INTEGER, heartrate DOUBLE, name STRING, time FLOAT")
+                .load(rawPath)
+            ),
+        ),
+    ]
+    results = []
+    for rows in row_counts:
+        rawPath = tempfile.mkdtemp(prefix="raw_") + "/raw/"
+        write_raw_json(spark, rows, rawPath)
+        for name, parse in parse_paths:
+            # The noop sink materialises every column without paying for a write.
+            seconds = time_call(
+                lambda: parse(rawPath).write.format("noop").mode("overwrite").save()
+            )
+            results.append(
+                {
+                    "function": name,
+                    "rows": rows,
+                    "seconds": seconds,
+                    "rows_per_second": rows / seconds,
+                }
+            )
+            print(f"{name:<45} {rows:>12,} rows {rows / seconds:>14,.0f} rows/s")
+    return results
+
+
+# COMMAND ----------
+
+def benchmark_stream_profiles(
+    spark: SparkSession, rows: int = PROFILE_ROW_COUNT, files: int = PROFILE_RAW_FILES
+):
+    rawPath = tempfile.mkdtemp(prefix="raw_") + "/raw/"
+    write_raw_json(spark, rows, rawPath, files=files)
+    # low_latency admits one file per batch, so keep every batch's progress.
+    spark.conf.set("spark.sql.streaming.numRecentProgressUpdates", files * 2)
+
+    results = []
+    for profile in STREAM_PROFILES:
+        outputPath = tempfile.mkdtemp(prefix=f"bronze_{profile}_")
+        with apply_stream_profile(spark, profile):
+            query = create_stream_writer(
+                dataframe=transform_raw(
+                    read_stream_raw(spark, rawPath, profile=profile)
+                ),
+                checkpoint=outputPath + "/checkpoint/",
+                name=f"benchmark_{profile}",
+                partition_column="p_ingestdate",
+                profile=profile,
+            ).start(outputPath + "/bronze/")
+        start = time.perf_counter()
+        query.processAllAvailable()
+        seconds = time.perf_counter() - start
+        query.stop()
+
+        # Batches that found no new data do not say anything about latency.
+        batch_ms = [
+            progress["durationMs"]["triggerExecution"]
+            for progress in query.recentProgress
+            if progress["numInputRows"] > 0
+        ]
+        result = {
+            "profile": profile,
+            "rows": rows,
+            "seconds": seconds,
+            "rows_per_second": rows / seconds,
+            "batches": len(batch_ms),
+            "mean_batch_ms": sum(batch_ms) / len(batch_ms) if batch_ms else 0.0,
+            "max_batch_ms": max(batch_ms) if batch_ms else 0.0,
+        }
+        results.append(result)
+        print(
+            "{profile:<15} {rows_per_second:>14,.0f} rows/s {batches:>6} batches "
+            "{mean_batch_ms:>10,.0f} ms/batch".format(**result)
+        )
+    return results
+
+
+# COMMAND ----------
+
+def benchmark_device_lookup(
+    spark: SparkSession,
+    rows: int = LOOKUP_ROW_COUNT,
+    devices: int = LOOKUP_DEVICES,
+    files_per_day: int = LOOKUP_FILES_PER_DAY,
+    device_id: int = 0,
+):
+    tempPath = tempfile.mkdtemp(prefix="silver_")
+    silverPath = tempPath + "/silver/"
+    indexPath = tempPath + "/silver_device_index/"
+    # Writing each day sorted by device_id gives files that hold a narrow
+    # device range, as OPTIMIZE ZORDER BY (device_id) would.
+    days = rows // devices // 24 + 1
+    (
+        generate_silver_data(spark, rows, devices)
+        .repartitionByRange(days * files_per_day, "p_eventdate", "device_id")
+        .write.format("delta")
+        .partitionBy("p_eventdate")
+        .save(silverPath)
+    )
+    index_seconds = time_call(refresh_device_index, spark, silverPath, indexPath)
+    print(f"{'refresh_device_index':<25} {rows:>12,} rows {index_seconds:>10.2f} s")
+
+    results = []
+    for name, indexed in [("full scan", None), ("device index", indexPath)]:
+        seconds = time_call(
+            lambda: read_silver_device(spark, silverPath, device_id, indexed).count()
+        )
+        results.append({"lookup": name, "rows": rows, "seconds": seconds})
+        print(f"{name:<25} {rows:>12,} rows {seconds:>10.2f} s")
+    return results
+
+
+# COMMAND ----------
+
+if __name__ == "__main__":
+    benchmark_update_silver_table(spark)
+    benchmark_parse_paths(spark)
+    benchmark_stream_profiles(spark)
+    benchmark_device_lookup(spark)
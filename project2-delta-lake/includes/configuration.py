@@ -16,11 +16,16 @@ rawPath = plusPipelinePath + "raw/"
 bronzePath = plusPipelinePath + "bronze/"
 silverPath = plusPipelinePath + "silver/"
 goldPath = plusPipelinePath + "gold/"
+repairStatePath = plusPipelinePath + "repair_state/"
+metricsPath = plusPipelinePath + "metrics/"
+silverDeviceIndexPath = plusPipelinePath + "silver_device_index/"
+quarantinePath = plusPipelinePath + "quarantine/"
 
 checkpointPath = plusPipelinePath + "checkpoints/"
 bronzeCheckpoint = checkpointPath + "bronze/"
 silverCheckpoint = checkpointPath + "silver/"
 goldCheckpoint = checkpointPath + "gold/"
+repairCheckpoint = checkpointPath + "repair/"
 
 # COMMAND ----------
 
@@ -0,0 +1,211 @@
+# Databricks notebook source
+
+import json
+import time
+
+from delta.tables import DeltaTable
+from pyspark.sql.session import SparkSession
+
+from main.python.storage import child, file_system
+
+# COMMAND ----------
+
+STATE_FILE_SUFFIXES = (".delta", ".snapshot", ".changelog", ".zip")
+# Newer Delta sources mark a fully processed table version with this index.
+DELTA_END_INDEX = 2**63 - 1
+
+# A streaming checkpoint holds offsets/<batch> once a batch is planned,
+# commits/<batch> once its output is committed, and state/<operator>/<partition>/
+# <batch + 1>.delta for stateful queries. Everything below only lists and
+# reads those files through the Hadoop file system API, so it works for dbfs:/
+# and local paths and never touches a running query.
+
+def inspect_checkpoint(
+    spark: SparkSession, checkpoint: str, sourcePath: str = None
+) -> dict:
+    fs, root = file_system(spark, checkpoint)
+    offsets = _batch_ids(fs, child(spark, root, "offsets"))
+    commits = _batch_ids(fs, child(spark, root, "commits"))
+    state_versions, state_files, state_bytes = _state_files(
+        fs, child(spark, root, "state")
+    )
+
+    last_offset = offsets[-1] if offsets else None
+    last_commit = commits[-1] if commits else None
+    committed = -1 if last_commit is None else last_commit
+    # Only the batch after the last commit may legitimately be in flight. Any
+    # offsets or state versions beyond it, or commits without offsets, are
+    # leftovers of a query that died or of a checkpoint copied by hand.
+    orphaned = sorted(
+        set(batch for batch in offsets if batch > committed + 1)
+        | set(batch for batch in commits if batch not in offsets)
+        | set(version - 1 for version in state_versions if version > committed + 2)
+    )
+
+    report = {
+        "checkpoint": checkpoint,
+        "query_id": _query_id(spark, fs, root),
+        "last_offset_batch": last_offset,
+        "last_commit_batch": last_commit,
+        "uncommitted_batches": 0 if last_offset is None else last_offset - committed,
+        "orphaned_batches": orphaned,
+        "state_files": state_files,
+        "state_bytes": state_bytes,
+        "seconds_since_commit": None,
+        "source_offsets": [],
+        "source_version_lag": None,
+    }
+    if last_commit is not None:
+        commitPath = child(spark, root, "commits", str(last_commit))
+        modified = fs.getFileStatus(commitPath).getModificationTime() / 1000
+        report["seconds_since_commit"] = time.time() - modified
+        report["source_offsets"] = committed_source_offsets(spark, checkpoint)
+
+    if sourcePath is not None and report["source_offsets"]:
+        source_version = report["source_offsets"][0].get("reservoirVersion")
+        if source_version is not None:
+            latest_version = (
+                DeltaTable.forPath(spark, sourcePath)
+                .history(1)
+                .select("version")
+                .first()[0]
+            )
+            report["source_version_lag"] = latest_version - source_version
+    return report
+
+
+def inspect_pipeline_checkpoints(
+    spark: SparkSession, checkpoints: dict, sources: dict = None
+) -> list:
+    sources = sources or {}
+    reports = []
+    for name, checkpoint in checkpoints.items():
+        fs, root = file_system(spark, checkpoint)
+        if not fs.exists(root):
+            print(f"{name}: no checkpoint at {checkpoint}")
+            continue
+        report = dict(
+            inspect_checkpoint(spark, checkpoint, sources.get(name)), name=name
+        )
+        reports.append(report)
+        print(
+            "{name}: offset batch {last_offset_batch}, commit batch "
+            "{last_commit_batch}, {uncommitted_batches} uncommitted, "
+            "{orphaned_count} orphaned, state {state_bytes:,} bytes in "
+            "{state_files} files, source lag {source_version_lag} versions".format(
+                orphaned_count=len(report["orphaned_batches"]), **report
+            )
+        )
+    return reports
+
+
+def committed_source_offsets(spark: SparkSession, checkpoint: str) -> list:
+    fs, root = file_system(spark, checkpoint)
+    commits = _batch_ids(fs, child(spark, root, "commits"))
+    if not commits:
+        return []
+    # offsets/<batch> is "v1", the batch metadata, then one line per source,
+    # "-" for a source that had no offset yet.
+    lines = _read_lines(spark, fs, child(spark, root, "offsets", str(commits[-1])))
+    return [None if line == "-" else json.loads(line) for line in lines[2:]]
+
+
+def resume_version(spark: SparkSession, checkpoint: str, source: int = 0) -> int:
+    offsets = committed_source_offsets(spark, checkpoint)
+    if len(offsets) <= source or offsets[source] is None:
+        return None
+    offset = offsets[source]
+    if offset.get("index") == DELTA_END_INDEX:
+        return offset["reservoirVersion"] + 1
+    # Part of the initial snapshot cannot be expressed as a startingVersion,
+    # so the caller falls back to a full read.
+    if offset.get("isStartingVersion", False):
+        return None
+    # The offset points part way into reservoirVersion, so restarting there
+    # may replay some of its rows. Pair it with an idempotent sink such as
+    # create_dedup_merge_writer.
+    return offset["reservoirVersion"]
+
+
+def retire_checkpoint(spark: SparkSession, checkpoint: str) -> str:
+    # startingVersion and startingTimestamp only apply to a new checkpoint, so
+    # the old one is moved aside rather than deleted, keeping it for inspection.
+    fs, root = file_system(spark, checkpoint)
+    if not fs.exists(root):
+        return None
+    backup = checkpoint.rstrip("/") + f"_retired_{int(time.time())}"
+    fs.rename(root, file_system(spark, backup)[1])
+    return backup
+
+
+def prepare_recovery(
+    spark: SparkSession,
+    checkpoint: str,
+    starting_version: int = None,
+    starting_timestamp: str = None,
+) -> dict:
+    # Without an explicit starting point the query resumes where its last
+    # committed batch left off, instead of replaying the whole source.
+    if starting_version is None and starting_timestamp is None:
+        starting_version = resume_version(spark, checkpoint)
+    retired = retire_checkpoint(spark, checkpoint)
+    print(f"Retired {checkpoint} to {retired}")
+    return {
+        "starting_version": starting_version,
+        "starting_timestamp": starting_timestamp,
+    }
+
+
+# COMMAND ----------
+
+def _batch_ids(fs, directory) -> list:
+    if not fs.exists(directory):
+        return []
+    return sorted(
+        int(status.getPath().getName())
+        for status in fs.listStatus(directory)
+        if status.getPath().getName().isdigit()
+    )
+
+
+def _state_files(fs, directory) -> tuple:
+    versions, files, size = set(), 0, 0
+    if not fs.exists(directory):
+        return versions, files, size
+    iterator = fs.listFiles(directory, True)
+    while iterator.hasNext():
+        status = iterator.next()
+        name = status.getPath().getName()
+        if name.endswith(".crc"):
+            continue
+        files += 1
+        size += status.getLen()
+        stem = name.split(".")[0]
+        # HDFS state stores write .delta and .snapshot files, RocksDB ones
+        # .changelog and .zip files, all named after the state version.
+        if stem.isdigit() and name.endswith(STATE_FILE_SUFFIXES):
+            versions.add(int(stem))
+    return versions, files, size
+
+
+def _query_id(spark: SparkSession, fs, root) -> str:
+    metadataPath = child(spark, root, "metadata")
+    if not fs.exists(metadataPath):
+        return None
+    return json.loads(_read_lines(spark, fs, metadataPath)[0])["id"]
+
+
+def _read_lines(spark: SparkSession, fs, path) -> list:
+    jvm = spark._jvm
+    reader = jvm.java.io.BufferedReader(
+        jvm.java.io.InputStreamReader(fs.open(path), "UTF-8")
+    )
+    lines = []
+    try:
+        line = reader.readLine()
+        while line is not None:
+            lines.append(line)
+            line = reader.readLine()
+    finally:
+        reader.close()
+    return lines
@@ -0,0 +1,117 @@
+# Databricks notebook source
+
+import re
+from urllib.parse import unquote
+
+from delta.tables import DeltaTable
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import col, input_file_name
+from pyspark.sql.session import SparkSession
+
+from main.python.storage import read_files
+
+# COMMAND ----------
+
+# The index is a small Delta table with one row per (file, device_id) pair in
+# silver. With a few hundred devices this stays far smaller than silver itself
+# and, unlike a Bloom filter, never returns a file that does not hold the device.
+
+def refresh_device_index(
+    spark: SparkSession, silverPath: str, indexPath: str, key_column: str = "device_id"
+) -> dict:
+    active = _active_files(spark, silverPath)
+    if DeltaTable.isDeltaTable(spark, indexPath):
+        indexed = {
+            _normalize_path(row.file): row.file
+            for row in spark.read.format("delta")
+            .load(indexPath)
+            .select("file")
+            .distinct()
+            .collect()
+        }
+    else:
+        indexed = {}
+
+    # Silver files are immutable, so only files added since the last refresh
+    # are read, and entries of files removed by a MERGE or OPTIMIZE are dropped.
+    added = sorted(active[file] for file in active.keys() - indexed.keys())
+    removed = sorted(indexed[file] for file in indexed.keys() - active.keys())
+    if removed:
+        DeltaTable.forPath(spark, indexPath).delete(col("file").isin(removed))
+    if added:
+        (
+            read_files(spark, silverPath, added)
+            .select(
+                input_file_name().alias("file"),
+                col(key_column).alias("device_id"),
+                "p_eventdate",
+            )
+            .distinct()
+            .write.format("delta")
+            .mode("append")
+            .save(indexPath)
+        )
+    return {"added_files": len(added), "removed_files": len(removed)}
+
+
+def read_silver_device(
+    spark: SparkSession,
+    silverPath: str,
+    device_id: int,
+    indexPath: str = None,
+    key_column: str = "device_id",
+) -> DataFrame:
+    silverTable = DeltaTable.forPath(spark, silverPath)
+    if (
+        indexPath is None
+        or not DeltaTable.isDeltaTable(spark, indexPath)
+        or not _direct_read_supported(silverTable)
+    ):
+        return silverTable.toDF().where(col(key_column) == device_id)
+
+    active = _active_files(spark, silverPath)
+    indexDF = spark.read.format("delta").load(indexPath)
+    candidates = {
+        _normalize_path(row.file)
+        for row in indexDF.where(col("device_id") == device_id)
+        .select("file")
+        .distinct()
+        .collect()
+    }
+    indexed = {
+        _normalize_path(row.file)
+        for row in indexDF.select("file").distinct().collect()
+    }
+    # Files written after the last refresh are not in the index yet and could
+    # hold the device, so they are always scanned.
+    unindexed = active.keys() - indexed
+    files = sorted(active[file] for file in (candidates & active.keys()) | unindexed)
+    if not files:
+        return silverTable.toDF().limit(0)
+    return read_files(spark, silverPath, files).where(col(key_column) == device_id)
+
+
+# COMMAND ----------
+
+def _active_files(spark: SparkSession, deltaPath: str) -> dict:
+    # inputFiles() lists the files of the current snapshot from the log only.
+    return {
+        _normalize_path(file): file
+        for file in spark.read.format("delta").load(deltaPath).inputFiles()
+    }
+
+
+def _normalize_path(path: str) -> str:
+    # input_file_name() and inputFiles() may differ in URL encoding and in
+    # the number of slashes after the scheme.
+    return re.sub(r"^(\w+):/+", r"\1:/", unquote(path))
+
+
+def _direct_read_supported(deltaTable: DeltaTable) -> bool:
+    # Deletion vectors and column mapping change how parquet files map to
+    # rows, so such tables are always read through Delta.
+    properties = deltaTable.detail().select("properties").first()[0] or {}
+    return (
+        properties.get("delta.enableDeletionVectors", "false") != "true"
+        and properties.get("delta.columnMapping.mode", "none") == "none"
+    )
@@ -0,0 +1,174 @@
+# Databricks notebook source
+
+import json
+import os
+import random
+import time
+
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import (
+    array,
+    col,
+    concat,
+    element_at,
+    floor,
+    lit,
+    rand,
+    struct,
+    to_json,
+    when,
+)
+from pyspark.sql.session import SparkSession
+
+# COMMAND ----------
+
+SILVER_START_TIME = 1577836800  # 2020-01-01 00:00:00 UTC
+DEVICE_TYPES = ["accelerometer", "gyroscope", "pressure", "barometer", "magnetometer"]
+FIRST_NAMES = ["Deborah", "Anthony", "Maria", "James", "Linda", "Kevin", "Sara", "Omar"]
+LAST_NAMES = ["Powell", "Perez", "Nguyen", "Smith", "Garcia", "Okafor", "Kim", "Rossi"]
+
+# COMMAND ----------
+
+def generate_silver_data(
+    spark: SparkSession,
+    rows: int,
+    devices: int = 100,
+    negative_rate: float = 0.001,
+    start_time: int = SILVER_START_TIME,
+    seed: int = 7,
+) -> DataFrame:
+    # One reading per device per hour, so the data spans rows / devices hours.
+    return (
+        spark.range(rows)
+        .select(
+            (col("id") % devices).cast("integer").alias("device_id"),
+            when(rand(seed=seed) < negative_rate, -(rand(seed=seed + 1) * 60 + 40))
+            .otherwise(rand(seed=seed + 2) * 60 + 40)
+            .alias("heartrate"),
+            (lit(start_time) + floor(col("id") / devices) * 3600)
+            .cast("timestamp")
+            .alias("eventtime"),
+            concat(lit("device_"), (col("id") % devices).cast("string")).alias("name"),
+        )
+        .withColumn("p_eventdate", col("eventtime").cast("date"))
+    )
+
+
+def generate_raw_data(
+    spark: SparkSession,
+    rows: int,
+    devices: int = 100,
+    negative_rate: float = 0.001,
+    with_device_type: bool = False,
+    start_time: int = SILVER_START_TIME,
+    seed: int = 7,
+) -> DataFrame:
+    fields = [
+        "device_id",
+        "heartrate",
+        "name",
+        col("eventtime").cast("long").cast("float").alias("time"),
+    ]
+    if with_device_type:
+        device_type = element_at(
+            array(*[lit(device_type) for device_type in DEVICE_TYPES]),
+            (col("device_id") % len(DEVICE_TYPES) + 1).cast("integer"),
+        )
+        fields.insert(2, device_type.alias("device_type"))
+    return generate_silver_data(
+        spark, rows, devices, negative_rate, start_time, seed
+    ).select(to_json(struct(*fields)).alias("value"))
+
+
+def write_raw_json(
+    spark: SparkSession,
+    rows: int,
+    rawPath: str,
+    devices: int = 100,
+    files: int = None,
+    **options,
+) -> str:
+    rawDF = generate_raw_data(spark, rows, devices, **options)
+    if files is not None:
+        rawDF = rawDF.repartition(files)
+    rawDF.write.mode("overwrite").text(rawPath)
+    return rawPath
+
+
+# COMMAND ----------
+
+def stream_raw_files(
+    rawPath: str,
+    events_per_second: int = 1000,
+    seconds: float = 60,
+    devices: int = 100,
+    negative_rate: float = 0.001,
+    late_fraction: float = 0.0,
+    max_late_hours: float = 72,
+    device_type_fraction: float = 0.0,
+    file_interval: float = 1.0,
+    start_time: float = None,
+    fs_root: str = "/dbfs",
+    seed: int = None,
+) -> dict:
+    # Files land through the DBFS FUSE mount at fs_root, like retrieve_data_bulk;
+    # pass fs_root="" to write to a local directory instead.
+    rng = random.Random(seed)
+    baselines = [rng.uniform(55, 85) for _ in range(devices)]
+    names = [
+        f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(devices)
+    ]
+    event_time = time.time() if start_time is None else start_time
+    events_per_file = max(1, int(events_per_second * file_interval))
+
+    stats = {"files": 0, "events": 0, "late_events": 0, "negative_events": 0}
+    started = time.monotonic()
+    next_tick = started
+    while time.monotonic() - started < seconds:
+        on_time, late = [], []
+        for event in range(events_per_file):
+            device_id = rng.randrange(devices)
+            heartrate = rng.gauss(baselines[device_id], 3)
+            if rng.random() < negative_rate:
+                heartrate = -heartrate
+                stats["negative_events"] += 1
+            reading = {
+                "device_id": device_id,
+                "heartrate": heartrate,
+                "name": names[device_id],
+                "time": event_time + event * file_interval / events_per_file,
+            }
+            if rng.random() < device_type_fraction:
+                reading["device_type"] = DEVICE_TYPES[device_id % len(DEVICE_TYPES)]
+            if rng.random() < late_fraction:
+                reading["time"] -= rng.uniform(1, max_late_hours) * 3600
+                late.append(reading)
+            else:
+                on_time.append(reading)
+
+        file = f"health_tracker_synthetic_{int(event_time * 1000)}.json"
+        for directory, readings in [("", on_time), ("late/", late)]:
+            if readings:
+                _write_json_lines(fs_root + rawPath + directory, file, readings)
+                stats["files"] += 1
+        stats["events"] += events_per_file
+        stats["late_events"] += len(late)
+        event_time += file_interval
+
+        next_tick += file_interval
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+
+    stats["seconds"] = time.monotonic() - started
+    stats["events_per_second"] = stats["events"] / stats["seconds"]
+    return stats
+
+
+def _write_json_lines(directory: str, file: str, readings: list):
+    os.makedirs(directory, exist_ok=True)
+    # Spark ignores files starting with "." so a stream never reads a file
+    # that is still being written.
+    partPath = os.path.join(directory, "." + file + ".part")
+    with open(partPath, "w") as out:
+        for reading in readings:
+            out.write(json.dumps(reading) + "\n")
+    os.replace(partPath, os.path.join(directory, file))
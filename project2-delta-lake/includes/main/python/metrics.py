@@ -0,0 +1,233 @@
+# Databricks notebook source
+
+import re
+import threading
+
+from delta.tables import DeltaTable
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import (
+    col,
+    concat,
+    count,
+    current_timestamp,
+    expr,
+    input_file_name,
+    lit,
+    max,
+    percentile_approx,
+)
+from pyspark.sql.session import SparkSession
+from pyspark.sql.streaming import StreamingQueryListener
+
+# COMMAND ----------
+
+METRICS_SCHEMA = """
+    query_name STRING,
+    query_id STRING,
+    run_id STRING,
+    batch_id LONG,
+    timestamp STRING,
+    num_input_rows LONG,
+    input_rows_per_second DOUBLE,
+    processed_rows_per_second DOUBLE,
+    batch_duration_ms LONG,
+    duration_ms MAP<STRING, LONG>,
+    state_memory_bytes LONG,
+    state_rows LONG,
+    sink_path STRING
+"""
+
+# Each commit holds at most one txn action: the query id and batch id for the
+# Delta streaming sink, or the txnAppId ("<query name>:<query id>") and
+# txnVersion of a foreachBatch write.
+COMMIT_ACTIONS_SCHEMA = """
+    txn STRUCT<appId: STRING, version: LONG>,
+    add STRUCT<path: STRING>
+"""
+
+# COMMAND ----------
+
+class StreamMetricsListener(StreamingQueryListener):
+    def __init__(self, query_names: set, sink_paths: dict = None):
+        self.query_names = query_names
+        # A foreachBatch sink does not describe what it writes to, so its
+        # Delta table is looked up by query name, see STREAM_WRITER_SINKS.
+        self.sink_paths = sink_paths or {}
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def onQueryStarted(self, event):
+        pass
+
+    def onQueryProgress(self, event):
+        progress = event.progress
+        if progress.name not in self.query_names:
+            return
+        # Writing to Delta here would block the listener bus, so progress is
+        # only buffered and flushed by a separate thread.
+        sink_path = re.search(r"DeltaSink\[(.*)\]", progress.sink.description or "")
+        row = (
+            progress.name,
+            str(progress.id),
+            str(progress.runId),
+            progress.batchId,
+            progress.timestamp,
+            progress.numInputRows,
+            float(progress.inputRowsPerSecond),
+            float(progress.processedRowsPerSecond),
+            progress.batchDuration,
+            dict(progress.durationMs),
+            sum(state.memoryUsedBytes for state in progress.stateOperators),
+            sum(state.numRowsTotal for state in progress.stateOperators),
+            sink_path.group(1) if sink_path else self.sink_paths.get(progress.name),
+        )
+        with self.lock:
+            self.buffer.append(row)
+
+    def onQueryIdle(self, event):
+        pass
+
+    def onQueryTerminated(self, event):
+        pass
+
+    def drain(self) -> list:
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+        return rows
+
+
+# COMMAND ----------
+
+def start_stream_metrics(
+    spark: SparkSession,
+    metricsPath: str,
+    query_names: set,
+    flush_interval: float = 60.0,
+    sink_paths: dict = None,
+) -> StreamMetricsListener:
+    listener = StreamMetricsListener(query_names, sink_paths)
+    spark.streams.addListener(listener)
+
+    def flush_periodically():
+        while not listener.stopped.wait(flush_interval):
+            flush_stream_metrics(spark, metricsPath, listener)
+
+    threading.Thread(target=flush_periodically, daemon=True).start()
+    return listener
+
+
+def stop_stream_metrics(
+    spark: SparkSession, metricsPath: str, listener: StreamMetricsListener
+) -> bool:
+    spark.streams.removeListener(listener)
+    listener.stopped.set()
+    return flush_stream_metrics(spark, metricsPath, listener)
+
+
+def flush_stream_metrics(
+    spark: SparkSession, metricsPath: str, listener: StreamMetricsListener
+) -> bool:
+    rows = listener.drain()
+    if not rows:
+        return False
+
+    metricsDF = spark.createDataFrame(rows, METRICS_SCHEMA)
+    (
+        _with_output_files(spark, metricsDF)
+        .withColumn("timestamp", col("timestamp").cast("timestamp"))
+        .write.format("delta")
+        .mode("append")
+        .save(metricsPath)
+    )
+    return True
+
+
+def _with_output_files(spark: SparkSession, metricsDF: DataFrame) -> DataFrame:
+    # The progress event does not carry file counts, but each commit records
+    # its writer's txn next to the files it added. MERGE commits carry no txn,
+    # so the MERGE based foreachBatch writers keep a null file count.
+    sink_paths = [
+        row.sink_path
+        for row in metricsDF.where(col("sink_path").isNotNull())
+        .select("sink_path")
+        .distinct()
+        .collect()
+    ]
+    commits = None
+    for sink_path in sink_paths:
+        sink_commits = _txn_commits(spark, sink_path).withColumn(
+            "sink_path", lit(sink_path)
+        )
+        commits = (
+            sink_commits if commits is None else commits.unionByName(sink_commits)
+        )
+
+    if commits is None:
+        return metricsDF.withColumn("num_output_files", expr("CAST(NULL AS LONG)"))
+    metrics = metricsDF.alias("metrics")
+    return metrics.join(
+        commits.alias("commits"),
+        (col("metrics.sink_path") == col("commits.sink_path"))
+        & (col("metrics.batch_id") == col("commits.txn_version"))
+        & (
+            (col("commits.txn_app_id") == col("metrics.query_id"))
+            | (
+                col("commits.txn_app_id")
+                == concat(col("metrics.query_name"), lit(":"), col("metrics.query_id"))
+            )
+        ),
+        "left",
+    ).select("metrics.*", "commits.num_output_files")
+
+
+def _txn_commits(spark: SparkSession, deltaPath: str, commits: int = 100) -> DataFrame:
+    root = deltaPath.rstrip("/")
+    versions = [
+        row.version
+        for row in DeltaTable.forPath(spark, deltaPath)
+        .history(commits)
+        .select("version")
+        .collect()
+    ]
+    return (
+        spark.read.schema(COMMIT_ACTIONS_SCHEMA)
+        .json([f"{root}/_delta_log/{version:020d}.json" for version in versions])
+        .groupBy(input_file_name().alias("commit_file"))
+        .agg(
+            max("txn.appId").alias("txn_app_id"),
+            max("txn.version").alias("txn_version"),
+            count("add").alias("num_output_files"),
+        )
+        .where(col("txn_app_id").isNotNull())
+        .drop("commit_file")
+    )
+
+
+# COMMAND ----------
+
+def read_stream_metrics(
+    spark: SparkSession, metricsPath: str, query_name: str = None, since: str = None
+) -> DataFrame:
+    metricsDF = spark.read.format("delta").load(metricsPath)
+    if query_name is not None:
+        metricsDF = metricsDF.where(col("query_name") == query_name)
+    if since is not None:
+        metricsDF = metricsDF.where(
+            col("timestamp") >= current_timestamp() - expr(f"INTERVAL {since}")
+        )
+    return metricsDF
+
+
+def stream_batch_latency_percentile(
+    spark: SparkSession,
+    metricsPath: str,
+    query_name: str,
+    percentile: float = 0.95,
+    since: str = "1 HOUR",
+) -> float:
+    return (
+        read_stream_metrics(spark, metricsPath, query_name, since)
+        .select(percentile_approx("batch_duration_ms", percentile))
+        .first()[0]
+    )
@@ -1,23 +1,259 @@
 # Databricks notebook source
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import TYPE_CHECKING
+
 from delta.tables import DeltaTable
 from pyspark.sql import DataFrame
 from pyspark.sql.functions import (
+    array,
+    broadcast,
+    ceil,
+    coalesce,
     col,
+    collect_list,
+    count,
     current_timestamp,
+    date_sub,
+    explode,
+    expr,
+    filter as array_filter,
+    floor,
     from_json,
+    first,
     from_unixtime,
+    greatest,
+    hash as hash_,
     lag,
+    last,
     lead,
     lit,
+    log,
+    map_from_entries,
     mean,
+    min as min_,
+    pmod,
+    pow as pow_,
+    row_number,
+    size,
+    sqrt,
     stddev,
+    struct,
+    sum as sum_,
     max,
+    trunc,
+    when,
+    window,
 )
 from pyspark.sql.session import SparkSession
-from pyspark.sql.streaming import DataStreamWriter
+from pyspark.sql.streaming import DataStreamWriter, StreamingQuery
 from pyspark.sql.window import Window
 
+if TYPE_CHECKING:
+    from main.python.registry import TableRegistry
+
+# COMMAND ----------
+
+# Gold marts built together by create_gold_builder. "summary" marts keep
+# additive partials (count, sum, sum of squares, min, max) per key, and
+# "histogram" marts keep reading counts per key and heart rate bucket, from
+# which transform_histogram_percentiles derives percentiles.
+GOLD_AGGREGATES = [
+    {"name": "per_device", "keys": ["device_id"], "kind": "summary"},
+    {"name": "per_device_day", "keys": ["device_id", "p_eventdate"], "kind": "summary"},
+    {"name": "per_name", "keys": ["name"], "kind": "summary"},
+    {
+        "name": "per_device_histogram",
+        "keys": ["device_id"],
+        "kind": "histogram",
+        "bucket_width": 1.0,
+    },
+]
+# "sketch" marts keep mergeable sketches per key, see
+# transform_sketch_percentiles. Their distinct day counts use the hll_* SQL
+# functions of Spark 3.5, so they are opt-in, e.g.
+# aggregates=GOLD_AGGREGATES + SKETCH_AGGREGATES.
+SKETCH_AGGREGATES = [
+    {
+        "name": "per_device_day_sketch",
+        "keys": ["device_id", "p_eventdate"],
+        "kind": "sketch",
+    },
+]
+
+# Heart rate quantile sketches are DDSketch style log histograms: a reading x
+# lands in bucket ceil(log(x) / log(gamma)), so every quantile read back from
+# the sketch is within SKETCH_RELATIVE_ACCURACY of a true reading. Buckets of
+# two sketches merge by adding their counts, and a sketch over 30-250 bpm
+# holds about 110 buckets whatever the number of readings.
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+SKETCH_MERGE = """
+    map_zip_with(
+      gold.heartrate_sketch,
+      updates.heartrate_sketch,
+      (bucket, gold_count, updates_count) ->
+        coalesce(gold_count, 0) + coalesce(updates_count, 0)
+    )
+  """
+
+# COMMAND ----------
+
+# Query names of every stream built by the writers below, so the metrics
+# listener can tell pipeline queries apart from ad hoc ones.
+STREAM_WRITER_NAMES = set()
+# Delta tables written by the foreachBatch writers that commit with txnAppId,
+# by query name, so the metrics listener can find each batch's commit. The
+# MERGE based writers leave no such marker in their commits.
+STREAM_WRITER_SINKS = {}
+
+# Each rule is a SQL predicate that flags a reading as impossible. A reading
+# matching any rule goes to quarantine instead of silver.
+VALIDATION_RULES = {
+    "negative_heartrate": "heartrate < 0",
+    "heartrate_above_250": "heartrate > 250",
+    "null_device_id": "device_id IS NULL",
+    "future_eventtime": "eventtime > current_timestamp()",
+}
+
+# COMMAND ----------
+
+# Throughput profiles set the trigger, the source admission limits and the
+# shuffle partition count together, since each only helps in combination.
+# maxBytesPerTrigger is only honoured by the Delta source.
+STREAM_PROFILES = {
+    "low_latency": {
+        "trigger": {"processingTime": "1 second"},
+        "maxFilesPerTrigger": 1,
+        "maxBytesPerTrigger": "64m",
+        "shuffle_partitions": 8,
+    },
+    "balanced": {
+        "trigger": {"processingTime": "10 seconds"},
+        "maxFilesPerTrigger": 100,
+        "maxBytesPerTrigger": "1g",
+        "shuffle_partitions": 64,
+    },
+    "bulk_backfill": {
+        "trigger": {"processingTime": "1 minute"},
+        "maxFilesPerTrigger": 1000,
+        "maxBytesPerTrigger": "10g",
+        "shuffle_partitions": 200,
+    },
+    "available_now": {
+        "trigger": {"availableNow": True},
+        "maxFilesPerTrigger": 1000,
+        "maxBytesPerTrigger": "10g",
+        "shuffle_partitions": 200,
+    },
+}
+
+
+@contextmanager
+def apply_stream_profile(spark: SparkSession, profile: str):
+    # A query copies the session conf when it starts, so the shuffle partition
+    # count is only set around start() and every other query keeps its own.
+    # Stateful queries keep the count recorded in their first checkpoint, so
+    # it only changes for a query started on a new checkpoint.
+    settings = STREAM_PROFILES[profile]
+    previous = spark.conf.get("spark.sql.shuffle.partitions")
+    spark.conf.set("spark.sql.shuffle.partitions", settings["shuffle_partitions"])
+    try:
+        yield settings
+    finally:
+        spark.conf.set("spark.sql.shuffle.partitions", previous)
+
+
+# COMMAND ----------
+
+# Partition layouts repartition_table in maintenance.py rewrites a table to. The
+# layout is recorded in the table properties, and the writers below derive
+# their partition columns from it, so appends keep working after a rewrite.
+PARTITION_LAYOUTS = ["daily", "monthly", "daily_device_bucket"]
+
+
+def partition_columns(
+    layout: str, date_column: str = "p_eventdate", month_column: str = "p_eventmonth"
+) -> list:
+    if layout == "daily":
+        return [date_column]
+    if layout == "monthly":
+        return [month_column]
+    if layout == "daily_device_bucket":
+        return [date_column, "p_device_bucket"]
+    raise ValueError(
+        f"Unknown partition layout {layout}, expected one of {PARTITION_LAYOUTS}"
+    )
+
+
+def add_partition_columns(
+    dataframe: DataFrame,
+    layout: str,
+    date_column: str = "p_eventdate",
+    buckets: int = None,
+    key_column: str = "device_id",
+    month_column: str = "p_eventmonth",
+) -> DataFrame:
+    # Writers append to the table through this, so the derived columns follow
+    # whatever layout the table currently has instead of a notebook literal.
+    if layout == "monthly":
+        return dataframe.withColumn(month_column, trunc(col(date_column), "month"))
+    if layout == "daily_device_bucket":
+        if buckets is None:
+            raise ValueError("The daily_device_bucket layout needs a bucket count")
+        return dataframe.withColumn(
+            "p_device_bucket", pmod(hash_(col(key_column)), lit(buckets))
+        )
+    partition_columns(layout, date_column)
+    return dataframe
+
+
+def table_partition_layout(spark: SparkSession, deltaPath: str) -> dict:
+    detail = DeltaTable.forPath(spark, deltaPath).detail().first()
+    layout = _recorded_layout(detail["properties"])
+    if layout is None:
+        # Tables not rewritten by repartition_table are the daily layout.
+        date_columns = list(detail["partitionColumns"]) or ["p_eventdate"]
+        return {
+            "layout": "daily",
+            "date_column": date_columns[0],
+            "month_column": None,
+            "buckets": None,
+        }
+    return layout
+
+
+def _recorded_layout(properties: dict) -> dict:
+    if "health_tracker.partition_layout" not in properties:
+        return None
+    return {
+        "layout": properties["health_tracker.partition_layout"],
+        "date_column": properties["health_tracker.date_column"],
+        "month_column": properties.get("health_tracker.month_column") or None,
+        "buckets": int(properties["health_tracker.device_buckets"]) or None,
+    }
+
+
+def _follow_table_layout(
+    dataframe: DataFrame, deltaPath: str, partition_column: str
+) -> tuple:
+    # Tables without a recorded layout keep the writer's own partition column.
+    spark = dataframe.sparkSession
+    columns = [] if partition_column is None else [partition_column]
+    if deltaPath is None or not DeltaTable.isDeltaTable(spark, deltaPath):
+        return dataframe, columns
+    layout = _recorded_layout(
+        DeltaTable.forPath(spark, deltaPath).detail().first()["properties"]
+    )
+    if layout is None:
+        return dataframe, columns
+    return add_partition_columns(dataframe, **layout), partition_columns(
+        layout["layout"], layout["date_column"], layout["month_column"]
+    )
+
+
 # COMMAND ----------
 
 def create_stream_writer(
@@ -26,35 +262,411 @@ def create_stream_writer(
     name: str,
     partition_column: str = None,
     mode: str = "append",
+    profile: str = None,
+    deltaPath: str = None,
 ) -> DataStreamWriter:
-
+    # Given the sink's deltaPath, the writer partitions the stream by the
+    # layout repartition_table recorded on the table. A layout changed after
+    # the query starts needs the query restarted.
+    STREAM_WRITER_NAMES.add(name)
+    dataframe, columns = _follow_table_layout(dataframe, deltaPath, partition_column)
     stream_writer = (
         dataframe.writeStream.format("delta")
         .outputMode(mode)
         .option("checkpointLocation", checkpoint)
         .queryName(name)
     )
-    if partition_column is not None:
-        return stream_writer.partitionBy(partition_column)
+    if profile is not None:
+        stream_writer = stream_writer.trigger(**STREAM_PROFILES[profile]["trigger"])
+    if columns:
+        return stream_writer.partitionBy(*columns)
     return stream_writer
 
 
 # COMMAND ----------
 
-def read_stream_delta(spark: SparkSession, deltaPath: str) -> DataFrame:
-    return spark.readStream.format("delta").load(deltaPath)
+def create_repairing_stream_writer(
+    dataframe: DataFrame,
+    checkpoint: str,
+    name: str,
+    deltaPath: str,
+    statePath: str,
+    partition_column: str = None,
+) -> DataStreamWriter:
+    STREAM_WRITER_NAMES.add(name)
+    STREAM_WRITER_SINKS[name] = deltaPath
+
+    def append_repaired_batch(batchDF: DataFrame, batch_id: int):
+        _append_repaired_batch(
+            batchDF, batch_id, name, deltaPath, statePath, partition_column
+        )
+
+    return (
+        dataframe.writeStream.foreachBatch(append_repaired_batch)
+        .option("checkpointLocation", checkpoint)
+        .queryName(name)
+    )
+
+
+def _append_repaired_batch(
+    batchDF: DataFrame,
+    batch_id: int,
+    name: str,
+    deltaPath: str,
+    statePath: str,
+    partition_column: str = None,
+):
+    spark = batchDF.sparkSession
+
+    batchDF = (
+        batchDF.withColumn("_from_state", lit(False))
+        .withColumn("_held", lit(False))
+        .persist()
+    )
+    contextDF = batchDF
+    if DeltaTable.isDeltaTable(spark, statePath):
+        stateDF = spark.read.format("delta").load(statePath)
+        if "_held" not in stateDF.columns:
+            stateDF = stateDF.withColumn("_held", lit(False))
+        contextDF = batchDF.unionByName(
+            stateDF.withColumn("_from_state", lit(True)), allowMissingColumns=True
+        )
+
+    prev_good, next_good = _good_neighbours()
+
+    # A broken reading at the end of a batch has no next good reading yet, so
+    # it falls back to the last good one rather than waiting for the next batch.
+    # A device without any good reading has nothing to repair from, so its
+    # broken readings are held in the state table until one arrives.
+    neighboursDF = (
+        contextDF.select("*", prev_good.alias("prev_amt"), next_good.alias("next_amt"))
+        .where(~col("_from_state") | col("_held"))
+        .withColumn(
+            "repaired_amt",
+            when(col("heartrate") >= 0, col("heartrate")).otherwise(
+                coalesce(
+                    (col("prev_amt") + col("next_amt")) / 2,
+                    col("prev_amt"),
+                    col("next_amt"),
+                )
+            ),
+        )
+        .drop("prev_amt", "next_amt")
+        .persist()
+    )
+    repairedDF = (
+        neighboursDF.where(col("repaired_amt").isNotNull())
+        .withColumn("heartrate", col("repaired_amt"))
+        .drop("repaired_amt", "_from_state", "_held")
+    )
+    repairedDF, columns = _follow_table_layout(repairedDF, deltaPath, partition_column)
+
+    batch_writer = (
+        repairedDF.write.format("delta")
+        .mode("append")
+        .option("txnAppId", _txn_app_id(batchDF, name))
+        .option("txnVersion", batch_id)
+    )
+    if columns:
+        batch_writer = batch_writer.partitionBy(*columns)
+    batch_writer.save(deltaPath)
+
+    latestWindow = Window.partitionBy("device_id").orderBy(col("eventtime").desc())
+    heldDF = (
+        neighboursDF.where(col("repaired_amt").isNull())
+        .drop("repaired_amt", "_from_state")
+        .withColumn("_held", lit(True))
+    )
+    (
+        contextDF.where(col("heartrate") >= 0)
+        .withColumn("row", row_number().over(latestWindow))
+        .where(col("row") == 1)
+        .drop("row", "_from_state")
+        .withColumn("_held", lit(False))
+        .unionByName(heldDF)
+        .write.format("delta")
+        .mode("overwrite")
+        .option("overwriteSchema", "true")
+        .save(statePath)
+    )
+
+    neighboursDF.unpersist()
+    batchDF.unpersist()
 
 
 # COMMAND ----------
 
-def read_stream_raw(spark: SparkSession, rawPath: str) -> DataFrame:
+def create_dedup_merge_writer(
+    dataframe: DataFrame,
+    checkpoint: str,
+    name: str,
+    deltaPath: str,
+    partition_column: str = "p_eventdate",
+) -> DataStreamWriter:
+    STREAM_WRITER_NAMES.add(name)
+
+    def merge_new_readings(batchDF: DataFrame, batch_id: int):
+        _merge_new_readings(batchDF, deltaPath, partition_column)
+
+    return (
+        dataframe.writeStream.foreachBatch(merge_new_readings)
+        .option("checkpointLocation", checkpoint)
+        .queryName(name)
+    )
+
+
+def _merge_new_readings(batchDF: DataFrame, deltaPath: str, partition_column: str):
+    spark = batchDF.sparkSession
+    batchDF = batchDF.dropDuplicates(["device_id", "eventtime"]).persist()
+
+    if not DeltaTable.isDeltaTable(spark, deltaPath):
+        batchDF.write.format("delta").partitionBy(partition_column).save(deltaPath)
+        batchDF.unpersist()
+        return
+
+    dates = [row[0] for row in batchDF.select(partition_column).distinct().collect()]
+    if dates:
+        # Restricting the target to the batch's partitions keeps the MERGE
+        # from scanning all of silver during a backfill.
+        merge_match = f"""
+    silver.{partition_column} IN ({_sql_literals(sorted(dates))})
+    AND
+    silver.{partition_column} = updates.{partition_column}
+    AND
+    silver.eventtime = updates.eventtime
+    AND
+    silver.device_id = updates.device_id
+  """
+        (
+            DeltaTable.forPath(spark, deltaPath)
+            .alias("silver")
+            .merge(batchDF.alias("updates"), merge_match)
+            .whenNotMatchedInsertAll()
+            .execute()
+        )
+
+    batchDF.unpersist()
+
+
+# COMMAND ----------
+
+def create_validating_stream_writer(
+    dataframe: DataFrame,
+    checkpoint: str,
+    name: str,
+    deltaPath: str,
+    quarantinePath: str,
+    partition_column: str = None,
+    rules: dict = None,
+) -> DataStreamWriter:
+    STREAM_WRITER_NAMES.add(name)
+    STREAM_WRITER_SINKS[name] = deltaPath
+
+    def append_validated_batch(batchDF: DataFrame, batch_id: int):
+        _append_validated_batch(
+            batchDF, batch_id, name, deltaPath, quarantinePath, partition_column, rules
+        )
+
+    return (
+        dataframe.writeStream.foreachBatch(append_validated_batch)
+        .option("checkpointLocation", checkpoint)
+        .queryName(name)
+    )
+
+
+def _append_validated_batch(
+    batchDF: DataFrame,
+    batch_id: int,
+    name: str,
+    deltaPath: str,
+    quarantinePath: str,
+    partition_column: str = None,
+    rules: dict = None,
+):
+    # The rules are evaluated once and the flagged batch is cached, so both
+    # writes below share a single pass over the source.
+    validatedDF = transform_validate(batchDF, rules).persist()
+    app_id = _txn_app_id(batchDF, name)
+
+    passedDF, columns = _follow_table_layout(
+        validatedDF.where(size("failed_rules") == 0).drop("failed_rules"),
+        deltaPath,
+        partition_column,
+    )
+    batch_writer = (
+        passedDF.write.format("delta")
+        .mode("append")
+        .option("txnAppId", app_id)
+        .option("txnVersion", batch_id)
+    )
+    if columns:
+        batch_writer = batch_writer.partitionBy(*columns)
+    batch_writer.save(deltaPath)
+
+    (
+        validatedDF.where(size("failed_rules") > 0)
+        .withColumn("quarantined_at", current_timestamp())
+        .write.format("delta")
+        .mode("append")
+        .option("txnAppId", app_id)
+        .option("txnVersion", batch_id)
+        .option("mergeSchema", "true")
+        .save(quarantinePath)
+    )
+
+    validatedDF.unpersist()
+
+
+def _txn_app_id(batchDF: DataFrame, name: str) -> str:
+    # Batch ids start over at 0 on a new checkpoint, e.g. after
+    # retire_checkpoint, so with the name alone Delta would skip the new
+    # checkpoint's first batches as already written.
+    query_id = _stream_query_id(batchDF)
+    return name if query_id is None else f"{name}:{query_id}"
+
+
+def _stream_query_id(batchDF: DataFrame) -> str:
+    # Spark sets this for every micro-batch on the thread running
+    # foreachBatch. The query id is stored in the checkpoint, so it stays the
+    # same across restarts of the same one and changes with a new checkpoint.
+    return batchDF.sparkSession.sparkContext.getLocalProperty("sql.streaming.queryId")
+
+
+# COMMAND ----------
+
+def create_late_data_writer(
+    dataframe: DataFrame,
+    checkpoint: str,
+    name: str,
+    silverPath: str,
+    goldTablePath: str,
+) -> DataStreamWriter:
+    STREAM_WRITER_NAMES.add(name)
+
+    def merge_late_batch(batchDF: DataFrame, batch_id: int):
+        _merge_late_batch(batchDF, silverPath, goldTablePath)
+
+    return (
+        dataframe.writeStream.foreachBatch(merge_late_batch)
+        .option("checkpointLocation", checkpoint)
+        .queryName(name)
+    )
+
+
+def _merge_late_batch(batchDF: DataFrame, silverPath: str, goldTablePath: str):
+    spark = batchDF.sparkSession
+    batchDF = batchDF.persist()
+
+    devices = [
+        row.device_id for row in batchDF.select("device_id").distinct().collect()
+    ]
+    _merge_new_readings(batchDF, silverPath, "p_eventdate")
+
+    if devices:
+        # Only the devices that received late readings have stale aggregates.
+        # They are recomputed from silver, so gold also takes in the on-time
+        # readings appended since, and a replayed batch upserts the same rows.
+        goldUpdatesDF = transform_silver_mean_agg(
+            spark.read.format("delta")
+            .load(silverPath)
+            .where(col("device_id").isin(devices))
+        )
+        if not DeltaTable.isDeltaTable(spark, goldTablePath):
+            goldUpdatesDF.write.format("delta").save(goldTablePath)
+        else:
+            (
+                DeltaTable.forPath(spark, goldTablePath)
+                .alias("gold")
+                .merge(
+                    goldUpdatesDF.alias("updates"), "gold.device_id = updates.device_id"
+                )
+                .whenMatchedUpdateAll()
+                .whenNotMatchedInsertAll()
+                .execute()
+            )
+
+    batchDF.unpersist()
+
+
+# COMMAND ----------
+
+def stream_state_report(query: StreamingQuery) -> dict:
+    report = {
+        "name": query.name,
+        "state_rows": 0,
+        "state_memory_bytes": 0,
+        "rows_dropped_by_watermark": 0,
+    }
+    progress = query.lastProgress
+    if progress is None:
+        return report
+    for operator in progress["stateOperators"]:
+        report["state_rows"] += operator["numRowsTotal"]
+        report["state_memory_bytes"] += operator["memoryUsedBytes"]
+        report["rows_dropped_by_watermark"] += operator.get(
+            "numRowsDroppedByWatermark", 0
+        )
+    return report
+
+
+# COMMAND ----------
+
+def read_stream_delta(
+    spark: SparkSession,
+    deltaPath: str,
+    profile: str = None,
+    starting_version: int = None,
+    starting_timestamp: str = None,
+) -> DataFrame:
+    stream_reader = spark.readStream.format("delta")
+    # Both only take effect on a new checkpoint, see retire_checkpoint.
+    if starting_version is not None:
+        stream_reader = stream_reader.option("startingVersion", starting_version)
+    if starting_timestamp is not None:
+        stream_reader = stream_reader.option("startingTimestamp", starting_timestamp)
+    if profile is not None:
+        settings = STREAM_PROFILES[profile]
+        stream_reader = stream_reader.option(
+            "maxFilesPerTrigger", settings["maxFilesPerTrigger"]
+        ).option("maxBytesPerTrigger", settings["maxBytesPerTrigger"])
+    return stream_reader.load(deltaPath)
+
+
+# COMMAND ----------
+
+def read_stream_raw(
+    spark: SparkSession, rawPath: str, profile: str = None
+) -> DataFrame:
     kafka_schema = "value STRING"
-    return spark.readStream.format("text").schema(kafka_schema).load(rawPath)
+    stream_reader = spark.readStream.format("text").schema(kafka_schema)
+    if profile is not None:
+        settings = STREAM_PROFILES[profile]
+        stream_reader = stream_reader.option(
+            "maxFilesPerTrigger", settings["maxFilesPerTrigger"]
+        )
+    return stream_reader.load(rawPath)
 
 
 # COMMAND ----------
 
-def update_silver_table(spark: SparkSession, silverPath: str) -> bool:
+def read_stream_json(
+    spark: SparkSession, rawPath: str, profile: str = None
+) -> DataFrame:
+    json_schema = "device_id INTEGER, heartrate DOUBLE, name STRING, time FLOAT"
+    stream_reader = spark.readStream.format("json").schema(json_schema)
+    if profile is not None:
+        settings = STREAM_PROFILES[profile]
+        stream_reader = stream_reader.option(
+            "maxFilesPerTrigger", settings["maxFilesPerTrigger"]
+        )
+    return stream_reader.load(rawPath)
+
+
+# COMMAND ----------
+
+def update_silver_table(
+    spark: SparkSession, silverPath: str, tables: "TableRegistry" = None
+) -> bool:
 
     update_match = """
     health_tracker.eventtime = updates.eventtime
@@ -66,7 +678,13 @@ def update_silver_table(spark: SparkSession, silverPath: str) -> bool:
 
     dateWindow = Window.orderBy("p_eventdate")
 
-    interpolatedDF = spark.read.table("health_tracker_plus_silver").select(
+    silverDF = (
+        spark.read.table("health_tracker_plus_silver")
+        if tables is None
+        else tables.read("health_tracker_plus_silver")
+    )
+
+    interpolatedDF = silverDF.select(
         "*",
         lag(col("heartrate")).over(dateWindow).alias("prev_amt"),
         lead(col("heartrate")).over(dateWindow).alias("next_amt"),
@@ -80,7 +698,7 @@ def update_silver_table(spark: SparkSession, silverPath: str) -> bool:
         "p_eventdate",
     )
 
-    silverTable = DeltaTable.forPath(spark, silverPath)
+    silverTable = _delta_table(spark, silverPath, tables)
 
     (
         silverTable.alias("health_tracker")
@@ -92,6 +710,221 @@ def update_silver_table(spark: SparkSession, silverPath: str) -> bool:
     return True
 
 
+# COMMAND ----------
+
+def update_silver_table_partitioned(
+    spark: SparkSession,
+    silverPath: str,
+    neighbour_days: int = 1,
+    tables: "TableRegistry" = None,
+) -> bool:
+
+    silverDF = _read_delta(spark, silverPath, tables)
+
+    broken_dates = [
+        row.p_eventdate
+        for row in silverDF.where(col("heartrate") < 0)
+        .select("p_eventdate")
+        .distinct()
+        .collect()
+    ]
+    if not broken_dates:
+        return False
+
+    return _repair_broken_readings(
+        spark, silverPath, broken_dates, neighbour_days, tables
+    )
+
+
+# COMMAND ----------
+
+def update_silver_table_incremental(
+    spark: SparkSession,
+    silverPath: str,
+    repairCheckpoint: str,
+    tables: "TableRegistry" = None,
+) -> int:
+
+    last_version = _read_repair_version(spark, repairCheckpoint)
+    if not _change_data_feed_enabled(spark, silverPath, tables):
+        if last_version is not None:
+            raise ValueError(
+                f"delta.enableChangeDataFeed is not set on {silverPath}, so the "
+                f"changes after version {last_version} cannot be read; enable "
+                f"it and delete {repairCheckpoint} to start over with a full pass"
+            )
+        # The first pass repairs the whole table, so the feed only has to cover
+        # commits from here on.
+        silverLocation = silverPath if tables is None else tables.path(silverPath)
+        enable_change_data_feed(spark, silverLocation)
+    current_version = _latest_version(spark, silverPath, tables)
+
+    if last_version is None:
+        update_silver_table_partitioned(spark, silverPath, tables=tables)
+    elif current_version > last_version:
+        changesDF = (
+            spark.read.format("delta")
+            .option("readChangeFeed", "true")
+            .option("startingVersion", last_version + 1)
+            .option("endingVersion", current_version)
+            .load(silverPath)
+            .where(col("_change_type") == "insert")
+        )
+        # Every touched day is repaired, not only days with new negative
+        # readings, so a broken reading left at the end of the previous slice
+        # is picked up once its next neighbour has arrived.
+        new_dates = [
+            row.p_eventdate
+            for row in changesDF.select("p_eventdate").distinct().collect()
+        ]
+        if new_dates:
+            _repair_broken_readings(spark, silverPath, new_dates, tables=tables)
+
+    # Our own MERGE commits land after current_version and only produce
+    # update_* change rows, so resuming from here does not skip any appends.
+    _write_repair_version(spark, repairCheckpoint, current_version)
+    return current_version
+
+
+def enable_change_data_feed(spark: SparkSession, deltaPath: str) -> bool:
+    spark.sql(
+        f"""
+    ALTER TABLE delta.`{deltaPath}`
+    SET TBLPROPERTIES (delta.enableChangeDataFeed = true)
+    """
+    )
+    return True
+
+
+def _change_data_feed_enabled(
+    spark: SparkSession, deltaPath: str, tables: "TableRegistry" = None
+) -> bool:
+    properties = _delta_table(spark, deltaPath, tables).detail().first()["properties"]
+    return properties.get("delta.enableChangeDataFeed", "false").lower() == "true"
+
+
+def _latest_version(
+    spark: SparkSession, deltaPath: str, tables: "TableRegistry" = None
+) -> int:
+    if tables is not None:
+        return tables.version(deltaPath)
+    return (
+        DeltaTable.forPath(spark, deltaPath).history(1).select("version").first()[0]
+    )
+
+
+def _read_repair_version(spark: SparkSession, repairCheckpoint: str):
+    if not DeltaTable.isDeltaTable(spark, repairCheckpoint):
+        return None
+    return spark.read.format("delta").load(repairCheckpoint).first()["version"]
+
+
+def _sql_literals(values: list) -> str:
+    return ", ".join(f"'{value}'" for value in values)
+
+
+def _write_repair_version(spark: SparkSession, repairCheckpoint: str, version: int):
+    (
+        spark.createDataFrame([(version,)], "version LONG")
+        .write.format("delta")
+        .mode("overwrite")
+        .save(repairCheckpoint)
+    )
+
+
+def _repair_broken_readings(
+    spark: SparkSession,
+    silverPath: str,
+    dates: list,
+    neighbour_days: int = 1,
+    tables: "TableRegistry" = None,
+) -> bool:
+
+    # A broken reading at the start or end of a day interpolates against the
+    # neighbouring day, so those partitions have to be scanned as well.
+    scan_dates = sorted(
+        {
+            date + timedelta(days=offset)
+            for date in dates
+            for offset in range(-neighbour_days, neighbour_days + 1)
+        }
+    )
+    update_match = f"""
+    health_tracker.p_eventdate IN ({_sql_literals(scan_dates)})
+    AND
+    health_tracker.p_eventdate = updates.p_eventdate
+    AND
+    health_tracker.eventtime = updates.eventtime
+    AND
+    health_tracker.device_id = updates.device_id
+  """
+
+    update = {"heartrate": "updates.heartrate"}
+
+    prev_good, next_good = _good_neighbours()
+
+    interpolatedDF = (
+        _read_delta(spark, silverPath, tables)
+        .where(col("p_eventdate").isin(scan_dates))
+        .select("*", prev_good.alias("prev_amt"), next_good.alias("next_amt"))
+    )
+
+    # Readings without both good neighbours yet are left for a later run
+    # rather than being overwritten with null.
+    updatesDF = interpolatedDF.where(
+        (col("heartrate") < 0)
+        & col("prev_amt").isNotNull()
+        & col("next_amt").isNotNull()
+    ).select(
+        "device_id",
+        ((col("prev_amt") + col("next_amt")) / 2).alias("heartrate"),
+        "eventtime",
+        "name",
+        "p_eventdate",
+    )
+
+    silverTable = _delta_table(spark, silverPath, tables)
+
+    (
+        silverTable.alias("health_tracker")
+        .merge(updatesDF.alias("updates"), update_match)
+        .whenMatchedUpdate(set=update)
+        .execute()
+    )
+
+    return True
+
+
+def _good_neighbours() -> tuple:
+    # Broken readings are skipped, so a run of them interpolates between the
+    # good readings around the run instead of against each other.
+    deviceWindow = Window.partitionBy("device_id").orderBy("eventtime")
+    good_heartrate = when(col("heartrate") >= 0, col("heartrate"))
+    prev_good = last(good_heartrate, ignorenulls=True).over(
+        deviceWindow.rowsBetween(Window.unboundedPreceding, -1)
+    )
+    next_good = first(good_heartrate, ignorenulls=True).over(
+        deviceWindow.rowsBetween(1, Window.unboundedFollowing)
+    )
+    return prev_good, next_good
+
+
+def _read_delta(
+    spark: SparkSession, deltaPath: str, tables: "TableRegistry" = None
+) -> DataFrame:
+    if tables is None:
+        return spark.read.format("delta").load(deltaPath)
+    return tables.read(deltaPath)
+
+
+def _delta_table(
+    spark: SparkSession, deltaPath: str, tables: "TableRegistry" = None
+) -> DeltaTable:
+    if tables is None:
+        return DeltaTable.forPath(spark, deltaPath)
+    return tables.table(deltaPath)
+
+
 # COMMAND ----------
 
 def transform_bronze(bronze: DataFrame) -> DataFrame:
@@ -111,6 +944,47 @@ def transform_bronze(bronze: DataFrame) -> DataFrame:
     )
 
 
+# COMMAND ----------
+
+def transform_bronze_dedup(silver: DataFrame, watermark: str = "1 day") -> DataFrame:
+    # eventtime is part of the key, so the watermark lets Spark evict
+    # deduplication state older than the delay instead of keeping every key.
+    return silver.withWatermark("eventtime", watermark).dropDuplicates(
+        ["device_id", "eventtime"]
+    )
+
+
+# COMMAND ----------
+
+def transform_validate(dataframe: DataFrame, rules: dict = None) -> DataFrame:
+    rules = VALIDATION_RULES if rules is None else rules
+    # A predicate that evaluates to null, e.g. on a null heartrate, does not
+    # flag the reading.
+    failed_rules = array_filter(
+        array(
+            *[
+                when(expr(predicate), lit(rule))
+                for rule, predicate in rules.items()
+            ]
+        ),
+        lambda rule: rule.isNotNull(),
+    )
+    return dataframe.withColumn("failed_rules", failed_rules)
+
+
+def transform_json(raw: DataFrame) -> DataFrame:
+    # Casting the epoch seconds directly avoids the format-then-parse string
+    # round trip of from_unixtime, and the date is derived from the timestamp.
+    eventtime = col("time").cast("long").cast("timestamp")
+    return raw.select(
+        "device_id",
+        "heartrate",
+        eventtime.alias("eventtime"),
+        "name",
+        eventtime.cast("date").alias("p_eventdate"),
+    )
+
+
 # COMMAND ----------
 
 def transform_raw(df: DataFrame) -> DataFrame:
@@ -132,13 +1006,389 @@ def transform_silver_mean_agg(silver: DataFrame) -> DataFrame:
     )
 
 
+# COMMAND ----------
+
+def transform_silver_daily_agg(
+    silver: DataFrame, watermark: str = "1 day"
+) -> DataFrame:
+    return (
+        silver.withWatermark("eventtime", watermark)
+        .groupBy("device_id", window("eventtime", "1 day"))
+        .agg(
+            count(col("heartrate")).alias("count_heartrate"),
+            sum_(col("heartrate")).alias("sum_heartrate"),
+            sum_(col("heartrate") * col("heartrate")).alias("sum_sq_heartrate"),
+            max(col("heartrate")).alias("max_heartrate"),
+        )
+        .select(
+            "device_id",
+            col("window.start").cast("date").alias("p_eventdate"),
+            "count_heartrate",
+            "sum_heartrate",
+            "sum_sq_heartrate",
+            "max_heartrate",
+        )
+    )
+
+
+def create_daily_agg_writer(
+    dataframe: DataFrame, checkpoint: str, name: str, deltaPath: str
+) -> DataStreamWriter:
+    STREAM_WRITER_NAMES.add(name)
+
+    def merge_daily_agg(batchDF: DataFrame, batch_id: int):
+        _merge_daily_agg(batchDF, deltaPath)
+
+    # The Delta sink only supports append and complete, so update mode goes
+    # through an upsert on (device_id, p_eventdate).
+    return (
+        dataframe.writeStream.foreachBatch(merge_daily_agg)
+        .outputMode("update")
+        .option("checkpointLocation", checkpoint)
+        .queryName(name)
+    )
+
+
+def _merge_daily_agg(batchDF: DataFrame, deltaPath: str):
+    spark = batchDF.sparkSession
+
+    if not DeltaTable.isDeltaTable(spark, deltaPath):
+        batchDF.write.format("delta").save(deltaPath)
+        return
+
+    (
+        DeltaTable.forPath(spark, deltaPath)
+        .alias("gold")
+        .merge(
+            batchDF.alias("updates"),
+            """
+    gold.device_id = updates.device_id
+    AND
+    gold.p_eventdate = updates.p_eventdate
+  """,
+        )
+        .whenMatchedUpdateAll()
+        .whenNotMatchedInsertAll()
+        .execute()
+    )
+
+
+def transform_daily_agg_mean_agg(daily: DataFrame) -> DataFrame:
+    n = col("count_heartrate")
+    total = col("sum_heartrate")
+    return (
+        daily.groupBy("device_id")
+        .agg(
+            sum_(col("count_heartrate")).alias("count_heartrate"),
+            sum_(col("sum_heartrate")).alias("sum_heartrate"),
+            sum_(col("sum_sq_heartrate")).alias("sum_sq_heartrate"),
+            max(col("max_heartrate")).alias("max_heartrate"),
+        )
+        .select(
+            "device_id",
+            (total / n).alias("mean_heartrate"),
+            # Sample standard deviation, matching stddev in transform_silver_mean_agg.
+            # Rounding can push the variance of constant readings slightly below 0.
+            sqrt(
+                greatest(
+                    (col("sum_sq_heartrate") - total * total / n) / (n - 1), lit(0.0)
+                )
+            ).alias("std_heartrate"),
+            "max_heartrate",
+        )
+    )
+
+
+# COMMAND ----------
+
+def create_gold_builder(
+    dataframe: DataFrame,
+    checkpoint: str,
+    name: str,
+    goldPath: str,
+    aggregates: list = GOLD_AGGREGATES,
+    max_workers: int = 4,
+) -> DataStreamWriter:
+    STREAM_WRITER_NAMES.add(name)
+
+    def build_gold_batch(batchDF: DataFrame, batch_id: int):
+        _build_gold_batch(batchDF, batch_id, goldPath, aggregates, max_workers)
+
+    return (
+        dataframe.writeStream.foreachBatch(build_gold_batch)
+        .option("checkpointLocation", checkpoint)
+        .queryName(name)
+    )
+
+
+def _build_gold_batch(
+    batchDF: DataFrame,
+    batch_id: int,
+    goldPath: str,
+    aggregates: list,
+    max_workers: int,
+):
+    # Silver is read once per batch and cached only until every mart has been
+    # merged, so each further mart adds an aggregation, not another scan. The
+    # query id is only visible on this thread, not on the pool's.
+    query_id = _stream_query_id(batchDF)
+    batchDF = batchDF.persist()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            merges = [
+                executor.submit(
+                    _merge_gold_aggregate,
+                    batchDF,
+                    batch_id,
+                    query_id,
+                    aggregate.get("path", goldPath + aggregate["name"]),
+                    aggregate,
+                )
+                for aggregate in aggregates
+            ]
+            for merge in merges:
+                merge.result()
+    finally:
+        batchDF.unpersist()
+
+
+def _merge_gold_aggregate(
+    batchDF: DataFrame,
+    batch_id: int,
+    query_id: str,
+    deltaPath: str,
+    aggregate: dict,
+):
+    spark = batchDF.sparkSession
+    keys = list(aggregate["keys"])
+    if aggregate["kind"] == "sketch":
+        updatesDF = _sketch_partials(batchDF, keys)
+        update = {
+            "count_heartrate": "gold.count_heartrate + updates.count_heartrate",
+            "heartrate_sketch": SKETCH_MERGE,
+            "days_sketch": "hll_union(gold.days_sketch, updates.days_sketch)",
+        }
+    elif aggregate["kind"] == "histogram":
+        width = aggregate.get("bucket_width", 1.0)
+        batchDF = batchDF.withColumn(
+            "heartrate_bucket", floor(col("heartrate") / width) * width
+        )
+        keys.append("heartrate_bucket")
+        updatesDF = _heartrate_partials(
+            batchDF, keys, [count(col("heartrate")).alias("count_heartrate")]
+        )
+        update = {"count_heartrate": "gold.count_heartrate + updates.count_heartrate"}
+    else:
+        partials = [
+            count(col("heartrate")).alias("count_heartrate"),
+            sum_(col("heartrate")).alias("sum_heartrate"),
+            sum_(col("heartrate") * col("heartrate")).alias("sum_sq_heartrate"),
+            min_(col("heartrate")).alias("min_heartrate"),
+            max(col("heartrate")).alias("max_heartrate"),
+        ]
+        update = {
+            "count_heartrate": "gold.count_heartrate + updates.count_heartrate",
+            "sum_heartrate": "gold.sum_heartrate + updates.sum_heartrate",
+            "sum_sq_heartrate": "gold.sum_sq_heartrate + updates.sum_sq_heartrate",
+            "min_heartrate": "least(gold.min_heartrate, updates.min_heartrate)",
+            "max_heartrate": "greatest(gold.max_heartrate, updates.max_heartrate)",
+        }
+        updatesDF = _heartrate_partials(batchDF, keys, partials)
+    updatesDF = updatesDF.withColumn(
+        "last_batch_id", lit(batch_id).cast("long")
+    ).withColumn("last_query_id", lit(query_id).cast("string"))
+    update["last_batch_id"] = "updates.last_batch_id"
+    update["last_query_id"] = "updates.last_query_id"
+
+    if not DeltaTable.isDeltaTable(spark, deltaPath):
+        updatesDF.write.format("delta").save(deltaPath)
+        return
+
+    # Rows already carrying this batch id of the same query were merged before
+    # a restart, so a replayed batch is not added twice. A new checkpoint
+    # starts its batch ids at 0 again under a new query id.
+    merge_match = " AND ".join(f"gold.{key} <=> updates.{key}" for key in keys)
+    replayed = """
+    gold.last_query_id <=> updates.last_query_id
+    AND
+    gold.last_batch_id >= updates.last_batch_id
+  """
+    (
+        DeltaTable.forPath(spark, deltaPath)
+        .alias("gold")
+        .merge(updatesDF.alias("updates"), merge_match)
+        .whenMatchedUpdate(condition=f"NOT ({replayed})", set=update)
+        .whenNotMatchedInsertAll()
+        .execute()
+    )
+
+
+def _heartrate_partials(batchDF: DataFrame, keys: list, partials: list) -> DataFrame:
+    return batchDF.where(col("heartrate").isNotNull()).groupBy(*keys).agg(*partials)
+
+
+def _sketch_partials(batchDF: DataFrame, keys: list) -> DataFrame:
+    # Log buckets only exist for positive readings; broken negative readings
+    # are left out of the sketch rather than distorting its low quantiles.
+    readingsDF = batchDF.where(col("heartrate") > 0)
+    bucketsDF = (
+        readingsDF.withColumn(
+            "bucket", ceil(log(SKETCH_GAMMA, col("heartrate"))).cast("integer")
+        )
+        .groupBy(*keys, "bucket")
+        .agg(count("*").alias("bucket_count"))
+        .groupBy(*keys)
+        .agg(
+            sum_("bucket_count").alias("count_heartrate"),
+            map_from_entries(collect_list(struct("bucket", "bucket_count"))).alias(
+                "heartrate_sketch"
+            ),
+        )
+    )
+    daysDF = readingsDF.groupBy(*keys).agg(
+        expr("hll_sketch_agg(CAST(p_eventdate AS STRING))").alias("days_sketch")
+    )
+    return bucketsDF.join(daysDF, keys)
+
+
+def merge_sketches(sketches: DataFrame, keys: list) -> DataFrame:
+    # Rolls sketches up to coarser keys, e.g. daily sketches per device into
+    # one sketch per device, without going back to silver.
+    bucketsDF = (
+        sketches.select(
+            *keys, explode("heartrate_sketch").alias("bucket", "bucket_count")
+        )
+        .groupBy(*keys, "bucket")
+        .agg(sum_("bucket_count").alias("bucket_count"))
+        .groupBy(*keys)
+        .agg(
+            sum_("bucket_count").alias("count_heartrate"),
+            map_from_entries(collect_list(struct("bucket", "bucket_count"))).alias(
+                "heartrate_sketch"
+            ),
+        )
+    )
+    daysDF = sketches.groupBy(*keys).agg(
+        expr("hll_union_agg(days_sketch)").alias("days_sketch")
+    )
+    return bucketsDF.join(daysDF, keys)
+
+
+def transform_sketch_percentiles(
+    sketches: DataFrame, keys: list, percentiles: list = (0.5, 0.95, 0.99)
+) -> DataFrame:
+    bucketsDF = sketches.select(
+        *keys,
+        explode("heartrate_sketch").alias("bucket", "bucket_count"),
+        expr("hll_sketch_estimate(days_sketch)").alias("distinct_days"),
+    )
+    keyWindow = Window.partitionBy(*keys)
+    cumulativeDF = bucketsDF.select(
+        *keys,
+        "distinct_days",
+        # The bucket midpoint in relative terms, 2 * gamma^i / (gamma + 1).
+        (2 * pow_(lit(SKETCH_GAMMA), col("bucket")) / (SKETCH_GAMMA + 1)).alias(
+            "heartrate"
+        ),
+        sum_("bucket_count")
+        .over(keyWindow.orderBy("bucket"))
+        .alias("cumulative_count"),
+        sum_("bucket_count").over(keyWindow).alias("total_count"),
+    )
+    return cumulativeDF.groupBy(*keys).agg(
+        first("distinct_days").alias("distinct_days"),
+        *[
+            min_(
+                when(
+                    col("cumulative_count") >= col("total_count") * percentile,
+                    col("heartrate"),
+                )
+            ).alias(f"p{percentile * 100:g}_heartrate".replace(".", "_"))
+            for percentile in percentiles
+        ],
+    )
+
+
+def transform_summary_stats(summary: DataFrame) -> DataFrame:
+    n = col("count_heartrate")
+    total = col("sum_heartrate")
+    return summary.withColumn("mean_heartrate", total / n).withColumn(
+        "std_heartrate",
+        sqrt(
+            greatest((col("sum_sq_heartrate") - total * total / n) / (n - 1), lit(0.0))
+        ),
+    )
+
+
+def transform_histogram_percentiles(
+    histogram: DataFrame, keys: list, percentiles: list = (0.5, 0.95, 0.99)
+) -> DataFrame:
+    # Each percentile is the lower edge of the first bucket whose cumulative
+    # count reaches it, so it is exact to within one bucket width.
+    keyWindow = Window.partitionBy(*keys)
+    cumulativeDF = histogram.select(
+        *keys,
+        "heartrate_bucket",
+        sum_("count_heartrate")
+        .over(keyWindow.orderBy("heartrate_bucket"))
+        .alias("cumulative_count"),
+        sum_("count_heartrate").over(keyWindow).alias("total_count"),
+    )
+    return cumulativeDF.groupBy(*keys).agg(
+        *[
+            min_(
+                when(
+                    col("cumulative_count") >= col("total_count") * percentile,
+                    col("heartrate_bucket"),
+                )
+            ).alias(f"p{percentile * 100:g}_heartrate".replace(".", "_"))
+            for percentile in percentiles
+        ]
+    )
+
+
 # COMMAND ----------
 
 def transform_silver_mean_agg_last_thirty(silver: DataFrame) -> DataFrame:
-    health_tracker_gold_aggregate_heartrate = spark.read.table(
-        "health_tracker_gold_aggregate_heartrate"
+    # Readings after the reference date are kept, as they always have been, so
+    # the March data loaded in 05_schema_enforcement stays in the result.
+    return transform_silver_rolling_agg(
+        silver.sparkSession,
+        silver,
+        reference_date="2020-03-01",
+        days=30,
+        include_later=True,
     )
-    return silver.join(
-        spark.read.table("health_tracker_gold_aggregate_heartrate"), "device_id"
-    ).where("p_eventdate > cast('2020-03-01' AS DATE) - 30")
 
+
+def transform_silver_rolling_agg(
+    spark: SparkSession,
+    silver: DataFrame,
+    reference_date: str,
+    days: int = 30,
+    goldTable: str = "health_tracker_gold_aggregate_heartrate",
+    tables: "TableRegistry" = None,
+    include_later: bool = False,
+) -> DataFrame:
+    # Filtering on the partition column before the join lets the scan prune
+    # every p_eventdate outside the window; the per-device gold table is tiny.
+    end_date = lit(reference_date).cast("date")
+    window_filter = col("p_eventdate") > date_sub(end_date, days)
+    if not include_later:
+        window_filter = window_filter & (col("p_eventdate") <= end_date)
+    goldDF = spark.read.table(goldTable) if tables is None else tables.read(goldTable)
+    return silver.where(window_filter).join(broadcast(goldDF), "device_id")
+
+
+def transform_daily_agg_rolling(
+    daily: DataFrame, reference_date: str, days: int = 30
+) -> DataFrame:
+    # Rolling the window forward only re-reads N daily partials per device
+    # from the table maintained by create_daily_agg_writer, never silver.
+    end_date = lit(reference_date).cast("date")
+    return transform_daily_agg_mean_agg(
+        daily.where(
+            (col("p_eventdate") > date_sub(end_date, days))
+            & (col("p_eventdate") <= end_date)
+        )
+    )
@@ -1,10 +1,14 @@
 # Databricks notebook source
 
+from contextlib import contextmanager
+
 from delta.tables import DeltaTable
 from pyspark.sql import DataFrame
 from pyspark.sql.functions import (
     col,
     current_timestamp,
+    explode,
+    expr,
     from_json,
     from_unixtime,
     lag,
@@ -18,6 +22,54 @@ from pyspark.sql.session import SparkSession
 from pyspark.sql.streaming import DataStreamWriter
 from pyspark.sql.window import Window
 
+# COMMAND ----------
+
+# Throughput profiles set the trigger, the source admission limits and the
+# shuffle partition count together, since each only helps in combination.
+# maxBytesPerTrigger is only honoured by the Delta source.
+STREAM_PROFILES = {
+    "low_latency": {
+        "trigger": {"processingTime": "1 second"},
+        "maxFilesPerTrigger": 1,
+        "maxBytesPerTrigger": "64m",
+        "shuffle_partitions": 8,
+    },
+    "balanced": {
+        "trigger": {"processingTime": "10 seconds"},
+        "maxFilesPerTrigger": 100,
+        "maxBytesPerTrigger": "1g",
+        "shuffle_partitions": 64,
+    },
+    "bulk_backfill": {
+        "trigger": {"processingTime": "1 minute"},
+        "maxFilesPerTrigger": 1000,
+        "maxBytesPerTrigger": "10g",
+        "shuffle_partitions": 200,
+    },
+    "available_now": {
+        "trigger": {"availableNow": True},
+        "maxFilesPerTrigger": 1000,
+        "maxBytesPerTrigger": "10g",
+        "shuffle_partitions": 200,
+    },
+}
+
+
+@contextmanager
+def apply_stream_profile(spark: SparkSession, profile: str):
+    # A query copies the session conf when it starts, so the shuffle partition
+    # count is only set around start() and every other query keeps its own.
+    # Stateful queries keep the count recorded in their first checkpoint, so
+    # it only changes for a query started on a new checkpoint.
+    settings = STREAM_PROFILES[profile]
+    previous = spark.conf.get("spark.sql.shuffle.partitions")
+    spark.conf.set("spark.sql.shuffle.partitions", settings["shuffle_partitions"])
+    try:
+        yield settings
+    finally:
+        spark.conf.set("spark.sql.shuffle.partitions", previous)
+
+
 # COMMAND ----------
 
 def create_stream_writer(
@@ -27,6 +79,7 @@ def create_stream_writer(
     partition_column: str,
     mode: str = "append",
     mergeSchema: bool = False,
+    profile: str = None,
 ) -> DataStreamWriter:
 
     stream_writer = (
@@ -39,6 +92,8 @@ def create_stream_writer(
 
     if mergeSchema:
         stream_writer = stream_writer.option("mergeSchema", True)
+    if profile is not None:
+        stream_writer = stream_writer.trigger(**STREAM_PROFILES[profile]["trigger"])
     if partition_column is not None:
         stream_writer = stream_writer.partitionBy(partition_column)
     return stream_writer
@@ -46,15 +101,31 @@ def create_stream_writer(
 
 # COMMAND ----------
 
-def read_stream_delta(spark: SparkSession, deltaPath: str) -> DataFrame:
-    return spark.readStream.format("delta").load(deltaPath)
+def read_stream_delta(
+    spark: SparkSession, deltaPath: str, profile: str = None
+) -> DataFrame:
+    stream_reader = spark.readStream.format("delta")
+    if profile is not None:
+        settings = STREAM_PROFILES[profile]
+        stream_reader = stream_reader.option(
+            "maxFilesPerTrigger", settings["maxFilesPerTrigger"]
+        ).option("maxBytesPerTrigger", settings["maxBytesPerTrigger"])
+    return stream_reader.load(deltaPath)
 
 
 # COMMAND ----------
 
-def read_stream_raw(spark: SparkSession, rawPath: str) -> DataFrame:
+def read_stream_raw(
+    spark: SparkSession, rawPath: str, profile: str = None
+) -> DataFrame:
     kafka_schema = "value STRING"
-    return spark.readStream.format("text").schema(kafka_schema).load(rawPath)
+    stream_reader = spark.readStream.format("text").schema(kafka_schema)
+    if profile is not None:
+        settings = STREAM_PROFILES[profile]
+        stream_reader = stream_reader.option(
+            "maxFilesPerTrigger", settings["maxFilesPerTrigger"]
+        )
+    return stream_reader.load(rawPath)
 
 
 # COMMAND ----------
@@ -99,24 +170,134 @@ def update_silver_table(spark: SparkSession, silverPath: str) -> bool:
 
 # COMMAND ----------
 
-def transform_bronze(bronze: DataFrame) -> DataFrame:
+# Every bronze JSON schema seen so far, keyed by version. Fields are listed in
+# silver column order, with time standing in for eventtime.
+BRONZE_SCHEMAS = {
+    1: "device_id INTEGER, heartrate DOUBLE, time FLOAT, name STRING",
+    2: (
+        "device_id INTEGER, device_type STRING, heartrate DOUBLE, time FLOAT, "
+        "name STRING"
+    ),
+}
+
+
+def register_bronze_schema(json_schema: str) -> int:
+    version = sorted(BRONZE_SCHEMAS)[-1] + 1
+    BRONZE_SCHEMAS[version] = json_schema
+    return version
+
+
+def detect_bronze_schema_version(bronze: DataFrame) -> int:
+    # Every record is checked, since a single record with an unregistered
+    # field would otherwise have that field silently dropped by from_json.
+    # json_object_keys only reached the Python API in Spark 3.5, hence expr.
+    fields = {
+        row.field
+        for row in bronze.select(
+            explode(expr("json_object_keys(value)")).alias("field")
+        )
+        .distinct()
+        .collect()
+    }
+    # The narrowest schema that covers the batch avoids parsing fields that
+    # this batch never sends.
+    for version in sorted(BRONZE_SCHEMAS):
+        if fields <= _schema_fields(BRONZE_SCHEMAS[version]):
+            return version
+    raise ValueError(
+        "No registered bronze schema covers the fields {}.".format(
+            ", ".join(sorted(fields))
+        )
+    )
+
 
-    json_schema = "device_id INTEGER, heartrate DOUBLE, device_type STRING, name STRING, time FLOAT"
+def _schema_fields(json_schema: str) -> set:
+    return {field.split()[0] for field in json_schema.split(",")}
+
+
+# COMMAND ----------
+
+def transform_bronze(bronze: DataFrame, schema_version: int = 2) -> DataFrame:
+
+    json_schema = BRONZE_SCHEMAS[schema_version]
+    columns = [field.split()[0] for field in json_schema.split(",")]
 
     return (
         bronze.select(from_json(col("value"), json_schema).alias("nested_json"))
         .select("nested_json.*")
         .select(
-            "device_id",
-            "device_type",
-            "heartrate",
-            from_unixtime("time").cast("timestamp").alias("eventtime"),
-            "name",
+            *[
+                from_unixtime("time").cast("timestamp").alias("eventtime")
+                if column == "time"
+                else column
+                for column in columns
+            ],
             from_unixtime("time").cast("date").alias("p_eventdate"),
         )
     )
 
 
+# COMMAND ----------
+
+def create_schema_aware_stream_writer(
+    dataframe: DataFrame,
+    checkpoint: str,
+    name: str,
+    deltaPath: str,
+    partition_column: str = None,
+) -> DataStreamWriter:
+    def append_detected_batch(batchDF: DataFrame, batch_id: int):
+        _append_detected_batch(batchDF, batch_id, name, deltaPath, partition_column)
+
+    return (
+        dataframe.writeStream.foreachBatch(append_detected_batch)
+        .option("checkpointLocation", checkpoint)
+        .queryName(name)
+    )
+
+
+def _append_detected_batch(
+    batchDF: DataFrame,
+    batch_id: int,
+    name: str,
+    deltaPath: str,
+    partition_column: str,
+):
+    spark = batchDF.sparkSession
+    # The batch is scanned once to detect its schema and again to parse it.
+    batchDF = batchDF.persist()
+    silverDF = transform_bronze(batchDF, detect_bronze_schema_version(batchDF))
+
+    batch_writer = (
+        silverDF.write.format("delta")
+        .mode("append")
+        .option("txnAppId", _txn_app_id(batchDF, name))
+        .option("txnVersion", batch_id)
+    )
+    # Schema evolution is only requested when the batch brings a column that
+    # silver does not have yet; narrower batches append with nulls.
+    if DeltaTable.isDeltaTable(spark, deltaPath):
+        silver_columns = set(spark.read.format("delta").load(deltaPath).columns)
+        if set(silverDF.columns) - silver_columns:
+            batch_writer = batch_writer.option("mergeSchema", True)
+    if partition_column is not None:
+        batch_writer = batch_writer.partitionBy(partition_column)
+    batch_writer.save(deltaPath)
+
+    batchDF.unpersist()
+
+
+def _txn_app_id(batchDF: DataFrame, name: str) -> str:
+    # Batch ids start over at 0 on a new checkpoint, e.g. after
+    # retire_checkpoint, so with the name alone Delta would skip the new
+    # checkpoint's first batches as already written. The query id is stored in
+    # the checkpoint, so it stays the same across restarts of the same one.
+    query_id = batchDF.sparkSession.sparkContext.getLocalProperty(
+        "sql.streaming.queryId"
+    )
+    return name if query_id is None else f"{name}:{query_id}"
+
+
 # COMMAND ----------
 
 def transform_raw(raw: DataFrame) -> DataFrame:
@@ -0,0 +1,225 @@
+# Databricks notebook source
+
+import time
+
+from delta.tables import DeltaTable
+from pyspark.sql.session import SparkSession
+from pyspark.sql.streaming import StreamingQuery
+
+from main.python.operations import create_stream_writer
+from main.python.storage import delete_path
+
+# COMMAND ----------
+
+# A stage is a dict with:
+#   name        query name, unique within the pipeline
+#   source      callable(spark) -> streaming DataFrame
+#   checkpoint  checkpoint location, unique within the pipeline
+#   path        Delta table the stage writes and downstream stages read
+#   writer      optional callable(dataframe, checkpoint, name) -> DataStreamWriter,
+#               create_stream_writer appending to path by default
+#   foreach_batch  True when the writer already knows its sink, so the query is
+#               started without a path
+#   upstream    names of the stages whose output the source reads
+#
+# For example, with the functions in operations:
+#   {
+#       "name": "write_raw_to_bronze",
+#       "source": lambda spark: transform_raw(read_stream_raw(spark, rawPath)),
+#       "writer": lambda dataframe, checkpoint, name: create_stream_writer(
+#           dataframe, checkpoint, name, partition_column="p_ingestdate"
+#       ),
+#       "checkpoint": bronzeCheckpoint,
+#       "path": bronzePath,
+#   }
+
+
+class PipelineRunner:
+    def __init__(
+        self,
+        spark: SparkSession,
+        stages: list,
+        conf: dict = None,
+        trigger: dict = None,
+        once: bool = False,
+        max_restarts: int = 5,
+        backoff_seconds: float = 5.0,
+        max_backoff_seconds: float = 300.0,
+        poll_seconds: float = 1.0,
+    ):
+        self.spark = spark
+        self.stages = {stage["name"]: stage for stage in _topological_order(stages)}
+        self.conf = conf or {}
+        # With once=True every stage processes what is available and stops, and
+        # a stage only starts after its upstream stages have finished.
+        self.trigger = {"availableNow": True} if once else trigger
+        self.once = once
+        self.max_restarts = max_restarts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.queries = {}
+        self.restarts = {name: 0 for name in self.stages}
+        self.retry_at = {}
+        self.finished = set()
+
+    def reset(self) -> list:
+        self._ensure_stopped()
+        removed = []
+        for stage in self.stages.values():
+            for path in [stage["checkpoint"], stage.get("path")]:
+                if path is not None and delete_path(self.spark, path):
+                    removed.append(path)
+        return removed
+
+    def start(self) -> dict:
+        for key, value in self.conf.items():
+            self.spark.conf.set(key, value)
+        self._start_ready_stages()
+        return self.queries
+
+    def run(self, timeout: float = None) -> bool:
+        # Keeps the pipeline alive, restarting failed stages, until every stage
+        # has finished (only with once=True), or until the timeout expires.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.start()
+        while len(self.finished) < len(self.stages):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_seconds)
+            self.poll()
+        return True
+
+    def poll(self):
+        for name, query in list(self.queries.items()):
+            if query.isActive:
+                continue
+            error = query.exception()
+            del self.queries[name]
+            if error is None:
+                self.finished.add(name)
+                continue
+            if self.restarts[name] >= self.max_restarts:
+                self.stop()
+                raise RuntimeError(
+                    f"Stage {name} failed {self.restarts[name] + 1} times: {error}"
+                )
+            backoff = min(
+                self.backoff_seconds * 2 ** self.restarts[name],
+                self.max_backoff_seconds,
+            )
+            self.restarts[name] += 1
+            self.retry_at[name] = time.monotonic() + backoff
+            print(f"Stage {name} failed, restarting in {backoff:.0f}s: {error}")
+        self._start_ready_stages()
+
+    def stop(self):
+        # Downstream stages are stopped first, so none is left reading from a
+        # table whose writer has already gone away.
+        for name in reversed(list(self.stages)):
+            query = self.queries.pop(name, None)
+            if query is not None and query.isActive:
+                query.stop()
+                query.awaitTermination()
+        self.retry_at.clear()
+
+    def _start_ready_stages(self):
+        for name, stage in self.stages.items():
+            if name in self.queries or name in self.finished:
+                continue
+            if self.retry_at.get(name, 0) > time.monotonic():
+                continue
+            if not self._upstream_ready(stage):
+                if self.once and self._upstream_finished_empty(stage):
+                    # Nothing was written upstream, so there is nothing to read.
+                    self.finished.add(name)
+                continue
+            self.retry_at.pop(name, None)
+            self.queries[name] = self._start_stage(stage)
+
+    def _upstream_ready(self, stage: dict) -> bool:
+        for upstream in stage.get("upstream", []):
+            if self.once and upstream not in self.finished:
+                return False
+            # A streaming read of a Delta path fails until its first commit.
+            upstreamPath = self.stages[upstream].get("path")
+            if upstreamPath is not None and not DeltaTable.isDeltaTable(
+                self.spark, upstreamPath
+            ):
+                return False
+        return True
+
+    def _upstream_finished_empty(self, stage: dict) -> bool:
+        upstreams = stage.get("upstream", [])
+        return all(upstream in self.finished for upstream in upstreams) and any(
+            self.stages[upstream].get("path") is not None
+            and not DeltaTable.isDeltaTable(self.spark, self.stages[upstream]["path"])
+            for upstream in upstreams
+        )
+
+    def _start_stage(self, stage: dict) -> StreamingQuery:
+        name = stage["name"]
+        # Starting a second query on the same checkpoint fails or, worse,
+        # duplicates work, so a query that is already running is adopted.
+        for query in self.spark.streams.active:
+            if query.name == name:
+                return query
+
+        dataframe = stage["source"](self.spark)
+        if "writer" in stage:
+            writer = stage["writer"](dataframe, stage["checkpoint"], name)
+        else:
+            writer = create_stream_writer(
+                dataframe, stage["checkpoint"], name, deltaPath=stage.get("path")
+            )
+        if self.trigger is not None:
+            writer = writer.trigger(**self.trigger)
+        if stage.get("foreach_batch", False):
+            return writer.start()
+        return writer.start(stage["path"])
+
+    def _ensure_stopped(self):
+        active = {query.name for query in self.spark.streams.active}
+        running = [name for name in self.stages if name in active]
+        if running:
+            raise RuntimeError(
+                "Cannot reset while stages are running: {}".format(", ".join(running))
+            )
+
+
+# COMMAND ----------
+
+def _topological_order(stages: list) -> list:
+    by_name = {}
+    checkpoints = {}
+    for stage in stages:
+        if stage["name"] in by_name:
+            raise ValueError(f"Duplicate stage name {stage['name']}")
+        if stage["checkpoint"] in checkpoints:
+            raise ValueError(
+                f"Stages {checkpoints[stage['checkpoint']]} and {stage['name']} "
+                f"share the checkpoint {stage['checkpoint']}"
+            )
+        by_name[stage["name"]] = stage
+        checkpoints[stage["checkpoint"]] = stage["name"]
+
+    ordered, visiting, visited = [], set(), set()
+
+    def visit(name: str):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Stage {name} is part of a cycle")
+        if name not in by_name:
+            raise ValueError(f"Unknown upstream stage {name}")
+        visiting.add(name)
+        for upstream in by_name[name].get("upstream", []):
+            visit(upstream)
+        visiting.remove(name)
+        visited.add(name)
+        ordered.append(by_name[name])
+
+    for stage in stages:
+        visit(stage["name"])
+    return ordered
+
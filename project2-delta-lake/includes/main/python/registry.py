@@ -0,0 +1,67 @@
+# Databricks notebook source
+
+import threading
+
+from delta.tables import DeltaTable
+from pyspark.sql import DataFrame
+from pyspark.sql.session import SparkSession
+from pyspark.sql.types import StructType
+
+from main.python.storage import latest_version
+
+# COMMAND ----------
+
+# Tables are looked up by an alias given at construction, e.g.
+# {"silver": silverPath}, by path, or by metastore table name. A metastore name
+# is resolved to its location once; after that a lookup only checks the latest
+# commit in _delta_log and rebuilds the cached entry when it has moved.
+class TableRegistry:
+    def __init__(self, spark: SparkSession, paths: dict = None):
+        self.spark = spark
+        self.paths = dict(paths or {})
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        if name in self.paths:
+            return self.paths[name]
+        if "/" in name:
+            return name
+        location = self.spark.sql(f"DESCRIBE DETAIL {name}").first()["location"]
+        self.paths[name] = location
+        return location
+
+    def version(self, name: str) -> int:
+        return latest_version(self.spark, self.path(name))
+
+    def _entry(self, name: str) -> dict:
+        path = self.path(name)
+        version = self.version(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry["version"] != version:
+                entry = {"version": version, "table": None, "dataframe": None}
+                self.entries[path] = entry
+            return entry
+
+    def table(self, name: str) -> DeltaTable:
+        entry = self._entry(name)
+        if entry["table"] is None:
+            entry["table"] = DeltaTable.forPath(self.spark, self.path(name))
+        return entry["table"]
+
+    def read(self, name: str) -> DataFrame:
+        entry = self._entry(name)
+        if entry["dataframe"] is None:
+            entry["dataframe"] = self.spark.read.format("delta").load(self.path(name))
+        return entry["dataframe"]
+
+    def schema(self, name: str) -> StructType:
+        return self.read(name).schema
+
+    def invalidate(self, name: str = None):
+        with self.lock:
+            if name is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(self.path(name), None)
@@ -0,0 +1,144 @@
+# Databricks notebook source
+
+import json
+from urllib.parse import unquote
+
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import col, input_file_name, lit, when
+from pyspark.sql.session import SparkSession
+
+from main.python.storage import read_files
+
+# COMMAND ----------
+
+def changed_files(
+    spark: SparkSession, deltaPath: str, start_version: int, end_version: int
+) -> dict:
+    if end_version <= start_version:
+        raise ValueError(
+            f"end_version {end_version} must be after start_version {start_version}"
+        )
+    root = deltaPath.rstrip("/")
+    commitFiles = [
+        f"{root}/_delta_log/{version:020d}.json"
+        for version in range(start_version + 1, end_version + 1)
+    ]
+    # Commit files are a few KB each, so the actions are parsed on the driver,
+    # in version order since a later commit can undo an earlier one.
+    rows = sorted(
+        spark.read.text(commitFiles)
+        .select("value", input_file_name().alias("file"))
+        .collect(),
+        key=lambda row: row.file,
+    )
+    added, removed, deletion_vectors = {}, {}, False
+    for row in rows:
+        action = json.loads(row.value)
+        if "add" in action:
+            path = action["add"]["path"]
+            deletion_vectors |= action["add"].get("deletionVector") is not None
+            # A file removed and restored again is part of both versions.
+            if removed.pop(path, None) is None:
+                added[path] = True
+        elif "remove" in action:
+            path = action["remove"]["path"]
+            deletion_vectors |= action["remove"].get("deletionVector") is not None
+            # A file added and removed again between the two versions was
+            # never visible at either of them.
+            if added.pop(path, None) is None:
+                removed[path] = True
+    return {
+        "added": [_absolute_path(root, path) for path in added],
+        "removed": [_absolute_path(root, path) for path in removed],
+        "deletion_vectors": deletion_vectors,
+    }
+
+
+def diff_versions(
+    spark: SparkSession,
+    deltaPath: str,
+    start_version: int,
+    end_version: int,
+    keys: list = None,
+) -> DataFrame:
+    files = changed_files(spark, deltaPath, start_version, end_version)
+    oldSchema = _schema_at(spark, deltaPath, start_version)
+    newSchema = _schema_at(spark, deltaPath, end_version)
+
+    if files["deletion_vectors"]:
+        # Rows hidden by a deletion vector are still in the parquet file, so
+        # the changed files alone cannot tell which rows changed.
+        oldDF = _read_version(spark, deltaPath, start_version)
+        newDF = _read_version(spark, deltaPath, end_version)
+    else:
+        # Every other file is shared by both snapshots, so rows that did not
+        # change cancel out between the removed and the added files. Removed
+        # files are gone once VACUUM has cleaned them up, in which case the
+        # read fails rather than returning a partial diff.
+        oldDF = read_files(spark, deltaPath, files["removed"], oldSchema)
+        newDF = read_files(spark, deltaPath, files["added"], newSchema)
+
+    # Columns added or dropped by a schema change are null on the other side.
+    oldDF = oldDF.unionByName(newDF.limit(0), allowMissingColumns=True)
+    newDF = newDF.unionByName(oldDF.limit(0), allowMissingColumns=True)
+    columns = oldDF.columns
+    deletedDF = oldDF.exceptAll(newDF.select(*columns))
+    insertedDF = newDF.select(*columns).exceptAll(oldDF)
+
+    if not keys:
+        return deletedDF.withColumn("_change_type", lit("delete")).unionByName(
+            insertedDF.withColumn("_change_type", lit("insert"))
+        )
+
+    updatedKeys = (
+        deletedDF.select(*keys)
+        .intersect(insertedDF.select(*keys))
+        .withColumn("_updated", lit(True))
+    )
+    return _label_changes(
+        deletedDF, updatedKeys, keys, "update_preimage", "delete"
+    ).unionByName(
+        _label_changes(insertedDF, updatedKeys, keys, "update_postimage", "insert")
+    )
+
+
+def summarize_diff(diffDF: DataFrame) -> dict:
+    return {
+        row["_change_type"]: row["count"]
+        for row in diffDF.groupBy("_change_type").count().collect()
+    }
+
+
+# COMMAND ----------
+
+def _label_changes(
+    changesDF: DataFrame,
+    updatedKeys: DataFrame,
+    keys: list,
+    updated_type: str,
+    change_type: str,
+) -> DataFrame:
+    return (
+        changesDF.join(updatedKeys, keys, "left")
+        .withColumn(
+            "_change_type",
+            when(col("_updated"), lit(updated_type)).otherwise(lit(change_type)),
+        )
+        .select(*changesDF.columns, "_change_type")
+    )
+
+
+def _absolute_path(root: str, path: str) -> str:
+    # Paths in the log are URL encoded and relative to the table, except for
+    # files of shallow clones, which are absolute.
+    if ":/" in path or path.startswith("/"):
+        return path
+    return f"{root}/{unquote(path)}"
+
+
+def _read_version(spark: SparkSession, deltaPath: str, version: int) -> DataFrame:
+    return spark.read.format("delta").option("versionAsOf", version).load(deltaPath)
+
+
+def _schema_at(spark: SparkSession, deltaPath: str, version: int):
+    return _read_version(spark, deltaPath, version).schema
@@ -0,0 +1,58 @@
+# Databricks notebook source
+
+import re
+
+from pyspark.sql import DataFrame
+from pyspark.sql.session import SparkSession
+
+# COMMAND ----------
+
+DELTA_COMMIT_FILE = re.compile(r"^(\d{20})\.json$")
+
+# The Hadoop file system API works for dbfs:/ and local paths alike, where
+# dbutils.fs is only available on Databricks.
+
+def file_system(spark: SparkSession, path: str):
+    hadoopPath = spark._jvm.org.apache.hadoop.fs.Path(path)
+    return hadoopPath.getFileSystem(spark._jsc.hadoopConfiguration()), hadoopPath
+
+
+def child(spark: SparkSession, parent, *names):
+    path = parent
+    for name in names:
+        path = spark._jvm.org.apache.hadoop.fs.Path(path, name)
+    return path
+
+
+def delete_path(spark: SparkSession, path: str) -> bool:
+    fs, hadoopPath = file_system(spark, path)
+    return fs.delete(hadoopPath, True)
+
+
+def latest_version(spark: SparkSession, deltaPath: str) -> int:
+    # Listing the log directory is a single file system call, where
+    # DeltaTable.forPath or history() would replay the log.
+    fs, logPath = file_system(spark, deltaPath.rstrip("/") + "/_delta_log")
+    versions = [
+        int(match.group(1))
+        for match in (
+            DELTA_COMMIT_FILE.match(status.getPath().getName())
+            for status in fs.listStatus(logPath)
+        )
+        if match
+    ]
+    return max(versions) if versions else -1
+
+
+# COMMAND ----------
+
+def read_files(
+    spark: SparkSession, deltaPath: str, files: list, schema=None
+) -> DataFrame:
+    # basePath keeps p_eventdate=... directories as a partition column, and
+    # the table schema keeps its type a DATE instead of an inferred one.
+    if schema is None:
+        schema = spark.read.format("delta").load(deltaPath).schema
+    if not files:
+        return spark.createDataFrame([], schema)
+    return spark.read.schema(schema).option("basePath", deltaPath).parquet(*files)
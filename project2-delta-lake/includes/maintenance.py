@@ -0,0 +1,348 @@
+# Databricks notebook source
+
+from datetime import datetime, timedelta
+import math
+import re
+import time
+from urllib.parse import unquote
+
+from delta.tables import DeltaTable
+from pyspark.sql.functions import col
+from pyspark.sql.session import SparkSession
+
+from main.python.operations import add_partition_columns, partition_columns
+
+# Days averaging under MIN_PARTITION_BYTES are merged into monthly partitions
+# and days over MAX_PARTITION_BYTES are split by device, which keeps partitions
+# between 256 MB and 1 GB; far smaller ones mostly add file listing and small
+# file overhead.
+MIN_PARTITION_BYTES = 256 << 20
+MAX_PARTITION_BYTES = 1 << 30
+
+def files_per_partition(
+    spark: SparkSession, deltaPath: str, partition_column: str = None
+) -> dict:
+    # inputFiles() lists the current snapshot from the Delta log and the
+    # partition value is taken from each file's directory, so no data is read.
+    counts = {}
+    for file in spark.read.format("delta").load(deltaPath).inputFiles():
+        partition = (
+            None
+            if partition_column is None
+            else _partition_value(file, partition_column)
+        )
+        counts[partition] = counts.get(partition, 0) + 1
+    return counts
+
+
+def _partition_value(file: str, partition_column: str) -> str:
+    match = re.search(f"/{re.escape(partition_column)}=([^/]*)/", file)
+    if match is None or match.group(1) == "__HIVE_DEFAULT_PARTITION__":
+        return None
+    return unquote(match.group(1))
+
+
+def compact_table(
+    spark: SparkSession,
+    deltaPath: str,
+    partition_column: str = None,
+    min_files: int = 16,
+    zorder_column: str = None,
+) -> list:
+    counts = files_per_partition(spark, deltaPath, partition_column)
+    partitions = [value for value, files in counts.items() if files >= min_files]
+    if not partitions:
+        return partitions
+
+    # Bin-packing is limited to the partitions over the threshold, so
+    # partitions that are already compact are not rewritten.
+    optimize = f"OPTIMIZE delta.`{deltaPath}`"
+    if partition_column is not None:
+        partition_literals = ", ".join(f"'{value}'" for value in sorted(partitions))
+        optimize += f" WHERE {partition_column} IN ({partition_literals})"
+    if zorder_column is not None:
+        optimize += f" ZORDER BY ({zorder_column})"
+    spark.sql(optimize)
+    return partitions
+
+
+def vacuum_table(
+    spark: SparkSession,
+    deltaPath: str,
+    retention_hours: int = 168,
+    every_hours: int = 24,
+) -> bool:
+    last_vacuum = (
+        DeltaTable.forPath(spark, deltaPath)
+        .history()
+        .where(col("operation").startswith("VACUUM"))
+        .agg({"timestamp": "max"})
+        .first()[0]
+    )
+    if last_vacuum is not None and datetime.now() - last_vacuum < timedelta(
+        hours=every_hours
+    ):
+        return False
+
+    DeltaTable.forPath(spark, deltaPath).vacuum(retention_hours)
+    return True
+
+
+def time_probe_query(
+    spark: SparkSession, deltaPath: str, probe_predicate: str = None
+) -> float:
+    probeDF = spark.read.format("delta").load(deltaPath)
+    if probe_predicate is not None:
+        probeDF = probeDF.where(probe_predicate)
+    start = time.perf_counter()
+    probeDF.count()
+    return time.perf_counter() - start
+
+
+def maintain_table(
+    spark: SparkSession,
+    deltaPath: str,
+    partition_column: str = None,
+    min_files: int = 16,
+    zorder_column: str = None,
+    probe_predicate: str = None,
+    retention_hours: int = 168,
+    every_hours: int = 24,
+) -> dict:
+    files_before = sum(files_per_partition(spark, deltaPath).values())
+    seconds_before = time_probe_query(spark, deltaPath, probe_predicate)
+
+    compacted = compact_table(
+        spark, deltaPath, partition_column, min_files, zorder_column
+    )
+    vacuumed = vacuum_table(spark, deltaPath, retention_hours, every_hours)
+
+    files_after = sum(files_per_partition(spark, deltaPath).values())
+    seconds_after = time_probe_query(spark, deltaPath, probe_predicate)
+
+    report = {
+        "path": deltaPath,
+        "compacted_partitions": len(compacted),
+        "vacuumed": vacuumed,
+        "files_before": files_before,
+        "files_after": files_after,
+        "query_seconds_before": seconds_before,
+        "query_seconds_after": seconds_after,
+    }
+    print(
+        "{path}: {files_before} -> {files_after} files, probe query "
+        "{query_seconds_before:.2f}s -> {query_seconds_after:.2f}s".format(**report)
+    )
+    return report
+
+
+def maintain_pipeline_tables(
+    spark: SparkSession,
+    bronzePath: str,
+    silverPath: str,
+    goldPaths: list = (),
+    **options,
+) -> list:
+    reports = [
+        maintain_table(spark, bronzePath, "p_ingestdate", **options),
+        maintain_table(
+            spark,
+            silverPath,
+            "p_eventdate",
+            zorder_column="device_id",
+            probe_predicate="device_id = 0",
+            **options,
+        ),
+    ]
+    # Gold tables are small aggregates and are usually not partitioned.
+    for goldPath in goldPaths:
+        reports.append(maintain_table(spark, goldPath, **options))
+    return reports
+
+
+def partition_profile(
+    spark: SparkSession, deltaPath: str, date_column: str = "p_eventdate"
+) -> dict:
+    detail = DeltaTable.forPath(spark, deltaPath).detail().first()
+    daily_rows = [
+        row["count"]
+        for row in spark.read.format("delta")
+        .load(deltaPath)
+        .groupBy(date_column)
+        .count()
+        .collect()
+    ]
+    total_rows = sum(daily_rows)
+    # Not max(), which is pyspark's in notebooks that %run operations.
+    max_daily_rows = sorted(daily_rows)[-1] if daily_rows else 0
+    # Bytes per day are estimated from the table's average row size, which
+    # holds whatever the current layout is.
+    bytes_per_row = detail["sizeInBytes"] / total_rows if total_rows else 0
+    return {
+        "path": deltaPath,
+        "partition_columns": list(detail["partitionColumns"]),
+        "files": detail["numFiles"],
+        "bytes": detail["sizeInBytes"],
+        "rows": total_rows,
+        "days": len(daily_rows),
+        "mean_daily_bytes": total_rows * bytes_per_row / len(daily_rows)
+        if daily_rows
+        else 0,
+        "max_daily_bytes": max_daily_rows * bytes_per_row,
+    }
+
+
+def recommend_partitioning(
+    spark: SparkSession,
+    deltaPath: str,
+    date_column: str = "p_eventdate",
+    min_partition_bytes: int = MIN_PARTITION_BYTES,
+    max_partition_bytes: int = MAX_PARTITION_BYTES,
+    month_column: str = "p_eventmonth",
+) -> dict:
+    profile = partition_profile(spark, deltaPath, date_column)
+    if profile["max_daily_bytes"] > max_partition_bytes:
+        # Bursty days are split by device, so a point lookup on one device
+        # still prunes to a single bucket of the day.
+        layout = "daily_device_bucket"
+        buckets = math.ceil(profile["max_daily_bytes"] / max_partition_bytes)
+    elif profile["mean_daily_bytes"] < min_partition_bytes:
+        layout, buckets = "monthly", None
+    else:
+        layout, buckets = "daily", None
+    return dict(
+        profile,
+        layout=layout,
+        buckets=buckets,
+        recommended_columns=partition_columns(layout, date_column, month_column),
+    )
+
+
+def repartition_table(
+    spark: SparkSession,
+    deltaPath: str,
+    layout: str,
+    date_column: str = "p_eventdate",
+    buckets: int = None,
+    probe_predicates: list = (),
+    month_column: str = "p_eventmonth",
+) -> dict:
+    # The overwrite rewrites every file of the table, and a stream reading
+    # the table fails on a commit that removes data. Streams in this session
+    # are checked here; streams elsewhere need skipChangeCommits, or a new
+    # checkpoint, to read on past the overwrite.
+    readers = _streams_reading(spark, deltaPath)
+    if readers:
+        raise RuntimeError(
+            "Cannot repartition {} while streams are reading it: {}".format(
+                deltaPath, ", ".join(readers)
+            )
+        )
+    columns = partition_columns(layout, date_column, month_column)
+    seconds_before = [
+        time_probe_query(spark, deltaPath, predicate) for predicate in probe_predicates
+    ]
+    files_before = DeltaTable.forPath(spark, deltaPath).detail().first()["numFiles"]
+
+    # The overwrite is a single Delta commit, so batch readers keep seeing the
+    # old layout until it lands. A stream appending meanwhile fails on the
+    # metadata change and picks the new layout up when it restarts.
+    (
+        add_partition_columns(
+            spark.read.format("delta").load(deltaPath),
+            layout,
+            date_column,
+            buckets,
+            month_column=month_column,
+        )
+        .write.format("delta")
+        .mode("overwrite")
+        .option("overwriteSchema", "true")
+        .partitionBy(*columns)
+        .save(deltaPath)
+    )
+    # Recorded on the table so writers can derive the same columns later.
+    spark.sql(
+        f"""
+    ALTER TABLE delta.`{deltaPath}` SET TBLPROPERTIES (
+      'health_tracker.partition_layout' = '{layout}',
+      'health_tracker.date_column' = '{date_column}',
+      'health_tracker.month_column' = '{month_column if layout == "monthly" else ""}',
+      'health_tracker.device_buckets' = '{buckets or 0}'
+    )
+    """
+    )
+
+    files_after = DeltaTable.forPath(spark, deltaPath).detail().first()["numFiles"]
+    seconds_after = [
+        time_probe_query(spark, deltaPath, predicate) for predicate in probe_predicates
+    ]
+    report = {
+        "path": deltaPath,
+        "layout": layout,
+        "partition_columns": columns,
+        "files_before": files_before,
+        "files_after": files_after,
+        "probes": [
+            {"predicate": predicate, "seconds_before": before, "seconds_after": after}
+            for predicate, before, after in zip(
+                probe_predicates, seconds_before, seconds_after
+            )
+        ],
+    }
+    print(
+        "{path}: repartitioned {layout} by {partition_columns}, "
+        "{files_before} -> {files_after} files".format(**report)
+    )
+    for probe in report["probes"]:
+        print(
+            "  {predicate}: {seconds_before:.2f}s -> "
+            "{seconds_after:.2f}s".format(**probe)
+        )
+    return report
+
+
+def _streams_reading(spark: SparkSession, deltaPath: str) -> list:
+    # A Delta source describes itself as DeltaSource[<table path>] in the
+    # progress of the streams reading it.
+    root = deltaPath.rstrip("/")
+    readers = []
+    for query in spark.streams.active:
+        progress = query.lastProgress
+        sources = progress["sources"] if progress is not None else []
+        if any(
+            source["description"].startswith("DeltaSource[")
+            and source["description"].rstrip("]").endswith(root)
+            for source in sources
+        ):
+            readers.append(query.name or str(query.id))
+    return readers
+
+
+def advise_partitioning(
+    spark: SparkSession,
+    deltaPath: str,
+    date_column: str = "p_eventdate",
+    apply: bool = False,
+    probe_predicates: list = (),
+    month_column: str = "p_eventmonth",
+    **thresholds,
+) -> dict:
+    advice = recommend_partitioning(
+        spark, deltaPath, date_column, month_column=month_column, **thresholds
+    )
+    print(
+        "{path}: {days} days, {mean_daily_bytes:,.0f} bytes/day on average, "
+        "recommended {layout} by {recommended_columns}".format(**advice)
+    )
+    if apply and advice["partition_columns"] != advice["recommended_columns"]:
+        advice["report"] = repartition_table(
+            spark,
+            deltaPath,
+            advice["layout"],
+            date_column,
+            advice["buckets"],
+            probe_predicates,
+            month_column,
+        )
+    return advice
@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import time
+
+import pytest
+from delta import configure_spark_with_delta_pip
+from pyspark import sql
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-rows",
+        default=None,
+        help="Comma separated synthetic row counts for benchmark tests, "
+        "e.g. 10000,1000000,50000000. Benchmarks only run when this or "
+        "-m benchmark is given.",
+    )
+    parser.addoption(
+        "--bench-json",
+        default=None,
+        help="Where to store benchmark timings, "
+        "defaults to .benchmarks/<commit>.json.",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: times an ETL hot path.")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Benchmarks take long and store their timings, so a plain test run skips them.
+    if "benchmark" in config.getoption("markexpr") or config.getoption("--bench-rows"):
+        return
+    skip = pytest.mark.skip(reason="needs -m benchmark or --bench-rows")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_generate_tests(metafunc):
+    if "rows" in metafunc.fixturenames:
+        bench_rows = metafunc.config.getoption("--bench-rows") or "10000"
+        metafunc.parametrize("rows", [int(row) for row in bench_rows.split(",")])
+
+
+@pytest.fixture(scope="session")
+def spark_session(request):
+    """Fixture for creating a spark context with the Delta extensions."""
+    spark = configure_spark_with_delta_pip(
+        sql.SparkSession.builder.master("local[8]")
+        .config("spark.sql.shuffle.partitions", 8)
+        .config("spark.sql.session.timeZone", "UTC")
+        .config("spark.sql.extensions", "io.delta.sql.DeltaSparkSessionExtension")
+        .config(
+            "spark.sql.catalog.spark_catalog",
+            "org.apache.spark.sql.delta.catalog.DeltaCatalog",
+        )
+    ).getOrCreate()
+    request.addfinalizer(lambda: spark.stop())
+
+    return spark
+
+
+class Timings:
+    def __init__(self):
+        self.results = []
+
+    def __call__(self, name: str, rows: int, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        self.results.append(
+            {
+                "name": name,
+                "rows": rows,
+                "seconds": seconds,
+                "rows_per_second": rows / seconds,
+            }
+        )
+        return result
+
+
+@pytest.fixture(scope="session")
+def timings(request):
+    """Fixture collecting benchmark timings and storing them per commit."""
+    timings = Timings()
+    yield timings
+
+    if not timings.results:
+        return
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
+    path = request.config.getoption("--bench-json") or os.path.join(
+        ".benchmarks", f"{commit or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as out:
+        json.dump({"commit": commit, "results": timings.results}, out, indent=2)
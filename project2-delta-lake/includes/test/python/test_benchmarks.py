@@ -0,0 +1,110 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Benchmarks for Operations
+# MAGIC
+# MAGIC Run with `pytest -m benchmark --bench-rows 10000,1000000,50000000`; timings are
+# MAGIC stored in `.benchmarks/<commit>.json`.
+
+# COMMAND ----------
+
+import pytest
+from pyspark.sql import DataFrame, SparkSession
+
+# COMMAND ----------
+
+from main.python.generators import generate_raw_data, generate_silver_data
+from main.python.operations import (
+    transform_bronze,
+    transform_json,
+    transform_raw,
+    transform_silver_daily_agg,
+    transform_silver_mean_agg,
+    update_silver_table,
+    update_silver_table_partitioned,
+)
+
+# COMMAND ----------
+
+pytestmark = pytest.mark.benchmark
+
+
+def materialize(dataframe: DataFrame):
+    dataframe.write.format("noop").mode("overwrite").save()
+
+
+def write_silver(spark: SparkSession, rows: int, silverPath: str) -> str:
+    (
+        generate_silver_data(spark, rows)
+        .write.format("delta")
+        .mode("overwrite")
+        .partitionBy("p_eventdate")
+        .save(silverPath)
+    )
+    spark.read.format("delta").load(silverPath).createOrReplaceTempView(
+        "health_tracker_plus_silver"
+    )
+    return silverPath
+
+
+# COMMAND ----------
+
+def test_benchmark_transform_raw(spark_session: SparkSession, timings, rows: int):
+    rawDF = generate_raw_data(spark_session, rows)
+    timings("transform_raw", rows, materialize, transform_raw(rawDF))
+
+
+def test_benchmark_transform_bronze(spark_session: SparkSession, timings, rows: int):
+    bronzeDF = transform_raw(generate_raw_data(spark_session, rows))
+    timings("transform_bronze", rows, materialize, transform_bronze(bronzeDF))
+
+
+def test_benchmark_transform_json(spark_session: SparkSession, timings, rows: int):
+    jsonDF = spark_session.read.json(
+        generate_raw_data(spark_session, rows).rdd.map(lambda row: row.value),
+        schema="device_id INTEGER, heartrate DOUBLE, name STRING, time FLOAT",
+    )
+    timings("transform_json", rows, materialize, transform_json(jsonDF))
+
+
+def test_benchmark_transform_silver_mean_agg(
+    spark_session: SparkSession, timings, rows: int
+):
+    silverDF = generate_silver_data(spark_session, rows)
+    timings(
+        "transform_silver_mean_agg", rows, materialize, transform_silver_mean_agg(silverDF)
+    )
+
+
+def test_benchmark_transform_silver_daily_agg(
+    spark_session: SparkSession, timings, rows: int
+):
+    silverDF = generate_silver_data(spark_session, rows)
+    timings(
+        "transform_silver_daily_agg",
+        rows,
+        materialize,
+        transform_silver_daily_agg(silverDF),
+    )
+
+
+# COMMAND ----------
+
+def test_benchmark_update_silver_table(
+    spark_session: SparkSession, timings, rows: int, tmp_path
+):
+    silverPath = write_silver(spark_session, rows, str(tmp_path / "silver"))
+    timings("update_silver_table", rows, update_silver_table, spark_session, silverPath)
+
+
+def test_benchmark_update_silver_table_partitioned(
+    spark_session: SparkSession, timings, rows: int, tmp_path
+):
+    silverPath = write_silver(spark_session, rows, str(tmp_path / "silver"))
+    timings(
+        "update_silver_table_partitioned",
+        rows,
+        update_silver_table_partitioned,
+        spark_session,
+        silverPath,
+    )
@@ -0,0 +1,106 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for Checkpoint Inspection
+
+# COMMAND ----------
+
+import shutil
+
+from pyspark.sql import SparkSession
+
+# COMMAND ----------
+
+from main.python.checkpoints import (
+    inspect_checkpoint,
+    inspect_pipeline_checkpoints,
+    prepare_recovery,
+)
+from main.python.generators import generate_silver_data
+from main.python.operations import (
+    create_stream_writer,
+    read_stream_delta,
+    transform_silver_mean_agg,
+)
+
+# COMMAND ----------
+
+def append_silver(spark: SparkSession, silverPath: str, rows: int, start_time: int):
+    (
+        generate_silver_data(spark, rows, devices=5, start_time=start_time)
+        .write.format("delta")
+        .mode("append")
+        .save(silverPath)
+    )
+
+
+def run_gold_stream(
+    spark: SparkSession, silverPath: str, checkpoint: str, goldPath: str
+):
+    create_stream_writer(
+        dataframe=transform_silver_mean_agg(read_stream_delta(spark, silverPath)),
+        checkpoint=checkpoint,
+        name="test_checkpoint_gold",
+        mode="complete",
+    ).trigger(availableNow=True).start(goldPath).awaitTermination()
+
+
+# COMMAND ----------
+
+def test_inspect_checkpoint(spark_session: SparkSession, tmp_path):
+    silverPath = str(tmp_path / "silver")
+    goldCheckpoint = str(tmp_path / "checkpoints" / "gold")
+    append_silver(spark_session, silverPath, 50, 1577836800)
+    run_gold_stream(spark_session, silverPath, goldCheckpoint, str(tmp_path / "gold"))
+
+    report = inspect_checkpoint(spark_session, goldCheckpoint, silverPath)
+    assert report["query_id"] is not None
+    assert report["last_commit_batch"] == report["last_offset_batch"]
+    assert report["uncommitted_batches"] == 0
+    assert report["orphaned_batches"] == []
+    assert report["state_files"] > 0 and report["state_bytes"] > 0
+    assert report["seconds_since_commit"] >= 0
+    assert "reservoirVersion" in report["source_offsets"][0]
+    lag = report["source_version_lag"]
+
+    append_silver(spark_session, silverPath, 50, 1578836800)
+    last_batch = report["last_offset_batch"]
+    offsets = tmp_path / "checkpoints" / "gold" / "offsets"
+    shutil.copy(offsets / str(last_batch), offsets / str(last_batch + 3))
+
+    report = inspect_checkpoint(spark_session, goldCheckpoint, silverPath)
+    assert report["source_version_lag"] == lag + 1
+    assert report["orphaned_batches"] == [last_batch + 3]
+
+    reports = inspect_pipeline_checkpoints(
+        spark_session,
+        {"gold": goldCheckpoint, "missing": str(tmp_path / "checkpoints" / "none")},
+    )
+    assert [report["name"] for report in reports] == ["gold"]
+
+
+# COMMAND ----------
+
+def test_prepare_recovery(spark_session: SparkSession, tmp_path):
+    silverPath = str(tmp_path / "silver")
+    goldCheckpoint = str(tmp_path / "checkpoints" / "gold")
+    goldPath = str(tmp_path / "gold")
+    append_silver(spark_session, silverPath, 50, 1577836800)
+    append_silver(spark_session, silverPath, 50, 1578836800)
+    run_gold_stream(spark_session, silverPath, goldCheckpoint, goldPath)
+
+    recovery = prepare_recovery(spark_session, goldCheckpoint, starting_version=1)
+
+    assert recovery == {"starting_version": 1, "starting_timestamp": None}
+    assert not (tmp_path / "checkpoints" / "gold").exists()
+    assert len(list((tmp_path / "checkpoints").glob("gold_retired_*"))) == 1
+
+    replayPath = str(tmp_path / "replay")
+    create_stream_writer(
+        dataframe=read_stream_delta(spark_session, silverPath, **recovery),
+        checkpoint=goldCheckpoint,
+        name="test_checkpoint_replay",
+    ).trigger(availableNow=True).start(replayPath).awaitTermination()
+
+    # Only the second append is read again, not the whole table.
+    assert spark_session.read.format("delta").load(replayPath).count() == 50
@@ -0,0 +1,79 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for the Silver Device Index
+
+# COMMAND ----------
+
+from datetime import datetime
+
+from delta.tables import DeltaTable
+from pyspark.sql import SparkSession
+
+# COMMAND ----------
+
+from main.python.device_index import read_silver_device, refresh_device_index
+
+# COMMAND ----------
+
+SILVER_SCHEMA = """
+    device_id INTEGER, heartrate DOUBLE, eventtime TIMESTAMP, name STRING, p_eventdate DATE
+"""
+
+
+def append_silver(spark: SparkSession, silverPath: str, readings: list) -> str:
+    (
+        spark.createDataFrame(
+            [
+                (device_id, heartrate, eventtime, f"device_{device_id}", eventtime.date())
+                for device_id, heartrate, eventtime in readings
+            ],
+            schema=SILVER_SCHEMA,
+        )
+        .coalesce(1)
+        .write.format("delta")
+        .mode("append")
+        .partitionBy("p_eventdate")
+        .save(silverPath)
+    )
+    return silverPath
+
+
+# COMMAND ----------
+
+def test_read_silver_device(spark_session: SparkSession, tmp_path):
+    silverPath = str(tmp_path / "silver")
+    indexPath = str(tmp_path / "silver_device_index")
+    for device_id in [0, 1, 2]:
+        append_silver(
+            spark_session,
+            silverPath,
+            [
+                (device_id, 60.0, datetime(2020, 1, 1, 0)),
+                (device_id, 70.0, datetime(2020, 1, 2, 0)),
+            ],
+        )
+
+    assert refresh_device_index(spark_session, silverPath, indexPath) == {
+        "added_files": 6,
+        "removed_files": 0,
+    }
+
+    deviceDF = read_silver_device(spark_session, silverPath, 1, indexPath)
+    assert len(deviceDF.inputFiles()) == 2
+    assert sorted(row.heartrate for row in deviceDF.collect()) == [60.0, 70.0]
+    assert deviceDF.schema == spark_session.read.format("delta").load(silverPath).schema
+
+    # Files written after the refresh are scanned until the next refresh.
+    append_silver(spark_session, silverPath, [(1, 80.0, datetime(2020, 1, 3, 0))])
+    deviceDF = read_silver_device(spark_session, silverPath, 1, indexPath)
+    assert len(deviceDF.inputFiles()) == 3
+    assert deviceDF.count() == 3
+
+    DeltaTable.forPath(spark_session, silverPath).delete("device_id = 0")
+    assert refresh_device_index(spark_session, silverPath, indexPath) == {
+        "added_files": 1,
+        "removed_files": 2,
+    }
+    assert read_silver_device(spark_session, silverPath, 0, indexPath).count() == 0
+    assert read_silver_device(spark_session, silverPath, 1).count() == 3
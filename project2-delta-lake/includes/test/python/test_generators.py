@@ -0,0 +1,53 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for Generators
+
+# COMMAND ----------
+
+import json
+
+# COMMAND ----------
+
+from main.python.generators import stream_raw_files
+
+# COMMAND ----------
+
+def test_stream_raw_files(tmp_path):
+    raw_path = str(tmp_path / "raw") + "/"
+
+    stats = stream_raw_files(
+        raw_path,
+        events_per_second=1000,
+        seconds=0.5,
+        devices=10,
+        negative_rate=0.05,
+        late_fraction=0.2,
+        device_type_fraction=0.5,
+        file_interval=0.1,
+        start_time=1577836800,
+        fs_root="",
+        seed=7,
+    )
+
+    readings = [
+        json.loads(line)
+        for file in (tmp_path / "raw").glob("*.json")
+        for line in file.read_text().splitlines()
+    ]
+    late = [
+        json.loads(line)
+        for file in (tmp_path / "raw" / "late").glob("*.json")
+        for line in file.read_text().splitlines()
+    ]
+    assert len(readings) + len(late) == stats["events"]
+    assert len(late) == stats["late_events"] > 0
+    assert all(reading["time"] >= 1577836800 for reading in readings)
+    assert all(reading["time"] < 1577836800 for reading in late)
+    assert {reading["device_id"] for reading in readings} <= set(range(10))
+    assert any("device_type" in reading for reading in readings)
+    assert any("device_type" not in reading for reading in readings)
+    assert sum(reading["heartrate"] < 0 for reading in readings + late) == (
+        stats["negative_events"]
+    )
+    assert not list((tmp_path / "raw").glob(".*.part"))
@@ -0,0 +1,258 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for Maintenance
+
+# COMMAND ----------
+
+import pytest
+from pyspark.sql import SparkSession
+
+# COMMAND ----------
+
+from main.python.generators import generate_silver_data
+from main.python.operations import (
+    add_partition_columns,
+    create_stream_writer,
+    create_validating_stream_writer,
+    partition_columns,
+    read_stream_delta,
+    table_partition_layout,
+)
+from maintenance import (
+    advise_partitioning,
+    compact_table,
+    files_per_partition,
+    maintain_table,
+    recommend_partitioning,
+    repartition_table,
+    vacuum_table,
+)
+
+# COMMAND ----------
+
+def write_daily_silver(spark: SparkSession, silverPath: str, rows: int, devices: int):
+    (
+        generate_silver_data(spark, rows, devices)
+        .write.format("delta")
+        .partitionBy("p_eventdate")
+        .save(silverPath)
+    )
+    return silverPath
+
+
+def write_small_files(spark: SparkSession, silverPath: str, appends: int):
+    # Each append adds one file to each of the two days it covers.
+    for append in range(appends):
+        (
+            generate_silver_data(spark, 96, 2, seed=append)
+            .coalesce(1)
+            .write.format("delta")
+            .mode("append")
+            .partitionBy("p_eventdate")
+            .save(silverPath)
+        )
+    return silverPath
+
+
+# COMMAND ----------
+
+def test_files_per_partition(spark_session: SparkSession, tmp_path):
+    silverPath = write_small_files(spark_session, str(tmp_path / "silver"), 3)
+
+    counts = files_per_partition(spark_session, silverPath, "p_eventdate")
+
+    assert counts == {"2020-01-01": 3, "2020-01-02": 3}
+    assert files_per_partition(spark_session, silverPath) == {None: 6}
+
+
+# COMMAND ----------
+
+def test_compact_table(spark_session: SparkSession, tmp_path):
+    silverPath = write_small_files(spark_session, str(tmp_path / "silver"), 4)
+    (
+        generate_silver_data(spark_session, 48, 2, start_time=1578009600)
+        .write.format("delta")
+        .mode("append")
+        .partitionBy("p_eventdate")
+        .save(silverPath)
+    )
+
+    compacted = compact_table(spark_session, silverPath, "p_eventdate", min_files=4)
+
+    assert sorted(compacted) == ["2020-01-01", "2020-01-02"]
+    counts = files_per_partition(spark_session, silverPath, "p_eventdate")
+    assert counts["2020-01-01"] == 1
+    assert counts["2020-01-02"] == 1
+    assert spark_session.read.format("delta").load(silverPath).count() == 4 * 96 + 48
+    assert compact_table(spark_session, silverPath, "p_eventdate", min_files=4) == []
+
+
+# COMMAND ----------
+
+def test_vacuum_table(spark_session: SparkSession, tmp_path):
+    silverPath = write_small_files(spark_session, str(tmp_path / "silver"), 1)
+
+    assert vacuum_table(spark_session, silverPath)
+    # The last VACUUM is less than every_hours old, so it is not repeated.
+    assert not vacuum_table(spark_session, silverPath)
+    assert vacuum_table(spark_session, silverPath, every_hours=0)
+
+
+# COMMAND ----------
+
+def test_maintain_table(spark_session: SparkSession, tmp_path):
+    silverPath = write_small_files(spark_session, str(tmp_path / "silver"), 4)
+
+    report = maintain_table(
+        spark_session,
+        silverPath,
+        "p_eventdate",
+        min_files=4,
+        zorder_column="device_id",
+        probe_predicate="device_id = 0",
+    )
+
+    assert report["compacted_partitions"] == 2
+    assert report["vacuumed"]
+    assert report["files_before"] == 8
+    assert report["files_after"] == 2
+    assert report["query_seconds_before"] > 0
+    assert report["query_seconds_after"] > 0
+
+
+# COMMAND ----------
+
+def test_recommend_partitioning(spark_session: SparkSession, tmp_path):
+    # 10 devices over 10 days gives tiny daily partitions.
+    silverPath = write_daily_silver(spark_session, str(tmp_path / "silver"), 2400, 10)
+
+    advice = recommend_partitioning(spark_session, silverPath)
+    assert advice["days"] == 10
+    assert advice["rows"] == 2400
+    assert advice["partition_columns"] == ["p_eventdate"]
+    assert advice["layout"] == "monthly"
+    assert advice["recommended_columns"] == ["p_eventmonth"]
+
+    advice = recommend_partitioning(
+        spark_session, silverPath, min_partition_bytes=1, max_partition_bytes=1 << 40
+    )
+    assert advice["layout"] == "daily"
+
+    advice = recommend_partitioning(
+        spark_session, silverPath, min_partition_bytes=1, max_partition_bytes=1
+    )
+    assert advice["layout"] == "daily_device_bucket"
+    assert advice["buckets"] > 1
+
+
+# COMMAND ----------
+
+def test_advise_partitioning_applies_layout(spark_session: SparkSession, tmp_path):
+    silverPath = write_daily_silver(spark_session, str(tmp_path / "silver"), 2400, 10)
+
+    advice = advise_partitioning(
+        spark_session, silverPath, apply=True, probe_predicates=["device_id = 0"]
+    )
+
+    report = advice["report"]
+    assert report["partition_columns"] == ["p_eventmonth"]
+    assert report["files_after"] <= report["files_before"]
+    assert [probe["predicate"] for probe in report["probes"]] == ["device_id = 0"]
+    silverDF = spark_session.read.format("delta").load(silverPath)
+    assert silverDF.count() == 2400
+    assert table_partition_layout(spark_session, silverPath) == {
+        "layout": "monthly",
+        "date_column": "p_eventdate",
+        "month_column": "p_eventmonth",
+        "buckets": None,
+    }
+    assert "report" not in advise_partitioning(spark_session, silverPath, apply=True)
+
+
+# COMMAND ----------
+
+def test_repartition_table_device_buckets(spark_session: SparkSession, tmp_path):
+    silverPath = write_daily_silver(spark_session, str(tmp_path / "silver"), 240, 10)
+
+    repartition_table(spark_session, silverPath, "daily_device_bucket", buckets=4)
+
+    layout = table_partition_layout(spark_session, silverPath)
+    assert layout == {
+        "layout": "daily_device_bucket",
+        "date_column": "p_eventdate",
+        "month_column": None,
+        "buckets": 4,
+    }
+    bucketsDF = add_partition_columns(
+        generate_silver_data(spark_session, 240, 10), **layout
+    )
+    assert {row.p_device_bucket for row in bucketsDF.collect()} <= set(range(4))
+    with pytest.raises(ValueError, match="bucket count"):
+        add_partition_columns(bucketsDF, "daily_device_bucket")
+
+
+# COMMAND ----------
+
+def test_repartition_table_month_column(spark_session: SparkSession, tmp_path):
+    silverPath = write_daily_silver(spark_session, str(tmp_path / "silver"), 240, 10)
+
+    report = repartition_table(
+        spark_session, silverPath, "monthly", month_column="p_month"
+    )
+
+    assert report["partition_columns"] == ["p_month"]
+    layout = table_partition_layout(spark_session, silverPath)
+    assert layout["month_column"] == "p_month"
+    assert partition_columns("monthly", "eventdate_utc") == ["p_eventmonth"]
+
+
+def test_stream_writers_follow_repartitioned_layout(
+    spark_session: SparkSession, tmp_path
+):
+    silverPath = write_daily_silver(spark_session, str(tmp_path / "silver"), 240, 10)
+    repartition_table(spark_session, silverPath, "monthly")
+    sourcePath = str(tmp_path / "source")
+    generate_silver_data(spark_session, 48, 2).write.format("delta").save(sourcePath)
+
+    create_stream_writer(
+        dataframe=read_stream_delta(spark_session, sourcePath),
+        checkpoint=str(tmp_path / "checkpoint"),
+        name="test_layout_stream_writer",
+        partition_column="p_eventdate",
+        deltaPath=silverPath,
+    ).trigger(availableNow=True).start(silverPath).awaitTermination()
+    create_validating_stream_writer(
+        dataframe=read_stream_delta(spark_session, sourcePath),
+        checkpoint=str(tmp_path / "validating_checkpoint"),
+        name="test_layout_validating_writer",
+        deltaPath=silverPath,
+        quarantinePath=str(tmp_path / "quarantine"),
+        partition_column="p_eventdate",
+    ).trigger(availableNow=True).start().awaitTermination()
+
+    silverDF = spark_session.read.format("delta").load(silverPath)
+    assert silverDF.count() == 240 + 2 * 48
+    assert silverDF.where("p_eventmonth IS NULL").count() == 0
+    assert table_partition_layout(spark_session, silverPath)["layout"] == "monthly"
+
+
+def test_repartition_table_refuses_while_streaming(
+    spark_session: SparkSession, tmp_path
+):
+    silverPath = write_daily_silver(spark_session, str(tmp_path / "silver"), 240, 10)
+    query = (
+        spark_session.readStream.format("delta")
+        .load(silverPath)
+        .writeStream.format("memory")
+        .queryName("test_repartition_reader")
+        .start()
+    )
+    query.processAllAvailable()
+
+    try:
+        with pytest.raises(RuntimeError, match="test_repartition_reader"):
+            repartition_table(spark_session, silverPath, "monthly")
+    finally:
+        query.stop()
+    assert table_partition_layout(spark_session, silverPath)["layout"] == "daily"
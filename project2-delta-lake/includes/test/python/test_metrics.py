@@ -0,0 +1,155 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for Metrics
+
+# COMMAND ----------
+
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import col
+
+# COMMAND ----------
+
+from main.python.generators import generate_silver_data
+from main.python.metrics import (
+    METRICS_SCHEMA,
+    StreamMetricsListener,
+    read_stream_metrics,
+    start_stream_metrics,
+    stop_stream_metrics,
+    stream_batch_latency_percentile,
+)
+from main.python.operations import (
+    STREAM_WRITER_NAMES,
+    STREAM_WRITER_SINKS,
+    create_stream_writer,
+    create_validating_stream_writer,
+    read_stream_delta,
+)
+
+# COMMAND ----------
+
+def progress_event(name: str, batch_id: int, sink: str, duration: int = 100):
+    return SimpleNamespace(
+        progress=SimpleNamespace(
+            name=name,
+            id="query-id",
+            runId="run-id",
+            batchId=batch_id,
+            timestamp="2020-01-01T00:00:00.000Z",
+            numInputRows=10,
+            inputRowsPerSecond=5.0,
+            processedRowsPerSecond=20.0,
+            batchDuration=duration,
+            durationMs={"addBatch": duration},
+            stateOperators=[SimpleNamespace(memoryUsedBytes=64, numRowsTotal=3)],
+            sink=SimpleNamespace(description=sink),
+        )
+    )
+
+
+def wait_for_progress(listener: StreamMetricsListener, names: set, timeout: float = 60):
+    # Progress events reach the listener asynchronously.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with listener.lock:
+            if names <= {row[0] for row in listener.buffer}:
+                return
+        time.sleep(0.1)
+
+
+# COMMAND ----------
+
+def test_stream_metrics_listener_buffers_pipeline_queries():
+    listener = StreamMetricsListener(
+        {"write_bronze", "validate_silver"}, {"validate_silver": "/silver"}
+    )
+
+    listener.onQueryProgress(progress_event("write_bronze", 0, "DeltaSink[/bronze]"))
+    listener.onQueryProgress(progress_event("validate_silver", 1, "ForeachBatchSink"))
+    listener.onQueryProgress(progress_event("ad_hoc", 0, "MemorySink"))
+
+    rows = listener.drain()
+    assert [(row[0], row[3], row[-1]) for row in rows] == [
+        ("write_bronze", 0, "/bronze"),
+        ("validate_silver", 1, "/silver"),
+    ]
+    assert rows[0][-3:-1] == (64, 3)
+    assert listener.drain() == []
+
+
+# COMMAND ----------
+
+def test_stream_metrics_record_output_files(spark_session: SparkSession, tmp_path):
+    sourcePath = str(tmp_path / "source")
+    generate_silver_data(spark_session, 100, devices=5).write.format("delta").save(
+        sourcePath
+    )
+    metricsPath = str(tmp_path / "metrics")
+    listener = start_stream_metrics(
+        spark_session,
+        metricsPath,
+        STREAM_WRITER_NAMES,
+        flush_interval=3600,
+        sink_paths=STREAM_WRITER_SINKS,
+    )
+
+    create_stream_writer(
+        dataframe=read_stream_delta(spark_session, sourcePath),
+        checkpoint=str(tmp_path / "append_checkpoint"),
+        name="test_metrics_append",
+    ).trigger(availableNow=True).start(str(tmp_path / "append")).awaitTermination()
+    create_validating_stream_writer(
+        dataframe=read_stream_delta(spark_session, sourcePath),
+        checkpoint=str(tmp_path / "validate_checkpoint"),
+        name="test_metrics_validate",
+        deltaPath=str(tmp_path / "validated"),
+        quarantinePath=str(tmp_path / "quarantine"),
+    ).trigger(availableNow=True).start().awaitTermination()
+    wait_for_progress(listener, {"test_metrics_append", "test_metrics_validate"})
+
+    assert stop_stream_metrics(spark_session, metricsPath, listener)
+
+    metrics = {
+        row.query_name: row
+        for row in read_stream_metrics(spark_session, metricsPath)
+        .where(col("num_input_rows") > 0)
+        .collect()
+    }
+    assert metrics["test_metrics_append"].sink_path.endswith("append")
+    assert metrics["test_metrics_append"].num_output_files > 0
+    assert metrics["test_metrics_validate"].sink_path == str(tmp_path / "validated")
+    assert metrics["test_metrics_validate"].num_output_files > 0
+
+
+# COMMAND ----------
+
+def test_stream_batch_latency_percentile(spark_session: SparkSession, tmp_path):
+    metricsPath = str(tmp_path / "metrics")
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    rows = [
+        ("test_latency", "query", "run", batch, now, 10, 1.0, 1.0, ms, {}, 0, 0, None)
+        for batch, ms in enumerate(range(100, 1100, 100))
+    ]
+    (
+        spark_session.createDataFrame(rows, METRICS_SCHEMA)
+        .withColumn("timestamp", col("timestamp").cast("timestamp"))
+        .write.format("delta")
+        .save(metricsPath)
+    )
+
+    assert stream_batch_latency_percentile(
+        spark_session, metricsPath, "test_latency", 0.5
+    ) == pytest.approx(500, abs=100)
+    assert stream_batch_latency_percentile(
+        spark_session, metricsPath, "test_latency", 0.95
+    ) == 1000
+    assert (
+        stream_batch_latency_percentile(spark_session, metricsPath, "test_other")
+        is None
+    )
@@ -5,33 +5,92 @@
 
 # COMMAND ----------
 
+import builtins
+import json
+from datetime import datetime
+
+import pyspark
 import pytest
-from pyspark.sql import SparkSession
+from pyspark.sql import DataFrame, SparkSession
+from pyspark.sql.functions import percentile_approx
 from pyspark.sql.types import *
 
 # COMMAND ----------
 
-from pyspark import sql
+import main.python.operations as operations
+import main.python.operations_v2 as operations_v2
+from main.python.checkpoints import retire_checkpoint
+from main.python.generators import (
+    generate_raw_data,
+    generate_silver_data,
+    write_raw_json,
+)
+from main.python.operations import (
+    SKETCH_AGGREGATES,
+    apply_stream_profile,
+    create_daily_agg_writer,
+    create_dedup_merge_writer,
+    create_gold_builder,
+    create_late_data_writer,
+    create_repairing_stream_writer,
+    create_stream_writer,
+    create_validating_stream_writer,
+    enable_change_data_feed,
+    merge_sketches,
+    read_stream_delta,
+    read_stream_json,
+    read_stream_raw,
+    stream_state_report,
+    transform_bronze,
+    transform_bronze_dedup,
+    transform_daily_agg_mean_agg,
+    transform_daily_agg_rolling,
+    transform_histogram_percentiles,
+    transform_json,
+    transform_raw,
+    transform_silver_daily_agg,
+    transform_silver_mean_agg,
+    transform_silver_mean_agg_last_thirty,
+    transform_silver_rolling_agg,
+    transform_sketch_percentiles,
+    transform_summary_stats,
+    transform_validate,
+    update_silver_table,
+    update_silver_table_incremental,
+    update_silver_table_partitioned,
+)
 
-"""
-For local testing it is necessary to instantiate the Spark Session in order to have 
-Delta Libraries installed prior to import in the next cell
+# COMMAND ----------
+
+SILVER_SCHEMA = """
+    device_id INTEGER, heartrate DOUBLE, eventtime TIMESTAMP, name STRING, p_eventdate DATE
 """
 
-spark = sql.SparkSession.builder.master("local[8]").getOrCreate()
 
-# COMMAND ----------
+def silver_rows(spark: SparkSession, readings: list) -> DataFrame:
+    """Build silver rows from (device_id, heartrate, eventtime) readings."""
+    return spark.createDataFrame(
+        [
+            (device_id, heartrate, eventtime, f"device_{device_id}", eventtime.date())
+            for device_id, heartrate, eventtime in readings
+        ],
+        schema=SILVER_SCHEMA,
+    )
 
-from main.python.operations import transform_raw
 
-# COMMAND ----------
+def write_delta(dataframe: DataFrame, deltaPath: str, partition_column: str = None):
+    writer = dataframe.write.format("delta").mode("append")
+    if partition_column is not None:
+        writer = writer.partitionBy(partition_column)
+    writer.save(deltaPath)
+    return deltaPath
 
-@pytest.fixture(scope="session")
-def spark_session(request):
-    """Fixture for creating a spark context."""
-    request.addfinalizer(lambda: spark.stop())
 
-    return spark
+def heartrates(spark: SparkSession, deltaPath: str) -> dict:
+    return {
+        (row.device_id, row.eventtime): row.heartrate
+        for row in spark.read.format("delta").load(deltaPath).collect()
+    }
 
 
 # COMMAND ----------
@@ -70,3 +129,809 @@ def test_transform_raw(spark_session: SparkSession):
         ]
     )
 
+
+# COMMAND ----------
+
+def test_transform_json_matches_transform_bronze(spark_session: SparkSession):
+    rawDF = spark_session.createDataFrame(
+        [
+            (0, 52.8139067501, "Deborah Powell", 1.5778368e9),
+            (0, 53.9078900098, "Deborah Powell", 1.5778404e9),
+            (1, -1.0, "Anthony Perez", 1.577844e9),
+        ],
+        schema="device_id INTEGER, heartrate DOUBLE, name STRING, time FLOAT",
+    )
+    bronzeDF = rawDF.selectExpr("to_json(struct(*)) AS value")
+
+    jsonDF = transform_json(rawDF)
+    expectedDF = transform_bronze(bronzeDF)
+
+    assert jsonDF.schema == expectedDF.schema
+    assert jsonDF.collect() == expectedDF.collect()
+
+
+# COMMAND ----------
+
+def test_transform_bronze(spark_session: SparkSession):
+    bronzeDF = transform_raw(generate_raw_data(spark_session, 100, devices=5))
+
+    silverDF = transform_bronze(bronzeDF)
+
+    assert silverDF.columns == [
+        "device_id",
+        "heartrate",
+        "eventtime",
+        "name",
+        "p_eventdate",
+    ]
+    assert silverDF.count() == 100
+
+
+# COMMAND ----------
+
+def test_transform_bronze_dedup(spark_session: SparkSession):
+    silverDF = generate_silver_data(spark_session, 100, devices=5)
+
+    dedupedDF = transform_bronze_dedup(silverDF.union(silverDF.limit(30)))
+
+    assert dedupedDF.count() == 100
+
+
+# COMMAND ----------
+
+def test_transform_silver_mean_agg(spark_session: SparkSession):
+    silverDF = silver_rows(
+        spark_session,
+        [
+            (0, 60.0, datetime(2020, 1, 1, 0)),
+            (0, 80.0, datetime(2020, 1, 1, 1)),
+            (1, 100.0, datetime(2020, 1, 1, 0)),
+        ],
+    )
+
+    aggregates = {row.device_id: row for row in transform_silver_mean_agg(silverDF).collect()}
+
+    assert aggregates[0].mean_heartrate == 70.0
+    assert aggregates[0].max_heartrate == 80.0
+    assert aggregates[1].mean_heartrate == 100.0
+
+
+# COMMAND ----------
+
+def test_transform_daily_agg_mean_agg_matches_mean_agg(spark_session: SparkSession):
+    silverDF = generate_silver_data(spark_session, 2400, devices=4)
+
+    mergedDF = transform_daily_agg_mean_agg(transform_silver_daily_agg(silverDF))
+
+    expected = {row.device_id: row for row in transform_silver_mean_agg(silverDF).collect()}
+    for row in mergedDF.collect():
+        assert row.mean_heartrate == pytest.approx(expected[row.device_id].mean_heartrate)
+        assert row.std_heartrate == pytest.approx(expected[row.device_id].std_heartrate)
+        assert row.max_heartrate == expected[row.device_id].max_heartrate
+
+
+# COMMAND ----------
+
+def test_transform_daily_agg_rolling(spark_session: SparkSession):
+    silverDF = generate_silver_data(spark_session, 2400, devices=4)
+    dailyDF = transform_silver_daily_agg(silverDF)
+
+    rollingDF = transform_daily_agg_rolling(dailyDF, "2020-01-10", days=3)
+
+    windowDF = silverDF.where("p_eventdate BETWEEN '2020-01-08' AND '2020-01-10'")
+    expected = {row.device_id: row for row in transform_silver_mean_agg(windowDF).collect()}
+    for row in rollingDF.collect():
+        assert row.mean_heartrate == pytest.approx(expected[row.device_id].mean_heartrate)
+
+
+# COMMAND ----------
+
+def test_transform_silver_rolling_agg(spark_session: SparkSession):
+    silverDF = generate_silver_data(spark_session, 2400, devices=4)
+    transform_silver_mean_agg(silverDF).createOrReplaceTempView("gold_aggregate")
+
+    rollingDF = transform_silver_rolling_agg(
+        spark_session, silverDF, "2020-01-10", days=3, goldTable="gold_aggregate"
+    )
+
+    assert rollingDF.count() == 3 * 24 * 4
+    assert "mean_heartrate" in rollingDF.columns
+
+
+# COMMAND ----------
+
+def test_transform_silver_mean_agg_last_thirty(spark_session: SparkSession):
+    # Ten days of February readings, all inside the 30 days before 2020-03-01,
+    # and two days of March readings, which are kept as well.
+    silverDF = generate_silver_data(
+        spark_session, 960, devices=4, start_time=1580515200
+    ).union(generate_silver_data(spark_session, 192, devices=4, start_time=1583020800))
+    transform_silver_mean_agg(silverDF).createOrReplaceTempView(
+        "health_tracker_gold_aggregate_heartrate"
+    )
+
+    assert transform_silver_mean_agg_last_thirty(silverDF).count() == 960 + 192
+
+
+# COMMAND ----------
+
+def test_update_silver_table(spark_session: SparkSession, tmp_path):
+    silverPath = write_delta(
+        silver_rows(
+            spark_session,
+            [
+                (0, 60.0, datetime(2020, 1, 1)),
+                (0, -1.0, datetime(2020, 1, 2)),
+                (0, 80.0, datetime(2020, 1, 3)),
+            ],
+        ),
+        str(tmp_path / "silver"),
+        "p_eventdate",
+    )
+    spark_session.read.format("delta").load(silverPath).createOrReplaceTempView(
+        "health_tracker_plus_silver"
+    )
+
+    assert update_silver_table(spark_session, silverPath)
+
+    assert heartrates(spark_session, silverPath)[(0, datetime(2020, 1, 2))] == 70.0
+
+
+# COMMAND ----------
+
+def test_update_silver_table_partitioned(spark_session: SparkSession, tmp_path):
+    silverPath = write_delta(
+        silver_rows(
+            spark_session,
+            [
+                (0, 60.0, datetime(2020, 1, 1, 0)),
+                (0, -1.0, datetime(2020, 1, 1, 1)),
+                (0, 80.0, datetime(2020, 1, 1, 2)),
+                (1, 100.0, datetime(2020, 1, 1, 0)),
+                (1, 110.0, datetime(2020, 1, 1, 1)),
+                (1, 120.0, datetime(2020, 1, 1, 2)),
+                (0, 50.0, datetime(2020, 1, 1, 23)),
+                (0, -5.0, datetime(2020, 1, 2, 0)),
+                (0, 70.0, datetime(2020, 1, 2, 1)),
+                (0, 40.0, datetime(2020, 1, 9, 0)),
+            ],
+        ),
+        str(tmp_path / "silver"),
+        "p_eventdate",
+    )
+
+    assert update_silver_table_partitioned(spark_session, silverPath)
+
+    repaired = heartrates(spark_session, silverPath)
+    assert repaired[(0, datetime(2020, 1, 1, 1))] == 70.0
+    assert repaired[(0, datetime(2020, 1, 2, 0))] == 60.0
+    assert repaired[(1, datetime(2020, 1, 1, 1))] == 110.0
+    assert not update_silver_table_partitioned(spark_session, silverPath)
+
+
+def test_update_silver_table_partitioned_consecutive_broken_readings(
+    spark_session: SparkSession, tmp_path
+):
+    silverPath = write_delta(
+        silver_rows(
+            spark_session,
+            [
+                (0, 60.0, datetime(2020, 1, 1, 0)),
+                (0, -1.0, datetime(2020, 1, 1, 1)),
+                (0, -1.0, datetime(2020, 1, 1, 2)),
+                (0, 80.0, datetime(2020, 1, 1, 3)),
+            ],
+        ),
+        str(tmp_path / "silver"),
+        "p_eventdate",
+    )
+
+    assert update_silver_table_partitioned(spark_session, silverPath)
+
+    repaired = heartrates(spark_session, silverPath)
+    assert repaired[(0, datetime(2020, 1, 1, 1))] == 70.0
+    assert repaired[(0, datetime(2020, 1, 1, 2))] == 70.0
+
+
+# COMMAND ----------
+
+def test_update_silver_table_incremental(spark_session: SparkSession, tmp_path):
+    silverPath = str(tmp_path / "silver")
+    repairCheckpoint = str(tmp_path / "repair")
+    write_delta(
+        silver_rows(
+            spark_session,
+            [
+                (0, 60.0, datetime(2020, 1, 1, 0)),
+                (0, -1.0, datetime(2020, 1, 1, 1)),
+                (0, 80.0, datetime(2020, 1, 1, 2)),
+                (0, -1.0, datetime(2020, 1, 1, 3)),
+            ],
+        ),
+        silverPath,
+        "p_eventdate",
+    )
+    enable_change_data_feed(spark_session, silverPath)
+
+    first_version = update_silver_table_incremental(
+        spark_session, silverPath, repairCheckpoint
+    )
+
+    # The trailing broken reading has no next neighbour yet.
+    repaired = heartrates(spark_session, silverPath)
+    assert repaired[(0, datetime(2020, 1, 1, 1))] == 70.0
+    assert repaired[(0, datetime(2020, 1, 1, 3))] == -1.0
+
+    write_delta(
+        silver_rows(spark_session, [(0, 90.0, datetime(2020, 1, 2, 0))]),
+        silverPath,
+        "p_eventdate",
+    )
+    second_version = update_silver_table_incremental(
+        spark_session, silverPath, repairCheckpoint
+    )
+
+    assert second_version > first_version
+    assert heartrates(spark_session, silverPath)[(0, datetime(2020, 1, 1, 3))] == 85.0
+
+
+def test_update_silver_table_incremental_enables_change_data_feed(
+    spark_session: SparkSession, tmp_path
+):
+    silverPath = str(tmp_path / "silver")
+    repairCheckpoint = str(tmp_path / "repair")
+    write_delta(
+        silver_rows(
+            spark_session,
+            [
+                (0, 60.0, datetime(2020, 1, 1, 0)),
+                (0, -1.0, datetime(2020, 1, 1, 1)),
+                (0, 80.0, datetime(2020, 1, 1, 2)),
+            ],
+        ),
+        silverPath,
+        "p_eventdate",
+    )
+
+    update_silver_table_incremental(spark_session, silverPath, repairCheckpoint)
+
+    assert heartrates(spark_session, silverPath)[(0, datetime(2020, 1, 1, 1))] == 70.0
+    spark_session.sql(
+        f"ALTER TABLE delta.`{silverPath}` "
+        "SET TBLPROPERTIES (delta.enableChangeDataFeed = false)"
+    )
+    with pytest.raises(ValueError, match="enableChangeDataFeed"):
+        update_silver_table_incremental(spark_session, silverPath, repairCheckpoint)
+
+
+# COMMAND ----------
+
+def test_create_stream_writer_raw_to_bronze(spark_session: SparkSession, tmp_path):
+    rawPath = write_raw_json(spark_session, 100, str(tmp_path / "raw"), devices=5)
+    bronzePath = str(tmp_path / "bronze")
+
+    create_stream_writer(
+        dataframe=transform_raw(read_stream_raw(spark_session, rawPath)),
+        checkpoint=str(tmp_path / "checkpoint"),
+        name="test_write_raw_to_bronze",
+        partition_column="p_ingestdate",
+    ).trigger(availableNow=True).start(bronzePath).awaitTermination()
+
+    assert spark_session.read.format("delta").load(bronzePath).count() == 100
+
+
+# COMMAND ----------
+
+def test_read_stream_delta_bronze_to_silver(spark_session: SparkSession, tmp_path):
+    bronzePath = write_delta(
+        transform_raw(generate_raw_data(spark_session, 100, devices=5)),
+        str(tmp_path / "bronze"),
+        "p_ingestdate",
+    )
+    silverPath = str(tmp_path / "silver")
+
+    create_stream_writer(
+        dataframe=transform_bronze(read_stream_delta(spark_session, bronzePath)),
+        checkpoint=str(tmp_path / "checkpoint"),
+        name="test_write_bronze_to_silver",
+        partition_column="p_eventdate",
+    ).trigger(availableNow=True).start(silverPath).awaitTermination()
+
+    assert spark_session.read.format("delta").load(silverPath).count() == 100
+
+
+# COMMAND ----------
+
+def test_read_stream_json(spark_session: SparkSession, tmp_path):
+    rawPath = write_raw_json(spark_session, 100, str(tmp_path / "raw"), devices=5)
+    silverPath = str(tmp_path / "silver")
+
+    create_stream_writer(
+        dataframe=transform_json(read_stream_json(spark_session, rawPath)),
+        checkpoint=str(tmp_path / "checkpoint"),
+        name="test_write_json_to_silver",
+        partition_column="p_eventdate",
+    ).trigger(availableNow=True).start(silverPath).awaitTermination()
+
+    assert spark_session.read.format("delta").load(silverPath).count() == 100
+
+
+# COMMAND ----------
+
+def test_stream_profile(spark_session: SparkSession, tmp_path):
+    shuffle_partitions = spark_session.conf.get("spark.sql.shuffle.partitions")
+    rawPath = write_raw_json(
+        spark_session, 100, str(tmp_path / "raw"), devices=5, files=4
+    )
+    bronzePath = str(tmp_path / "bronze")
+
+    # available_now stops by itself once every file has been admitted.
+    with apply_stream_profile(spark_session, "available_now") as settings:
+        query = create_stream_writer(
+            dataframe=transform_raw(
+                read_stream_raw(spark_session, rawPath, profile="available_now")
+            ),
+            checkpoint=str(tmp_path / "checkpoint"),
+            name="test_stream_profile",
+            partition_column="p_ingestdate",
+            profile="available_now",
+        ).start(bronzePath)
+    query.awaitTermination()
+
+    # The query keeps the profile's partition count; the session gets its own back.
+    offsets = (tmp_path / "checkpoint" / "offsets" / "0").read_text().splitlines()
+    assert json.loads(offsets[1])["conf"]["spark.sql.shuffle.partitions"] == "200"
+    assert spark_session.conf.get("spark.sql.shuffle.partitions") == shuffle_partitions
+    assert spark_session.read.format("delta").load(bronzePath).count() == 100
+    assert settings["maxFilesPerTrigger"] == 1000
+
+
+# COMMAND ----------
+
+def test_create_repairing_stream_writer(spark_session: SparkSession, tmp_path):
+    sourcePath = write_delta(
+        silver_rows(
+            spark_session,
+            [
+                (0, 60.0, datetime(2020, 1, 1, 0)),
+                (0, -1.0, datetime(2020, 1, 1, 1)),
+                (0, 80.0, datetime(2020, 1, 1, 2)),
+                (0, -1.0, datetime(2020, 1, 1, 3)),
+            ],
+        ),
+        str(tmp_path / "source"),
+    )
+    silverPath = str(tmp_path / "silver")
+    statePath = str(tmp_path / "state")
+
+    create_repairing_stream_writer(
+        dataframe=read_stream_delta(spark_session, sourcePath),
+        checkpoint=str(tmp_path / "checkpoint"),
+        name="test_repairing_stream_writer",
+        deltaPath=silverPath,
+        statePath=statePath,
+        partition_column="p_eventdate",
+    ).trigger(availableNow=True).start().awaitTermination()
+
+    repaired = heartrates(spark_session, silverPath)
+    assert repaired[(0, datetime(2020, 1, 1, 1))] == 70.0
+    assert repaired[(0, datetime(2020, 1, 1, 3))] == 80.0
+    state = spark_session.read.format("delta").load(statePath).collect()
+    assert [(row.device_id, row.heartrate) for row in state] == [(0, 80.0)]
+
+
+def test_repairing_stream_writer_holds_readings_without_neighbours(
+    spark_session: SparkSession, tmp_path
+):
+    sourcePath = str(tmp_path / "source")
+    silverPath = str(tmp_path / "silver")
+    statePath = str(tmp_path / "state")
+    batches = [
+        [
+            (0, 60.0, datetime(2020, 1, 1, 0)),
+            (1, -1.0, datetime(2020, 1, 1, 0)),
+            (1, -1.0, datetime(2020, 1, 1, 1)),
+        ],
+        [(1, 90.0, datetime(2020, 1, 1, 2))],
+    ]
+
+    held = []
+    for readings in batches:
+        write_delta(silver_rows(spark_session, readings), sourcePath)
+        create_repairing_stream_writer(
+            dataframe=read_stream_delta(spark_session, sourcePath),
+            checkpoint=str(tmp_path / "checkpoint"),
+            name="test_repairing_held_writer",
+            deltaPath=silverPath,
+            statePath=statePath,
+            partition_column="p_eventdate",
+        ).trigger(availableNow=True).start().awaitTermination()
+        held.append(
+            spark_session.read.format("delta").load(statePath).where("_held").count()
+        )
+
+    assert held == [2, 0]
+    assert heartrates(spark_session, silverPath) == {
+        (0, datetime(2020, 1, 1, 0)): 60.0,
+        (1, datetime(2020, 1, 1, 0)): 90.0,
+        (1, datetime(2020, 1, 1, 1)): 90.0,
+        (1, datetime(2020, 1, 1, 2)): 90.0,
+    }
+
+
+# COMMAND ----------
+
+def test_create_dedup_merge_writer(spark_session: SparkSession, tmp_path):
+    silverDF = generate_silver_data(spark_session, 100, devices=5)
+    sourcePath = write_delta(silverDF.union(silverDF.limit(30)), str(tmp_path / "source"))
+    silverPath = str(tmp_path / "silver")
+
+    # Replaying the same source from a fresh checkpoint must not add rows.
+    for run in range(2):
+        create_dedup_merge_writer(
+            dataframe=read_stream_delta(spark_session, sourcePath),
+            checkpoint=str(tmp_path / f"checkpoint_{run}"),
+            name=f"test_dedup_merge_writer_{run}",
+            deltaPath=silverPath,
+        ).trigger(availableNow=True).start().awaitTermination()
+
+    assert spark_session.read.format("delta").load(silverPath).count() == 100
+
+
+# COMMAND ----------
+
+def test_transform_validate(spark_session: SparkSession):
+    validatedDF = transform_validate(
+        silver_rows(
+            spark_session,
+            [
+                (0, 60.0, datetime(2020, 1, 1)),
+                (0, -1.0, datetime(2020, 1, 1)),
+                (None, 300.0, datetime(2020, 1, 1)),
+                (0, 60.0, datetime(2999, 1, 1)),
+            ],
+        )
+    )
+
+    assert [row.failed_rules for row in validatedDF.collect()] == [
+        [],
+        ["negative_heartrate"],
+        ["heartrate_above_250", "null_device_id"],
+        ["future_eventtime"],
+    ]
+    assert transform_validate(validatedDF.drop("failed_rules"), {}).where(
+        "size(failed_rules) > 0"
+    ).count() == 0
+
+
+def test_create_validating_stream_writer(spark_session: SparkSession, tmp_path):
+    sourcePath = write_delta(
+        silver_rows(
+            spark_session,
+            [
+                (0, 60.0, datetime(2020, 1, 1, 0)),
+                (0, -1.0, datetime(2020, 1, 1, 1)),
+                (1, 251.0, datetime(2020, 1, 1, 0)),
+                (1, 80.0, datetime(2020, 1, 2, 0)),
+            ],
+        ),
+        str(tmp_path / "source"),
+    )
+    silverPath = str(tmp_path / "silver")
+    quarantinePath = str(tmp_path / "quarantine")
+
+    create_validating_stream_writer(
+        dataframe=read_stream_delta(spark_session, sourcePath),
+        checkpoint=str(tmp_path / "checkpoint"),
+        name="test_validating_stream_writer",
+        deltaPath=silverPath,
+        quarantinePath=quarantinePath,
+        partition_column="p_eventdate",
+    ).trigger(availableNow=True).start().awaitTermination()
+
+    assert sorted(heartrates(spark_session, silverPath).values()) == [60.0, 80.0]
+    quarantined = spark_session.read.format("delta").load(quarantinePath).collect()
+    assert sorted((row.heartrate, row.failed_rules) for row in quarantined) == [
+        (-1.0, ["negative_heartrate"]),
+        (251.0, ["heartrate_above_250"]),
+    ]
+    assert all(row.quarantined_at is not None for row in quarantined)
+
+
+def test_create_validating_stream_writer_after_retired_checkpoint(
+    spark_session: SparkSession, tmp_path
+):
+    sourcePath = write_delta(
+        silver_rows(spark_session, [(0, 60.0, datetime(2020, 1, 1, 0))]),
+        str(tmp_path / "source"),
+    )
+    checkpoint = str(tmp_path / "checkpoint")
+    silverPath = str(tmp_path / "silver")
+
+    def validate(sourceDF: DataFrame):
+        create_validating_stream_writer(
+            dataframe=sourceDF,
+            checkpoint=checkpoint,
+            name="test_validating_retired_checkpoint",
+            deltaPath=silverPath,
+            quarantinePath=str(tmp_path / "quarantine"),
+        ).trigger(availableNow=True).start().awaitTermination()
+
+    validate(read_stream_delta(spark_session, sourcePath))
+    write_delta(
+        silver_rows(spark_session, [(0, 80.0, datetime(2020, 1, 1, 1))]), sourcePath
+    )
+    retire_checkpoint(spark_session, checkpoint)
+    # Batch ids of the new checkpoint start at 0 again and must not be taken
+    # for the batches the retired checkpoint already wrote.
+    validate(
+        spark_session.readStream.format("delta")
+        .option("startingVersion", 1)
+        .load(sourcePath)
+    )
+
+    assert sorted(heartrates(spark_session, silverPath).values()) == [60.0, 80.0]
+
+
+# COMMAND ----------
+
+def test_create_gold_builder(spark_session: SparkSession, tmp_path):
+    silverPath = str(tmp_path / "silver")
+    silverDF = generate_silver_data(spark_session, 2400, devices=4)
+    write_delta(silverDF.where("p_eventdate < '2020-01-13'"), silverPath)
+    write_delta(silverDF.where("p_eventdate >= '2020-01-13'"), silverPath)
+    goldPath = str(tmp_path / "gold") + "/"
+
+    # Replaying both batches from a fresh checkpoint must not count them twice.
+    for run in range(2):
+        create_gold_builder(
+            dataframe=spark_session.readStream.format("delta")
+            .option("maxFilesPerTrigger", 1)
+            .load(silverPath),
+            checkpoint=str(tmp_path / f"checkpoint_{run}"),
+            name=f"test_gold_builder_{run}",
+            goldPath=goldPath,
+        ).trigger(availableNow=True).start().awaitTermination()
+
+    expected = {
+        row.device_id: row
+        for row in transform_silver_mean_agg(silverDF)
+        .join(silverDF.groupBy("device_id").count(), "device_id")
+        .collect()
+    }
+    perDevice = transform_summary_stats(
+        spark_session.read.format("delta").load(goldPath + "per_device")
+    ).collect()
+    assert len(perDevice) == 4
+    for row in perDevice:
+        assert row.count_heartrate == expected[row.device_id]["count"]
+        assert row.mean_heartrate == pytest.approx(expected[row.device_id].mean_heartrate)
+        assert row.std_heartrate == pytest.approx(expected[row.device_id].std_heartrate)
+        assert row.max_heartrate == expected[row.device_id].max_heartrate
+    assert spark_session.read.format("delta").load(goldPath + "per_device_day").count() == 100
+    assert spark_session.read.format("delta").load(goldPath + "per_name").count() == 4
+
+    percentiles = transform_histogram_percentiles(
+        spark_session.read.format("delta").load(goldPath + "per_device_histogram"),
+        ["device_id"],
+    ).collect()
+    exact = {
+        row.device_id: row.p95
+        for row in silverDF.groupBy("device_id")
+        .agg(percentile_approx("heartrate", 0.95, 100000).alias("p95"))
+        .collect()
+    }
+    for row in percentiles:
+        assert row.p50_heartrate <= row.p95_heartrate <= row.p99_heartrate
+        assert abs(row.p95_heartrate - exact[row.device_id]) <= 1.0
+
+
+def test_gold_builder_after_retired_checkpoint(spark_session: SparkSession, tmp_path):
+    silverPath = str(tmp_path / "silver")
+    silverDF = generate_silver_data(spark_session, 2400, devices=4)
+    write_delta(silverDF.where("p_eventdate < '2020-01-13'"), silverPath)
+    write_delta(silverDF.where("p_eventdate >= '2020-01-13'"), silverPath)
+    checkpoint = str(tmp_path / "checkpoint")
+    goldPath = str(tmp_path / "gold") + "/"
+
+    def build_gold(sourceDF: DataFrame):
+        create_gold_builder(
+            dataframe=sourceDF,
+            checkpoint=checkpoint,
+            name="test_gold_builder_retired_checkpoint",
+            goldPath=goldPath,
+            aggregates=[
+                {"name": "per_device", "keys": ["device_id"], "kind": "summary"}
+            ],
+        ).trigger(availableNow=True).start().awaitTermination()
+
+    build_gold(
+        spark_session.readStream.format("delta")
+        .option("maxFilesPerTrigger", 1)
+        .load(silverPath)
+    )
+    write_delta(generate_silver_data(spark_session, 40, devices=4, seed=11), silverPath)
+    retire_checkpoint(spark_session, checkpoint)
+    # The new checkpoint's batch 0 is older than the batch ids already in
+    # gold, but comes from another query and must still be added.
+    build_gold(
+        spark_session.readStream.format("delta")
+        .option("startingVersion", 2)
+        .load(silverPath)
+    )
+
+    perDevice = spark_session.read.format("delta").load(goldPath + "per_device")
+    assert perDevice.agg({"count_heartrate": "sum"}).first()[0] == 2440
+
+
+@pytest.mark.skipif(
+    tuple(int(part) for part in pyspark.__version__.split(".")[:2]) < (3, 5),
+    reason="sketch marts use the hll_* functions of Spark 3.5",
+)
+def test_gold_builder_sketches(spark_session: SparkSession, tmp_path):
+    silverPath = str(tmp_path / "silver")
+    silverDF = generate_silver_data(spark_session, 2400, devices=4)
+    write_delta(silverDF.where("p_eventdate < '2020-01-13'"), silverPath)
+    write_delta(silverDF.where("p_eventdate >= '2020-01-13'"), silverPath)
+    sketchPath = str(tmp_path / "gold" / "per_device_day_sketch")
+
+    create_gold_builder(
+        dataframe=spark_session.readStream.format("delta")
+        .option("maxFilesPerTrigger", 1)
+        .load(silverPath),
+        checkpoint=str(tmp_path / "checkpoint"),
+        name="test_gold_builder_sketches",
+        goldPath=str(tmp_path / "gold") + "/",
+        aggregates=SKETCH_AGGREGATES,
+    ).trigger(availableNow=True).start().awaitTermination()
+
+    dailyDF = spark_session.read.format("delta").load(sketchPath)
+    assert dailyDF.count() == 4 * 25
+    percentiles = transform_sketch_percentiles(
+        merge_sketches(dailyDF, ["device_id"]), ["device_id"]
+    ).collect()
+
+    exact = {
+        row.device_id: row
+        for row in silverDF.where("heartrate > 0")
+        .groupBy("device_id")
+        .agg(
+            percentile_approx("heartrate", 0.5, 100000).alias("p50"),
+            percentile_approx("heartrate", 0.99, 100000).alias("p99"),
+        )
+        .collect()
+    }
+    assert len(percentiles) == 4
+    for row in percentiles:
+        assert row.distinct_days == pytest.approx(25, abs=1)
+        assert row.p50_heartrate == pytest.approx(exact[row.device_id].p50, rel=0.0101)
+        assert row.p99_heartrate == pytest.approx(exact[row.device_id].p99, rel=0.0101)
+        assert row.p50_heartrate <= row.p95_heartrate <= row.p99_heartrate
+
+
+# COMMAND ----------
+
+def test_stream_state_report(spark_session: SparkSession, tmp_path):
+    sourcePath = write_delta(
+        generate_silver_data(spark_session, 10, devices=5), str(tmp_path / "source")
+    )
+
+    query = (
+        create_stream_writer(
+            dataframe=transform_bronze_dedup(read_stream_delta(spark_session, sourcePath)),
+            checkpoint=str(tmp_path / "checkpoint"),
+            name="test_stream_state_report",
+        )
+        .trigger(availableNow=True)
+        .start(str(tmp_path / "silver"))
+    )
+    query.awaitTermination()
+
+    report = stream_state_report(query)
+    assert report["name"] == "test_stream_state_report"
+    assert report["state_rows"] == 10
+    assert report["state_memory_bytes"] > 0
+
+
+# COMMAND ----------
+
+def test_create_late_data_writer(spark_session: SparkSession, tmp_path):
+    silverPath = write_delta(
+        silver_rows(
+            spark_session,
+            [(0, 60.0, datetime(2020, 1, 1, 0)), (2, 90.0, datetime(2020, 1, 1, 0))],
+        ),
+        str(tmp_path / "silver"),
+        "p_eventdate",
+    )
+    latePath = write_delta(
+        silver_rows(
+            spark_session,
+            [
+                (0, 80.0, datetime(2020, 1, 1, 1)),
+                (0, 60.0, datetime(2020, 1, 1, 0)),
+                (1, 100.0, datetime(2020, 1, 2, 0)),
+            ],
+        ),
+        str(tmp_path / "late"),
+    )
+    goldTablePath = str(tmp_path / "gold")
+
+    def merge_late_data():
+        create_late_data_writer(
+            dataframe=read_stream_delta(spark_session, latePath),
+            checkpoint=str(tmp_path / "checkpoint"),
+            name="test_late_data_writer",
+            silverPath=silverPath,
+            goldTablePath=goldTablePath,
+        ).trigger(availableNow=True).start().awaitTermination()
+        return {
+            row.device_id: row
+            for row in spark_session.read.format("delta").load(goldTablePath).collect()
+        }
+
+    gold = merge_late_data()
+
+    assert spark_session.read.format("delta").load(silverPath).count() == 4
+    assert {device: row.mean_heartrate for device, row in gold.items()} == {
+        0: 70.0,
+        1: 100.0,
+    }
+
+    # An on-time reading reaches silver between two late batches and is part
+    # of the aggregate recomputed for the next late reading of its device.
+    write_delta(
+        silver_rows(spark_session, [(0, 120.0, datetime(2020, 1, 1, 3))]),
+        silverPath,
+    )
+    write_delta(
+        silver_rows(
+            spark_session,
+            [(0, 100.0, datetime(2020, 1, 1, 2)), (0, 80.0, datetime(2020, 1, 1, 1))],
+        ),
+        latePath,
+    )
+    gold = merge_late_data()
+
+    assert spark_session.read.format("delta").load(silverPath).count() == 6
+    assert gold[0].mean_heartrate == 90.0
+    assert gold[0].max_heartrate == 120.0
+    assert gold[1].mean_heartrate == 100.0
+    assert set(gold) == {0, 1}
+
+
+# COMMAND ----------
+
+def test_create_daily_agg_writer(spark_session: SparkSession, tmp_path):
+    # 600 hourly readings for each of 4 devices span 25 days.
+    sourcePath = write_delta(
+        generate_silver_data(spark_session, 2400, devices=4), str(tmp_path / "silver")
+    )
+    goldPath = str(tmp_path / "gold")
+
+    create_daily_agg_writer(
+        dataframe=transform_silver_daily_agg(read_stream_delta(spark_session, sourcePath)),
+        checkpoint=str(tmp_path / "checkpoint"),
+        name="test_daily_agg_writer",
+        deltaPath=goldPath,
+    ).trigger(availableNow=True).start().awaitTermination()
+
+    dailyDF = spark_session.read.format("delta").load(goldPath)
+    assert dailyDF.count() == 4 * 25
+    assert dailyDF.where("p_eventdate = '2020-01-01'").first().count_heartrate == 24
+
+
+# COMMAND ----------
+
+@pytest.mark.parametrize("module", [operations, operations_v2])
+def test_operations_shadow_no_new_builtins(module):
+    # Notebooks %run these files into their own namespace, so any pyspark
+    # function named like a built-in replaces it there. Only max always did.
+    shadowed = {
+        name
+        for name, value in vars(module).items()
+        if not name.startswith("__")
+        and hasattr(builtins, name)
+        and value is not getattr(builtins, name)
+    }
+    assert shadowed <= {"max"}
@@ -0,0 +1,182 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for Operations v2
+
+# COMMAND ----------
+
+from datetime import datetime
+
+import pytest
+from pyspark.sql import SparkSession
+
+# COMMAND ----------
+
+from main.python.generators import generate_raw_data
+from main.python.operations_v2 import (
+    BRONZE_SCHEMAS,
+    create_schema_aware_stream_writer,
+    create_stream_writer,
+    detect_bronze_schema_version,
+    read_stream_delta,
+    read_stream_raw,
+    register_bronze_schema,
+    transform_bronze,
+    transform_raw,
+    transform_silver_mean_agg,
+    update_silver_table,
+)
+
+# COMMAND ----------
+
+def test_transform_bronze_versions(spark_session: SparkSession):
+    bronzeDF = transform_raw(
+        generate_raw_data(spark_session, 100, devices=5, with_device_type=True)
+    )
+
+    assert transform_bronze(bronzeDF).columns == [
+        "device_id",
+        "device_type",
+        "heartrate",
+        "eventtime",
+        "name",
+        "p_eventdate",
+    ]
+    assert transform_bronze(bronzeDF, schema_version=1).columns == [
+        "device_id",
+        "heartrate",
+        "eventtime",
+        "name",
+        "p_eventdate",
+    ]
+    assert transform_bronze(bronzeDF).where("device_type IS NULL").count() == 0
+
+
+# COMMAND ----------
+
+def test_detect_bronze_schema_version(spark_session: SparkSession):
+    v1DF = generate_raw_data(spark_session, 100, devices=5)
+    v2DF = generate_raw_data(spark_session, 100, devices=5, with_device_type=True)
+    unknownDF = spark_session.createDataFrame(
+        [('{"device_id":0,"heartrate":60.0,"firmware":"1.2"}',)], schema="value STRING"
+    )
+
+    assert detect_bronze_schema_version(v1DF) == 1
+    assert detect_bronze_schema_version(v2DF) == 2
+    # A single record sending device_type is enough to need the wider schema.
+    lateV2DF = generate_raw_data(spark_session, 2000, devices=5).union(
+        generate_raw_data(spark_session, 1, devices=1, with_device_type=True)
+    )
+    assert detect_bronze_schema_version(lateV2DF) == 2
+    with pytest.raises(ValueError):
+        detect_bronze_schema_version(unknownDF)
+
+
+# COMMAND ----------
+
+def test_register_bronze_schema():
+    json_schema = "device_id INTEGER, heartrate DOUBLE, time FLOAT, name STRING, firmware STRING"
+
+    version = register_bronze_schema(json_schema)
+
+    assert BRONZE_SCHEMAS[version] == json_schema
+    del BRONZE_SCHEMAS[version]
+
+
+# COMMAND ----------
+
+def test_create_schema_aware_stream_writer(spark_session: SparkSession, tmp_path):
+    bronzePath = str(tmp_path / "bronze")
+    silverPath = str(tmp_path / "silver")
+    transform_raw(generate_raw_data(spark_session, 100, devices=5)).write.format(
+        "delta"
+    ).save(bronzePath)
+
+    def run_stream():
+        create_schema_aware_stream_writer(
+            dataframe=read_stream_delta(spark_session, bronzePath),
+            checkpoint=str(tmp_path / "checkpoint"),
+            name="test_schema_aware_stream_writer",
+            deltaPath=silverPath,
+            partition_column="p_eventdate",
+        ).trigger(availableNow=True).start().awaitTermination()
+
+    run_stream()
+    assert "device_type" not in spark_session.read.format("delta").load(silverPath).columns
+
+    # Devices start sending device_type; the same stream picks it up without a restart.
+    transform_raw(
+        generate_raw_data(spark_session, 100, devices=5, with_device_type=True, seed=11)
+    ).write.format("delta").mode("append").save(bronzePath)
+    run_stream()
+
+    silverDF = spark_session.read.format("delta").load(silverPath)
+    assert "device_type" in silverDF.columns
+    assert silverDF.where("device_type IS NOT NULL").count() == 100
+
+
+# COMMAND ----------
+
+def test_create_stream_writer_merge_schema(spark_session: SparkSession, tmp_path):
+    rawPath = str(tmp_path / "raw")
+    bronzePath = str(tmp_path / "bronze")
+    silverPath = str(tmp_path / "silver")
+    generate_raw_data(spark_session, 100, devices=5, with_device_type=True).write.text(
+        rawPath
+    )
+
+    create_stream_writer(
+        dataframe=transform_raw(read_stream_raw(spark_session, rawPath)),
+        checkpoint=str(tmp_path / "bronze_checkpoint"),
+        name="test_write_raw_to_bronze_v2",
+        partition_column="p_ingestdate",
+    ).trigger(availableNow=True).start(bronzePath).awaitTermination()
+    create_stream_writer(
+        dataframe=transform_bronze(read_stream_delta(spark_session, bronzePath)),
+        checkpoint=str(tmp_path / "silver_checkpoint"),
+        name="test_write_bronze_to_silver_v2",
+        partition_column="p_eventdate",
+        mergeSchema=True,
+    ).trigger(availableNow=True).start(silverPath).awaitTermination()
+
+    silverDF = spark_session.read.format("delta").load(silverPath)
+    assert silverDF.count() == 100
+    assert "device_type" in silverDF.columns
+
+
+# COMMAND ----------
+
+def test_update_silver_table(spark_session: SparkSession, tmp_path):
+    silverPath = str(tmp_path / "silver")
+    spark_session.createDataFrame(
+        [
+            (0, "gyroscope", 60.0, datetime(2020, 1, 1), "device_0"),
+            (0, "gyroscope", -1.0, datetime(2020, 1, 2), "device_0"),
+            (0, "gyroscope", 80.0, datetime(2020, 1, 3), "device_0"),
+        ],
+        schema="device_id INTEGER, device_type STRING, heartrate DOUBLE, "
+        "eventtime TIMESTAMP, name STRING",
+    ).selectExpr("*", "CAST(eventtime AS DATE) AS p_eventdate").write.format(
+        "delta"
+    ).save(silverPath)
+    spark_session.read.format("delta").load(silverPath).createOrReplaceTempView(
+        "health_tracker_plus_silver"
+    )
+
+    update_silver_table(spark_session, silverPath)
+
+    repaired = spark_session.read.format("delta").load(silverPath)
+    assert repaired.where("heartrate < 0").count() == 0
+
+
+# COMMAND ----------
+
+def test_transform_silver_mean_agg(spark_session: SparkSession):
+    silverDF = transform_bronze(
+        transform_raw(generate_raw_data(spark_session, 100, devices=5, negative_rate=0.0))
+    )
+
+    aggregateDF = transform_silver_mean_agg(silverDF)
+
+    assert aggregateDF.count() == 5
+    assert aggregateDF.where("max_heartrate < mean_heartrate").count() == 0
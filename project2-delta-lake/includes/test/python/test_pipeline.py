@@ -0,0 +1,157 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for the Pipeline Runner
+
+# COMMAND ----------
+
+import pytest
+from pyspark.sql import DataFrame, SparkSession
+
+# COMMAND ----------
+
+from main.python.generators import write_raw_json
+from main.python.operations import (
+    STREAM_WRITER_NAMES,
+    create_stream_writer,
+    read_stream_delta,
+    read_stream_raw,
+    transform_bronze,
+    transform_raw,
+    transform_silver_mean_agg,
+)
+from main.python.pipeline import PipelineRunner
+
+# COMMAND ----------
+
+def plus_pipeline_stages(tmp_path) -> list:
+    rawPath = str(tmp_path / "raw") + "/"
+    bronzePath = str(tmp_path / "bronze")
+    silverPath = str(tmp_path / "silver")
+    return [
+        {
+            "name": "test_pipeline_bronze",
+            "source": lambda spark: transform_raw(read_stream_raw(spark, rawPath)),
+            "writer": lambda dataframe, checkpoint, name: create_stream_writer(
+                dataframe, checkpoint, name, partition_column="p_ingestdate"
+            ),
+            "checkpoint": str(tmp_path / "checkpoints" / "bronze"),
+            "path": bronzePath,
+        },
+        {
+            "name": "test_pipeline_silver",
+            "source": lambda spark: transform_bronze(
+                read_stream_delta(spark, bronzePath)
+            ),
+            "writer": lambda dataframe, checkpoint, name: create_stream_writer(
+                dataframe, checkpoint, name, partition_column="p_eventdate"
+            ),
+            "checkpoint": str(tmp_path / "checkpoints" / "silver"),
+            "path": silverPath,
+            "upstream": ["test_pipeline_bronze"],
+        },
+        {
+            "name": "test_pipeline_gold",
+            "source": lambda spark: transform_silver_mean_agg(
+                read_stream_delta(spark, silverPath)
+            ),
+            "writer": lambda dataframe, checkpoint, name: create_stream_writer(
+                dataframe, checkpoint, name, mode="complete"
+            ),
+            "checkpoint": str(tmp_path / "checkpoints" / "gold"),
+            "path": str(tmp_path / "gold"),
+            "upstream": ["test_pipeline_silver"],
+        },
+    ]
+
+
+# COMMAND ----------
+
+def test_pipeline_runner_once(spark_session: SparkSession, tmp_path):
+    write_raw_json(spark_session, 200, str(tmp_path / "raw") + "/", devices=5)
+    # Listed out of order, the runner still starts bronze before silver and gold.
+    stages = list(reversed(plus_pipeline_stages(tmp_path)))
+    runner = PipelineRunner(
+        spark_session,
+        stages,
+        conf={"spark.sql.shuffle.partitions": 4},
+        once=True,
+        poll_seconds=0.1,
+    )
+
+    assert runner.run(timeout=300)
+
+    assert list(runner.stages) == [
+        "test_pipeline_bronze",
+        "test_pipeline_silver",
+        "test_pipeline_gold",
+    ]
+    assert spark_session.read.format("delta").load(str(tmp_path / "silver")).count() == 200
+    assert spark_session.read.format("delta").load(str(tmp_path / "gold")).count() == 5
+    assert spark_session.conf.get("spark.sql.shuffle.partitions") == "4"
+
+    spark_session.conf.set("spark.sql.shuffle.partitions", 8)
+    assert len(runner.reset()) == 6
+    assert not (tmp_path / "silver").exists()
+
+
+# COMMAND ----------
+
+def test_pipeline_runner_restarts_failed_stage(spark_session: SparkSession, tmp_path):
+    write_raw_json(spark_session, 20, str(tmp_path / "raw") + "/", devices=5)
+    attempts = []
+
+    def flaky_writer(dataframe: DataFrame, checkpoint: str, name: str):
+        def write_batch(batchDF: DataFrame, batch_id: int):
+            attempts.append(batch_id)
+            if len(attempts) == 1:
+                raise ValueError("transient failure")
+            batchDF.write.format("delta").mode("append").save(str(tmp_path / "bronze"))
+
+        return (
+            dataframe.writeStream.foreachBatch(write_batch)
+            .option("checkpointLocation", checkpoint)
+            .queryName(name)
+        )
+
+    bronze = dict(
+        plus_pipeline_stages(tmp_path)[0], writer=flaky_writer, foreach_batch=True
+    )
+    runner = PipelineRunner(
+        spark_session, [bronze], once=True, backoff_seconds=0, poll_seconds=0.1
+    )
+
+    assert runner.run(timeout=300)
+
+    assert runner.restarts["test_pipeline_bronze"] == 1
+    assert attempts == [0, 0]
+    assert spark_session.read.format("delta").load(str(tmp_path / "bronze")).count() == 20
+
+
+def test_pipeline_runner_default_writer(spark_session: SparkSession, tmp_path):
+    write_raw_json(spark_session, 20, str(tmp_path / "raw") + "/", devices=5)
+    bronze = plus_pipeline_stages(tmp_path)[0]
+    del bronze["writer"]
+    runner = PipelineRunner(spark_session, [bronze], once=True, poll_seconds=0.1)
+
+    assert runner.run(timeout=300)
+
+    assert "test_pipeline_bronze" in STREAM_WRITER_NAMES
+    assert spark_session.read.format("delta").load(str(tmp_path / "bronze")).count() == 20
+
+
+# COMMAND ----------
+
+def test_pipeline_runner_rejects_invalid_dag(spark_session: SparkSession, tmp_path):
+    bronze, silver, gold = plus_pipeline_stages(tmp_path)
+
+    with pytest.raises(ValueError, match="share the checkpoint"):
+        PipelineRunner(
+            spark_session, [bronze, dict(silver, checkpoint=bronze["checkpoint"])]
+        )
+    with pytest.raises(ValueError, match="cycle"):
+        PipelineRunner(
+            spark_session, [dict(bronze, upstream=["test_pipeline_gold"]), silver, gold]
+        )
+    with pytest.raises(ValueError, match="Unknown upstream"):
+        PipelineRunner(spark_session, [silver])
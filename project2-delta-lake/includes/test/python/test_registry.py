@@ -0,0 +1,92 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for the Table Registry
+
+# COMMAND ----------
+
+from datetime import datetime
+
+from pyspark.sql import SparkSession
+
+# COMMAND ----------
+
+from main.python.operations import update_silver_table_partitioned
+from main.python.registry import TableRegistry
+
+# COMMAND ----------
+
+SILVER_SCHEMA = """
+    device_id INTEGER, heartrate DOUBLE, eventtime TIMESTAMP, name STRING, p_eventdate DATE
+"""
+
+
+def write_silver(spark: SparkSession, silverPath: str, readings: list) -> str:
+    (
+        spark.createDataFrame(
+            [
+                (device_id, heartrate, eventtime, f"device_{device_id}", eventtime.date())
+                for device_id, heartrate, eventtime in readings
+            ],
+            schema=SILVER_SCHEMA,
+        )
+        .write.format("delta")
+        .mode("append")
+        .partitionBy("p_eventdate")
+        .save(silverPath)
+    )
+    return silverPath
+
+
+# COMMAND ----------
+
+def test_table_registry_caches_until_version_changes(
+    spark_session: SparkSession, tmp_path
+):
+    silverPath = write_silver(
+        spark_session, str(tmp_path / "silver"), [(0, 60.0, datetime(2020, 1, 1))]
+    )
+    tables = TableRegistry(spark_session, {"silver": silverPath})
+
+    assert tables.version("silver") == 0
+    assert tables.table("silver") is tables.table(silverPath)
+    assert tables.read("silver") is tables.read("silver")
+    assert tables.schema("silver").fieldNames() == [
+        "device_id",
+        "heartrate",
+        "eventtime",
+        "name",
+        "p_eventdate",
+    ]
+
+    table = tables.table("silver")
+    dataframe = tables.read("silver")
+    write_silver(spark_session, silverPath, [(1, 70.0, datetime(2020, 1, 1))])
+
+    assert tables.version("silver") == 1
+    assert tables.table("silver") is not table
+    assert tables.read("silver") is not dataframe
+    assert tables.read("silver").count() == 2
+
+
+# COMMAND ----------
+
+def test_table_registry_with_silver_repair(spark_session: SparkSession, tmp_path):
+    silverPath = write_silver(
+        spark_session,
+        str(tmp_path / "silver"),
+        [
+            (0, 60.0, datetime(2020, 1, 1, 0)),
+            (0, -1.0, datetime(2020, 1, 1, 1)),
+            (0, 80.0, datetime(2020, 1, 1, 2)),
+        ],
+    )
+    tables = TableRegistry(spark_session, {"silver": silverPath})
+
+    assert update_silver_table_partitioned(spark_session, silverPath, tables=tables)
+    assert not update_silver_table_partitioned(spark_session, silverPath, tables=tables)
+
+    repaired = {
+        row.eventtime: row.heartrate for row in tables.read("silver").collect()
+    }
+    assert repaired[datetime(2020, 1, 1, 1)] == 70.0
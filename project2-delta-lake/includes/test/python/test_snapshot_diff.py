@@ -0,0 +1,115 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for Snapshot Diffs
+
+# COMMAND ----------
+
+from datetime import datetime
+
+import pytest
+from pyspark.sql import SparkSession
+
+# COMMAND ----------
+
+from main.python.operations import update_silver_table_partitioned
+from main.python.snapshot_diff import changed_files, diff_versions, summarize_diff
+
+# COMMAND ----------
+
+SILVER_SCHEMA = """
+    device_id INTEGER, heartrate DOUBLE, eventtime TIMESTAMP, name STRING, p_eventdate DATE
+"""
+
+
+def append_silver(spark: SparkSession, silverPath: str, readings: list) -> str:
+    (
+        spark.createDataFrame(
+            [
+                (device_id, heartrate, eventtime, f"device_{device_id}", eventtime.date())
+                for device_id, heartrate, eventtime in readings
+            ],
+            schema=SILVER_SCHEMA,
+        )
+        .write.format("delta")
+        .mode("append")
+        .partitionBy("p_eventdate")
+        .save(silverPath)
+    )
+    return silverPath
+
+
+# COMMAND ----------
+
+def test_diff_versions(spark_session: SparkSession, tmp_path):
+    silverPath = append_silver(
+        spark_session,
+        str(tmp_path / "silver"),
+        [
+            (0, 60.0, datetime(2020, 1, 1, 0)),
+            (0, -1.0, datetime(2020, 1, 1, 1)),
+            (0, 80.0, datetime(2020, 1, 1, 2)),
+            (1, 90.0, datetime(2020, 1, 2, 0)),
+        ],
+    )
+    update_silver_table_partitioned(spark_session, silverPath)
+    append_silver(spark_session, silverPath, [(2, 75.0, datetime(2020, 1, 3, 0))])
+
+    # The repair only rewrites the 2020-01-01 partition.
+    files = changed_files(spark_session, silverPath, 0, 1)
+    assert len(files["removed"]) == 1 and len(files["added"]) == 1
+    assert "p_eventdate=2020-01-01" in files["removed"][0]
+    assert not files["deletion_vectors"]
+
+    changes = {
+        (row._change_type, row.device_id, row.heartrate)
+        for row in diff_versions(
+            spark_session, silverPath, 0, 2, keys=["device_id", "eventtime"]
+        ).collect()
+    }
+    assert changes == {
+        ("update_preimage", 0, -1.0),
+        ("update_postimage", 0, 70.0),
+        ("insert", 2, 75.0),
+    }
+    assert summarize_diff(diff_versions(spark_session, silverPath, 0, 1)) == {
+        "delete": 1,
+        "insert": 1,
+    }
+    assert diff_versions(spark_session, silverPath, 1, 2).count() == 1
+    with pytest.raises(ValueError):
+        changed_files(spark_session, silverPath, 2, 1)
+
+
+# COMMAND ----------
+
+def test_diff_versions_schema_change(spark_session: SparkSession, tmp_path):
+    silverPath = append_silver(
+        spark_session, str(tmp_path / "silver"), [(0, 60.0, datetime(2020, 1, 1))]
+    )
+    (
+        spark_session.createDataFrame(
+            [
+                (
+                    1,
+                    70.0,
+                    datetime(2020, 1, 2),
+                    "device_1",
+                    datetime(2020, 1, 2).date(),
+                    "gyroscope",
+                )
+            ],
+            schema=SILVER_SCHEMA + ", device_type STRING",
+        )
+        .write.format("delta")
+        .mode("append")
+        .option("mergeSchema", "true")
+        .save(silverPath)
+    )
+
+    [row] = diff_versions(spark_session, silverPath, 0, 1).collect()
+    assert (row._change_type, row.device_id, row.device_type) == (
+        "insert",
+        1,
+        "gyroscope",
+    )
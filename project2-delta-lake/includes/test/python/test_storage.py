@@ -0,0 +1,56 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for Storage
+
+# COMMAND ----------
+
+from pyspark.sql import SparkSession
+
+# COMMAND ----------
+
+from main.python.generators import generate_silver_data
+from main.python.storage import (
+    child,
+    delete_path,
+    file_system,
+    latest_version,
+    read_files,
+)
+
+# COMMAND ----------
+
+def test_latest_version(spark_session: SparkSession, tmp_path):
+    logPath = tmp_path / "table" / "_delta_log"
+    logPath.mkdir(parents=True)
+
+    assert latest_version(spark_session, str(tmp_path / "table")) == -1
+
+    for file in ["00000000000000000000.json", "00000000000000000001.json"]:
+        (logPath / file).write_text("{}")
+    (logPath / "00000000000000000001.checkpoint.parquet").write_text("")
+
+    assert latest_version(spark_session, str(tmp_path / "table") + "/") == 1
+
+
+def test_child_and_delete_path(spark_session: SparkSession, tmp_path):
+    (tmp_path / "checkpoint" / "offsets").mkdir(parents=True)
+    fs, root = file_system(spark_session, str(tmp_path / "checkpoint"))
+
+    assert fs.exists(child(spark_session, root, "offsets"))
+    assert delete_path(spark_session, str(tmp_path / "checkpoint"))
+    assert not (tmp_path / "checkpoint").exists()
+    assert not delete_path(spark_session, str(tmp_path / "checkpoint"))
+
+
+def test_read_files(spark_session: SparkSession, tmp_path):
+    tablePath = str(tmp_path / "table")
+    silverDF = generate_silver_data(spark_session, 48, devices=2)
+    silverDF.write.partitionBy("p_eventdate").parquet(tablePath)
+    files = spark_session.read.parquet(tablePath).inputFiles()
+
+    filesDF = read_files(spark_session, tablePath, files, silverDF.schema)
+
+    assert filesDF.count() == 48
+    assert dict(filesDF.dtypes)["p_eventdate"] == "date"
+    assert read_files(spark_session, tablePath, [], silverDF.schema).count() == 0
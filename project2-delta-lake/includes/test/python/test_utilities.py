@@ -0,0 +1,217 @@
+# Databricks notebook source
+# MAGIC
+# MAGIC %md
+# MAGIC # Unit Tests for Utilities
+
+# COMMAND ----------
+
+import functools
+import hashlib
+import os
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from pyspark.sql import SparkSession, functions
+
+# COMMAND ----------
+
+import utilities
+from utilities import CHECKSUM_FILE, get_readiness_listener, retrieve_data_bulk
+
+# COMMAND ----------
+
+def etag(body: bytes) -> str:
+    return '"{}"'.format(hashlib.sha256(body).hexdigest()[:16])
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files with an ETag, honouring Range and If-Range."""
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as served:
+            body = served.read()
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header is not None and if_range in (None, etag(body)):
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(body):
+                self.server.statuses.append(416)
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}"
+            )
+            self.server.statuses.append(206)
+        else:
+            self.send_response(200)
+            self.server.statuses.append(200)
+        self.send_header("ETag", etag(body))
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+
+@pytest.fixture
+def health_tracker_server(tmp_path):
+    """Fixture serving fake monthly health tracker files over local HTTP."""
+    served = tmp_path / "served"
+    served.mkdir()
+    for file in ["health_tracker_data_2020_1.json", "health_tracker_data_2020_2_late.json"]:
+        (served / file).write_text(f'{{"file":"{file}"}}\n' * 1000)
+
+    handler = functools.partial(RangeRequestHandler, directory=str(served))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.statuses = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield served, f"http://127.0.0.1:{server.server_port}/", server.statuses
+    server.shutdown()
+
+
+def write_partial(raw_path: str, body: bytes, validator: str = None) -> str:
+    os.makedirs(raw_path, exist_ok=True)
+    partPath = os.path.join(raw_path, ".health_tracker_data_2020_1.json.part")
+    with open(partPath, "wb") as part:
+        part.write(body)
+    if validator is not None:
+        with open(partPath + ".validator", "w") as saved:
+            saved.write(validator)
+    return partPath
+
+
+# COMMAND ----------
+
+def test_retrieve_data_bulk(health_tracker_server, tmp_path):
+    served, base_url, _ = health_tracker_server
+    raw_path = str(tmp_path / "raw") + "/"
+    files = [(2020, 1, False), (2020, 2, True)]
+
+    fetched = retrieve_data_bulk(files, raw_path, base_url=base_url, fs_root="")
+
+    assert [downloaded for _, downloaded in fetched] == [True, True]
+    assert (tmp_path / "raw" / "health_tracker_data_2020_1.json").read_bytes() == (
+        served / "health_tracker_data_2020_1.json"
+    ).read_bytes()
+    assert (tmp_path / "raw" / "late" / "health_tracker_data_2020_2_late.json").exists()
+    assert (tmp_path / "raw" / CHECKSUM_FILE).exists()
+
+    refetched = retrieve_data_bulk(files, raw_path, base_url=base_url, fs_root="")
+
+    assert [downloaded for _, downloaded in refetched] == [False, False]
+
+
+# COMMAND ----------
+
+def test_retrieve_data_bulk_replaces_partial_file(health_tracker_server, tmp_path):
+    served, base_url, statuses = health_tracker_server
+    raw_path = str(tmp_path / "raw") + "/"
+    # Without a saved validator there is no way to tell whether the partial
+    # file still matches the remote one, so it is downloaded again.
+    partPath = write_partial(raw_path, b"truncated")
+
+    retrieve_data_bulk([(2020, 1, False)], raw_path, base_url=base_url, fs_root="")
+
+    assert statuses == [200]
+    assert not os.path.exists(partPath)
+    assert (tmp_path / "raw" / "health_tracker_data_2020_1.json").read_bytes() == (
+        served / "health_tracker_data_2020_1.json"
+    ).read_bytes()
+
+
+# COMMAND ----------
+
+def test_retrieve_data_bulk_resumes_partial_file(health_tracker_server, tmp_path):
+    served, base_url, statuses = health_tracker_server
+    raw_path = str(tmp_path / "raw") + "/"
+    body = (served / "health_tracker_data_2020_1.json").read_bytes()
+    partPath = write_partial(raw_path, body[:1000], etag(body))
+
+    retrieve_data_bulk([(2020, 1, False)], raw_path, base_url=base_url, fs_root="")
+
+    assert statuses == [206]
+    assert not os.path.exists(partPath)
+    assert not os.path.exists(partPath + ".validator")
+    assert (tmp_path / "raw" / "health_tracker_data_2020_1.json").read_bytes() == body
+
+
+# COMMAND ----------
+
+def test_retrieve_data_bulk_restarts_when_remote_file_changed(
+    health_tracker_server, tmp_path
+):
+    served, base_url, statuses = health_tracker_server
+    raw_path = str(tmp_path / "raw") + "/"
+    servedPath = served / "health_tracker_data_2020_1.json"
+    stale = b'{"file":"stale"}\n' * 1000
+    write_partial(raw_path, stale[:1000], etag(stale))
+
+    retrieve_data_bulk([(2020, 1, False)], raw_path, base_url=base_url, fs_root="")
+
+    assert statuses == [200]
+    assert (
+        tmp_path / "raw" / "health_tracker_data_2020_1.json"
+    ).read_bytes() == servedPath.read_bytes()
+
+
+# COMMAND ----------
+
+def start_rate_stream(spark: SparkSession, name: str, interval: str):
+    return (
+        spark.readStream.format("rate")
+        .load()
+        .writeStream.format("memory")
+        .queryName(name)
+        .trigger(processingTime=interval)
+        .start()
+    )
+
+
+def test_readiness_listener_counts_each_run(spark_session: SparkSession):
+    listener = get_readiness_listener(spark_session)
+    assert get_readiness_listener(spark_session) is listener
+
+    query = start_rate_stream(spark_session, "test_readiness", "100 milliseconds")
+    assert listener.wait_for(spark_session, ["test_readiness"], 3, timeout=60)
+    query.stop()
+
+    # The restarted run only triggers every minute, so it cannot reach three
+    # progressions in time and must not inherit the stopped run's count.
+    restarted = start_rate_stream(spark_session, "test_readiness", "1 minute")
+    assert not listener.wait_for(spark_session, ["test_readiness"], 3, timeout=2)
+    restarted.stop()
+
+    deadline = time.monotonic() + 30
+    while str(query.runId) in listener.progressions and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert str(query.runId) not in listener.progressions
+
+
+def test_readiness_listener_times_out_on_missing_stream(spark_session: SparkSession):
+    listener = get_readiness_listener(spark_session)
+
+    assert not listener.wait_for(spark_session, ["test_missing"], 1, timeout=0.5)
+
+
+def test_readiness_listener_with_notebook_globals(
+    spark_session: SparkSession, monkeypatch
+):
+    # Notebooks %run utilities and operations into one namespace, where max,
+    # sum, min and filter may be pyspark's rather than the built-ins.
+    for name in ["max", "min", "sum", "filter"]:
+        monkeypatch.setattr(utilities, name, getattr(functions, name), raising=False)
+    listener = get_readiness_listener(spark_session)
+
+    name = "test_readiness_globals"
+    query = start_rate_stream(spark_session, name, "100 milliseconds")
+    try:
+        assert listener.wait_for(spark_session, [name], 2, timeout=60)
+    finally:
+        query.stop()
@@ -1,10 +1,19 @@
 # Databricks notebook source
 
+from concurrent.futures import ThreadPoolExecutor
 from pyspark.sql.session import SparkSession
-from urllib.request import urlretrieve
+from pyspark.sql.streaming import StreamingQueryListener
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen, urlretrieve
+import hashlib
+import json
+import os
+import shutil
+import threading
 import time
 
 BASE_URL = "https://files.training.databricks.com/static/data/health-tracker/"
+CHECKSUM_FILE = "_checksums.json"
 
 
 def retrieve_data(year: int, month: int, raw_path: str, is_late: bool = False) -> bool:
@@ -16,6 +25,112 @@ def retrieve_data(year: int, month: int, raw_path: str, is_late: bool = False) -
     return True
 
 
+def retrieve_data_bulk(
+    files: list,
+    raw_path: str,
+    max_workers: int = 4,
+    base_url: str = BASE_URL,
+    fs_root: str = "/dbfs",
+) -> list:
+    # Files are streamed through the DBFS FUSE mount at fs_root straight into
+    # raw_path; pass fs_root="" to write to a local directory instead.
+    checksums = _read_checksums(fs_root + raw_path)
+    lock = threading.Lock()
+
+    def fetch(spec):
+        year, month, is_late = spec
+        file, dbfsPath, _ = _generate_file_handles(year, month, raw_path, is_late)
+        localPath = fs_root + dbfsPath
+        key = dbfsPath[len(raw_path) :]
+
+        if os.path.exists(localPath) and checksums.get(key) == _sha256(localPath):
+            return dbfsPath, False
+
+        checksum = _stream_to_file(base_url + file, localPath)
+        with lock:
+            checksums[key] = checksum
+            _write_checksums(fs_root + raw_path, checksums)
+        return dbfsPath, True
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(fetch, files))
+
+
+def _stream_to_file(uri: str, localPath: str, chunk_size: int = 1 << 20) -> str:
+    directory, file = os.path.split(localPath)
+    os.makedirs(directory, exist_ok=True)
+    # Spark ignores files starting with "." so a partial download is never
+    # picked up by a stream reading the raw path.
+    partPath = os.path.join(directory, "." + file + ".part")
+    validatorPath = partPath + ".validator"
+    offset = os.path.getsize(partPath) if os.path.exists(partPath) else 0
+    validator = None
+    if offset and os.path.exists(validatorPath):
+        with open(validatorPath) as saved:
+            validator = saved.read()
+
+    request = Request(uri)
+    # A partial file is only resumed when If-Range confirms the remote file
+    # is still the one it was cut from; otherwise the server sends it whole.
+    if validator:
+        request.add_header("Range", f"bytes={offset}-")
+        request.add_header("If-Range", validator)
+    try:
+        with urlopen(request) as response:
+            if response.status == 206:
+                mode = "ab"
+            else:
+                mode = "wb"
+                _write_validator(validatorPath, response.headers)
+            with open(partPath, mode) as out:
+                shutil.copyfileobj(response, out, chunk_size)
+    except HTTPError as error:
+        # 416 means the partial file already holds the whole, unchanged body.
+        if error.code != 416:
+            raise
+
+    os.replace(partPath, localPath)
+    if os.path.exists(validatorPath):
+        os.remove(validatorPath)
+    return _sha256(localPath)
+
+
+def _write_validator(validatorPath: str, headers):
+    # If-Range only accepts a strong ETag, so a weak one falls back to
+    # Last-Modified. Without either, a partial file is downloaded again.
+    etag = headers.get("ETag")
+    validator = etag if etag and not etag.startswith("W/") else None
+    validator = validator or headers.get("Last-Modified")
+    if validator is None:
+        if os.path.exists(validatorPath):
+            os.remove(validatorPath)
+        return
+    with open(validatorPath, "w") as out:
+        out.write(validator)
+
+
+def _sha256(localPath: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(localPath, "rb") as data:
+        for chunk in iter(lambda: data.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_checksums(directory: str) -> dict:
+    checksumPath = os.path.join(directory, CHECKSUM_FILE)
+    if not os.path.exists(checksumPath):
+        return {}
+    with open(checksumPath) as checksums:
+        return json.load(checksums)
+
+
+def _write_checksums(directory: str, checksums: dict):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, CHECKSUM_FILE), "w") as out:
+        json.dump(checksums, out, indent=2, sort_keys=True)
+
+
 def _generate_file_handles(year: int, month: int, raw_path: str, is_late: bool):
     late = ""
     if is_late:
@@ -49,11 +164,90 @@ def stop_named_stream(spark: SparkSession, namedStream: str) -> bool:
     return stopped
 
 
-def untilStreamIsReady(namedStream: str, progressions: int = 3) -> bool:
-    queries = list(filter(lambda query: query.name == namedStream, spark.streams.active))
-    while len(queries) == 0 or len(queries[0].recentProgress) < progressions:
-        time.sleep(5)
-        queries = list(filter(lambda query: query.name == namedStream, spark.streams.active))
-    print("The stream {} is active and ready.".format(namedStream))
+class StreamReadinessListener(StreamingQueryListener):
+    # Progress is counted per run, keyed by runId, so a query restarted under
+    # the same name does not inherit the count of the run that was stopped.
+    def __init__(self):
+        self.progressions = {}
+        self.condition = threading.Condition()
+
+    def onQueryStarted(self, event):
+        with self.condition:
+            self.progressions[str(event.runId)] = 0
+            self.condition.notify_all()
+
+    def onQueryProgress(self, event):
+        with self.condition:
+            runId = str(event.progress.runId)
+            self.progressions[runId] = self.progressions.get(runId, 0) + 1
+            self.condition.notify_all()
+
+    def onQueryIdle(self, event):
+        pass
+
+    def onQueryTerminated(self, event):
+        with self.condition:
+            self.progressions.pop(str(event.runId), None)
+            self.condition.notify_all()
+
+    def wait_for(
+        self,
+        spark: SparkSession,
+        namedStreams: list,
+        progressions: int = 3,
+        timeout: float = None,
+    ) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self._ready(spark, namedStreams, progressions):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def _ready(self, spark: SparkSession, namedStreams: list, progressions: int) -> bool:
+        runs = {}
+        for query in spark.streams.active:
+            if query.name in namedStreams:
+                # The run may have made progress before the listener was
+                # registered, and recentProgress only holds this run's. The
+                # built-in max is avoided since notebooks that %run operations
+                # rebind it to pyspark's in the shared namespace.
+                counted = self.progressions.get(str(query.runId), 0)
+                recent = len(query.recentProgress)
+                runs[query.name] = recent if recent > counted else counted
+        return all(runs.get(name, 0) >= progressions for name in namedStreams)
+
+
+# %run executes this file again, so the listener registered by an earlier run
+# is removed instead of being left to count next to the new one.
+if globals().get("_readiness_listener") is not None:
+    spark.streams.removeListener(_readiness_listener)
+_readiness_listener = None
+
+
+def get_readiness_listener(spark: SparkSession) -> StreamReadinessListener:
+    global _readiness_listener
+    if _readiness_listener is None:
+        _readiness_listener = StreamReadinessListener()
+        spark.streams.addListener(_readiness_listener)
+    return _readiness_listener
+
+
+def untilStreamsAreReady(
+    namedStreams: list, progressions: int = 3, timeout: float = None
+) -> bool:
+    listener = get_readiness_listener(spark)
+    if not listener.wait_for(spark, namedStreams, progressions, timeout):
+        print("Timed out waiting for the streams {}.".format(", ".join(namedStreams)))
+        return False
+    for namedStream in namedStreams:
+        print("The stream {} is active and ready.".format(namedStream))
     return True
 
+
+def untilStreamIsReady(
+    namedStream: str, progressions: int = 3, timeout: float = None
+) -> bool:
+    return untilStreamsAreReady([namedStream], progressions, timeout)
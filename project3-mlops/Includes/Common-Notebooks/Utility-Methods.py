@@ -99,15 +99,74 @@
 # MAGIC # Utility method to wait until the stream is read
 # MAGIC # ****************************************************************************
 # MAGIC 
-# MAGIC def untilStreamIsReady(name, progressions=3):
-# MAGIC   import time
-# MAGIC   queries = list(filter(lambda query: query.name == name, getActiveStreams()))
-# MAGIC 
-# MAGIC   while (len(queries) == 0 or len(queries[0].recentProgress) < progressions):
-# MAGIC     time.sleep(5) # Give it a couple of seconds
-# MAGIC     queries = list(filter(lambda query: query.name == name, getActiveStreams()))
-# MAGIC 
-# MAGIC   print("The stream {} is active and ready.".format(name))
+# MAGIC import threading
+# MAGIC import time
+# MAGIC from pyspark.sql.streaming import StreamingQueryListener
+# MAGIC 
+# MAGIC # Progress is counted per run, so a stream restarted under the same name
+# MAGIC # does not inherit the count of the run that was stopped
+# MAGIC class StreamReadinessListener(StreamingQueryListener):
+# MAGIC   def __init__(self):
+# MAGIC     self.progressions = {}
+# MAGIC     self.condition = threading.Condition()
+# MAGIC 
+# MAGIC   def onQueryStarted(self, event):
+# MAGIC     with self.condition:
+# MAGIC       self.progressions[str(event.runId)] = 0
+# MAGIC       self.condition.notify_all()
+# MAGIC 
+# MAGIC   def onQueryProgress(self, event):
+# MAGIC     with self.condition:
+# MAGIC       runId = str(event.progress.runId)
+# MAGIC       self.progressions[runId] = self.progressions.get(runId, 0) + 1
+# MAGIC       self.condition.notify_all()
+# MAGIC 
+# MAGIC   def onQueryIdle(self, event):
+# MAGIC     pass
+# MAGIC 
+# MAGIC   def onQueryTerminated(self, event):
+# MAGIC     with self.condition:
+# MAGIC       self.progressions.pop(str(event.runId), None)
+# MAGIC       self.condition.notify_all()
+# MAGIC 
+# MAGIC   def isReady(self, names, progressions):
+# MAGIC     runs = {}
+# MAGIC     for query in getActiveStreams():
+# MAGIC       if query.name in names:
+# MAGIC         # The run may have made progress before the listener was registered.
+# MAGIC         # No max() here: notebooks that %run operations rebind it to the pyspark one
+# MAGIC         counted = self.progressions.get(str(query.runId), 0)
+# MAGIC         recent = len(query.recentProgress)
+# MAGIC         runs[query.name] = recent if recent > counted else counted
+# MAGIC     return all(runs.get(name, 0) >= progressions for name in names)
+# MAGIC 
+# MAGIC   def waitFor(self, names, progressions=3, timeout=None):
+# MAGIC     deadline = None if timeout is None else time.monotonic() + timeout
+# MAGIC     with self.condition:
+# MAGIC       while not self.isReady(names, progressions):
+# MAGIC         remaining = None if deadline is None else deadline - time.monotonic()
+# MAGIC         if remaining is not None and remaining <= 0:
+# MAGIC           return False
+# MAGIC         self.condition.wait(remaining)
+# MAGIC     return True
+# MAGIC 
+# MAGIC # %run executes this cell again, so the listener of an earlier run is removed
+# MAGIC # instead of being left to count next to the new one
+# MAGIC if "streamReadinessListener" in globals():
+# MAGIC   spark.streams.removeListener(streamReadinessListener)
+# MAGIC streamReadinessListener = StreamReadinessListener()
+# MAGIC spark.streams.addListener(streamReadinessListener)
+# MAGIC 
+# MAGIC def untilStreamsAreReady(names, progressions=3, timeout=None):
+# MAGIC   if not streamReadinessListener.waitFor(names, progressions, timeout):
+# MAGIC     print("Timed out waiting for the streams {}.".format(", ".join(names)))
+# MAGIC     return False
+# MAGIC   for name in names:
+# MAGIC     print("The stream {} is active and ready.".format(name))
+# MAGIC   return True
+# MAGIC 
+# MAGIC def untilStreamIsReady(name, progressions=3, timeout=None):
+# MAGIC   return untilStreamsAreReady([name], progressions, timeout)
 # MAGIC 
 # MAGIC None
 
@@ -294,14 +353,68 @@
 # MAGIC // Utility method to wait until the stream is read
 # MAGIC // ****************************************************************************
 # MAGIC 
-# MAGIC def untilStreamIsReady(name:String, progressions:Int = 3):Unit = {
-# MAGIC   var queries = getActiveStreams().filter(_.name == name)
-# MAGIC   
-# MAGIC   while (queries.length == 0 || queries(0).recentProgress.length < progressions) {
-# MAGIC     Thread.sleep(5*1000) // Give it a couple of seconds
-# MAGIC     queries = getActiveStreams().filter(_.name == name)
+# MAGIC import org.apache.spark.sql.streaming.StreamingQueryListener
+# MAGIC import org.apache.spark.sql.streaming.StreamingQueryListener.{QueryProgressEvent, QueryStartedEvent, QueryTerminatedEvent}
+# MAGIC 
+# MAGIC // Progress is counted per run, so a stream restarted under the same name
+# MAGIC // does not inherit the count of the run that was stopped
+# MAGIC class StreamReadinessListener extends StreamingQueryListener {
+# MAGIC   private val progressions = scala.collection.mutable.Map[String, Int]()
+# MAGIC 
+# MAGIC   override def onQueryStarted(event:QueryStartedEvent):Unit = progressions.synchronized {
+# MAGIC     progressions(event.runId.toString) = 0
+# MAGIC     progressions.notifyAll()
+# MAGIC   }
+# MAGIC 
+# MAGIC   override def onQueryProgress(event:QueryProgressEvent):Unit = progressions.synchronized {
+# MAGIC     val runId = event.progress.runId.toString
+# MAGIC     progressions(runId) = progressions.getOrElse(runId, 0) + 1
+# MAGIC     progressions.notifyAll()
+# MAGIC   }
+# MAGIC 
+# MAGIC   override def onQueryTerminated(event:QueryTerminatedEvent):Unit = progressions.synchronized {
+# MAGIC     progressions.remove(event.runId.toString)
+# MAGIC     progressions.notifyAll()
 # MAGIC   }
-# MAGIC   println("The stream %s is active and ready.".format(name))
+# MAGIC 
+# MAGIC   private def isReady(names:Seq[String], progressionCount:Int):Boolean = {
+# MAGIC     // The run may have made progress before the listener was registered
+# MAGIC     val runs = getActiveStreams().filter(query => names.contains(query.name)).map { query =>
+# MAGIC       query.name -> math.max(progressions.getOrElse(query.runId.toString, 0), query.recentProgress.length)
+# MAGIC     }.toMap
+# MAGIC     names.forall(name => runs.getOrElse(name, 0) >= progressionCount)
+# MAGIC   }
+# MAGIC 
+# MAGIC   // A timeout of 0 waits forever
+# MAGIC   def waitFor(names:Seq[String], progressionCount:Int = 3, timeoutMs:Long = 0):Boolean = progressions.synchronized {
+# MAGIC     val deadline = System.currentTimeMillis + timeoutMs
+# MAGIC     var timedOut = false
+# MAGIC     while (!timedOut && !isReady(names, progressionCount)) {
+# MAGIC       val remaining = deadline - System.currentTimeMillis
+# MAGIC       if (timeoutMs > 0 && remaining <= 0) timedOut = true
+# MAGIC       else progressions.wait(if (timeoutMs > 0) remaining else 0)
+# MAGIC     }
+# MAGIC     !timedOut
+# MAGIC   }
+# MAGIC }
+# MAGIC 
+# MAGIC // %run executes this cell again, so listeners of an earlier run are removed
+# MAGIC // instead of being left to count next to the new one
+# MAGIC spark.streams.listListeners()
+# MAGIC   .filter(_.getClass.getName.endsWith("StreamReadinessListener"))
+# MAGIC   .foreach(spark.streams.removeListener)
+# MAGIC val streamReadinessListener = new StreamReadinessListener()
+# MAGIC spark.streams.addListener(streamReadinessListener)
+# MAGIC 
+# MAGIC def untilStreamsAreReady(names:Seq[String], progressions:Int = 3, timeoutMs:Long = 0):Boolean = {
+# MAGIC   val ready = streamReadinessListener.waitFor(names, progressions, timeoutMs)
+# MAGIC   if (ready) names.foreach(name => println("The stream %s is active and ready.".format(name)))
+# MAGIC   else println("Timed out waiting for the streams %s.".format(names.mkString(", ")))
+# MAGIC   ready
+# MAGIC }
+# MAGIC 
+# MAGIC def untilStreamIsReady(name:String, progressions:Int = 3):Unit = {
+# MAGIC   untilStreamsAreReady(Seq(name), progressions)
 # MAGIC }
 # MAGIC 
 # MAGIC displayHTML("Defining user-facing utility methods...")